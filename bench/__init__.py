@@ -0,0 +1,7 @@
+'''
+Benchmarks for swiftagent.
+
+Run these from the top of the source tree, like::
+
+    python -m bench.tempurl
+'''
@@ -0,0 +1,266 @@
+'''
+Benchmark swift-agent's throughput and latency against fake servers.
+
+A swift-agent server is started on a temporary socket, pointing at local
+FakeServers standing in for Keystone and Swift. Concurrent clients then
+drive ``auth``, ``reauth`` and ``info`` requests, with cold and warm
+caches, and p50/p99 latencies and requests per second are reported.
+
+Save results with ``--output`` and compare runs with ``--compare``::
+
+    python -m bench.agent --output before.json
+    python -m bench.agent --compare before.json
+'''
+from __future__ import print_function
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from bench import fakes
+from swiftagent.agent import client
+
+
+AUTH_PATHS = {
+    'v1': '/auth/v1.0',
+    'v2': '/v2.0/tokens',
+    'v3': '/v3/auth/tokens',
+}
+AUTH_OPTIONS = {
+    'v1': {},
+    'v2': {'tenant_name': 'bench'},
+    'v3': {'domain_name': 'Default'},
+}
+
+
+def write_config(path, auth_url, versions, workers):
+    '''Write a config with an auth section per version per worker.
+
+    Every worker gets its own auth configs, each with its own username so
+    they don't share tokens; purging one worker's credentials doesn't
+    affect another's. Passwords are in the config (and allowed by
+    ``[insecure]``) so no unlocking is needed.
+
+    :returns: the auth names, as a dict of version to a list by worker
+    '''
+    names = {v: ['bench-%s-%d' % (v, i) for i in range(workers)]
+             for v in versions}
+    with open(path, 'w') as fp:
+        fp.write('[insecure]\nauth = %s\n\n' % ' '.join(
+            n for v in versions for n in names[v]))
+        for version in versions:
+            for worker, name in enumerate(names[version]):
+                options = dict(AUTH_OPTIONS[version],
+                               use='swiftagent.auth:%s' % version,
+                               auth_url=auth_url + AUTH_PATHS[version],
+                               username='%s-%d' % (fakes.USERNAME, worker),
+                               password=fakes.PASSWORD)
+                fp.write('[auth:%s]\n' % name)
+                for key, value in sorted(options.items()):
+                    fp.write('%s = %s\n' % (key, value))
+                fp.write('\n')
+    return names
+
+
+def start_agent(tmp_dir, conf_path):
+    '''Start a swift-agent server in a subprocess.
+
+    :returns: a (process, socket address) pair
+    '''
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sock = os.path.join(tmp_dir, 'socket')
+    env = dict(os.environ, HOME=tmp_dir, SWIFT_AGENT_CONF=conf_path,
+               XDG_CACHE_HOME=os.path.join(tmp_dir, 'cache'))
+    env['PYTHONPATH'] = os.pathsep.join(
+        [root] + [p for p in [env.get('PYTHONPATH')] if p])
+    with open(os.devnull, 'w') as devnull:
+        proc = subprocess.Popen(
+            [sys.executable, os.path.join(root, 'bin', 'swift-agent'),
+             '--daemon', sock],
+            cwd=tmp_dir, env=env, stdout=devnull, stderr=devnull)
+    deadline = time.time() + 10
+    while not os.path.exists(sock):
+        if proc.poll() is not None or time.time() > deadline:
+            raise RuntimeError('swift-agent failed to start')
+        time.sleep(0.01)
+    return proc, sock
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[int(round(fraction * (len(sorted_values) - 1)))]
+
+
+def run_phase(workers, requests, operation):
+    '''Run an operation from several threads at once.
+
+    :param workers: the number of concurrent threads
+    :param requests: the number of operations per thread
+    :param operation: a function taking a worker index and returning the
+                      number of seconds to count for that operation
+    :returns: a dict of statistics
+    '''
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def work(index):
+        for dummy in range(requests):
+            try:
+                elapsed = operation(index)
+            except Exception as exc:  # pylint: disable=broad-except
+                with lock:
+                    errors.append(repr(exc))
+            else:
+                with lock:
+                    latencies.append(elapsed)
+
+    threads = [threading.Thread(target=work, args=(i, ))
+               for i in range(workers)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.time() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies) + len(errors),
+        'errors': len(errors),
+        'sample_errors': sorted(set(errors))[:3],
+        'p50': percentile(latencies, 0.5),
+        'p99': percentile(latencies, 0.99),
+        'mean': sum(latencies) / len(latencies) if latencies else None,
+        'rps': len(latencies) / wall if wall else None,
+    }
+
+
+def benchmark(sock, names, info_url, args):
+    '''Run every phase.
+
+    :returns: a dict mapping phase names to statistics
+    '''
+    def timed(cmd, *cmd_args):
+        with client.SwiftAgentClient(sock, framed=args.framed) as agent_client:
+            start = time.time()
+            getattr(agent_client, cmd)(*cmd_args)
+            return time.time() - start
+
+    def cold_auth(auth_names):
+        def operation(index):
+            with client.SwiftAgentClient(sock) as agent_client:
+                agent_client.purge(auth_names[index])
+            return timed('auth', auth_names[index])
+        return operation
+
+    results = {}
+    for version in args.versions:
+        auth_names = names[version]
+        results['auth/%s/cold' % version] = run_phase(
+            args.workers, args.requests, cold_auth(auth_names))
+        results['auth/%s/warm' % version] = run_phase(
+            args.workers, args.requests,
+            lambda i, auth_names=auth_names: timed('auth', auth_names[i]))
+        results['reauth/%s' % version] = run_phase(
+            args.workers, args.requests,
+            lambda i, auth_names=auth_names: timed('reauth', auth_names[i]))
+    results['info/cold'] = run_phase(
+        args.workers, args.requests, lambda i: timed('reinfo', info_url))
+    results['info/warm'] = run_phase(
+        args.workers, args.requests, lambda i: timed('info', info_url))
+    return results
+
+
+def print_results(results, baseline=None):
+    def ms(value):
+        return '%9s' % '-' if value is None else '%7.2fms' % (value * 1000)
+
+    print('%-18s %8s %6s %9s %9s %9s' % (
+        'phase', 'requests', 'errors', 'p50', 'p99', 'rps'))
+    for phase in sorted(results):
+        result = results[phase]
+        line = '%-18s %8d %6d %s %s %9.1f' % (
+            phase, result['requests'], result['errors'], ms(result['p50']),
+            ms(result['p99']), result['rps'] or 0)
+        old = (baseline or {}).get(phase)
+        if old and old.get('p50') and result['p50']:
+            line += '   p50 x%.2f, rps x%.2f' % (
+                result['p50'] / old['p50'],
+                (result['rps'] or 0) / (old['rps'] or 1))
+        print(line)
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split(
+        '\n')[0])
+    parser.add_argument('--workers', type=int, default=8,
+                        help='the number of concurrent clients')
+    parser.add_argument('--requests', type=int, default=50,
+                        help='the number of requests per client per phase')
+    parser.add_argument('--versions', nargs='+', default=['v1', 'v2', 'v3'],
+                        choices=sorted(AUTH_PATHS),
+                        help='the auth versions to benchmark')
+    parser.add_argument('--auth-latency', type=float, default=0.02,
+                        help='seconds the fake auth server takes to respond')
+    parser.add_argument('--swift-latency', type=float, default=0.005,
+                        help='seconds the fake Swift takes to respond')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='the fraction of auth requests to fail')
+    parser.add_argument('--catalog-size', type=int, default=50,
+                        help='the number of services in v2/v3 catalogs')
+    parser.add_argument('--framed', action='store_true',
+                        help='negotiate the framed protocol on every '
+                             'connection')
+    parser.add_argument('--output', metavar='FILE',
+                        help='save the results as JSON')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare against results saved with --output')
+    args = parser.parse_args(args[1:])
+
+    swift = fakes.FakeServer(latency=args.swift_latency).start()
+    keystone = fakes.FakeServer(
+        latency=args.auth_latency, error_rate=args.error_rate,
+        catalog_size=args.catalog_size,
+        storage_url=swift.storage_url).start()
+    tmp_dir = tempfile.mkdtemp()
+    proc = None
+    try:
+        conf_path = os.path.join(tmp_dir, 'swiftagent.conf')
+        names = write_config(conf_path, keystone.url, args.versions,
+                             args.workers)
+        proc, sock = start_agent(tmp_dir, conf_path)
+        results = benchmark(sock, names, swift.url, args)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+        shutil.rmtree(tmp_dir)
+        keystone.stop()
+        swift.stop()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)['results']
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump({
+                'timestamp': time.time(),
+                'python': platform.python_version(),
+                'options': vars(args),
+                'results': results,
+                'auth_responses': keystone.responses,
+            }, fp, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
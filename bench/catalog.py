@@ -0,0 +1,94 @@
+'''
+Benchmark service catalog parsing and endpoint selection.
+'''
+from __future__ import print_function
+import argparse
+import sys
+import time
+
+from swiftagent.auth import catalog
+
+
+def make_v3_catalog(services, regions):
+    '''Build a synthetic v3 catalog.
+
+    :param services: the number of services of each of a handful of types
+    :param regions: the number of regions each service has endpoints in
+    '''
+    return [{
+        'type': svc_type,
+        'name': '%s-%d' % (svc_type, i),
+        'endpoints': [{
+            'region': 'region-%d' % r,
+            'interface': interface,
+            'url': 'https://%s-%d.r%d.example.com/%s' % (
+                svc_type, i, r, interface),
+        } for r in range(regions)
+            for interface in ('public', 'internal', 'admin')],
+    } for svc_type in ('compute', 'network', 'image', 'object-store')
+        for i in range(services)]
+
+
+def linear_select(raw, name, region, interface):
+    '''Select an endpoint the way the authenticators used to.'''
+    services = [s for s in raw if s.get('type') == 'object-store']
+    services = [s for s in services if s['name'] == name]
+    endpoints = [e for e in services[0]['endpoints']
+                 if e['region'] == region and e['interface'] == interface]
+    return endpoints[0]['url']
+
+
+def timed(func, *args):
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+
+def main(args):
+    '''Compare linear catalog scans against the indexed catalog.'''
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--services', type=int, default=250,
+                        help='the number of services of each type')
+    parser.add_argument('--regions', type=int, default=4,
+                        help='the number of regions per service')
+    parser.add_argument('--lookups', type=int, default=1000,
+                        help='the number of endpoint selections to make')
+    args = parser.parse_args(args[1:])
+
+    raw = make_v3_catalog(args.services, args.regions)
+    print('%d services, %d endpoints' % (
+        len(raw), sum(len(s['endpoints']) for s in raw)))
+    queries = [('object-store-%d' % (i % args.services),
+                'region-%d' % (i % args.regions), 'internal')
+               for i in range(args.lookups)]
+
+    def linear():
+        for query in queries:
+            linear_select(raw, *query)
+
+    def indexed():
+        cat = catalog.ServiceCatalog.from_v3(raw)
+        for name, region, interface in queries:
+            cat.select(None, 'object-store', name, region, interface)
+
+    parse = timed(catalog.ServiceCatalog.from_v3, raw)
+    print('parse (group by type):  %8.2f ms' % (parse * 1000))
+    cat = catalog.ServiceCatalog.from_v3(raw)
+    print('first lookup (index):   %8.2f ms' % (1000 * timed(
+        cat.select, None, 'object-store', 'object-store-0', 'region-0',
+        None)))
+
+    def warm():
+        for name, region, interface in queries:
+            cat.select(None, 'object-store', name, region, interface)
+
+    for label, func in (('linear', linear), ('indexed', indexed),
+                        ('warm', warm)):
+        elapsed = timed(func)
+        print('%-8s %d lookups:  %8.2f ms (%.1f us/lookup)' % (
+            label, args.lookups, elapsed * 1000,
+            elapsed * 1e6 / args.lookups))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,64 @@
+'''
+Benchmark loading a large config, with and without a cached snapshot.
+'''
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from swiftagent import config
+
+
+def write_config(path, sections):
+    '''Write a config with many auth sections.'''
+    with open(path, 'w') as fp:
+        fp.write('[DEFAULT]\nverify = true\n\n')
+        for i in range(sections):
+            fp.write('[auth:cluster-%d]\n'
+                     'use = swiftagent.auth:v3\n'
+                     'auth_url = https://keystone-%d.example.com/v3\n'
+                     'username = user-%d\n'
+                     'project_name = project-%d\n\n' % (i, i, i, i))
+
+
+def timeit(func, iterations):
+    start = time.time()
+    for dummy in range(iterations):
+        func()
+    return (time.time() - start) / iterations
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--sections', type=int, default=500)
+    parser.add_argument('--iterations', type=int, default=100)
+    args = parser.parse_args(args[1:])
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, 'swiftagent.conf')
+        write_config(path, args.sections)
+        config.SNAPSHOT_DIR = os.path.join(tmp_dir, 'cache')
+        paths = [path]
+
+        def parse():
+            snapshot = config.ConfigSnapshot.parse(paths)
+            return snapshot.auths, snapshot.default_auth
+
+        def load():
+            snapshot = config.ConfigSnapshot.load(paths)
+            return snapshot.auths, snapshot.default_auth
+
+        load()  # populate the cache
+        print('%d auth sections' % args.sections)
+        print('parse:    %8.3fms' % (timeit(parse, args.iterations) * 1000))
+        print('snapshot: %8.3fms' % (timeit(load, args.iterations) * 1000))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,237 @@
+'''
+Local stand-ins for Keystone (v1, v2 and v3 auth) and Swift.
+
+A single FakeServer answers every kind of request, so benchmarks can run
+one as the auth server and another as the Swift cluster, each with its
+own latency and error rate::
+
+    swift = FakeServer(latency=0.005).start()
+    keystone = FakeServer(latency=0.05,
+                          storage_url=swift.storage_url).start()
+    ...
+    keystone.stop()
+    swift.stop()
+'''
+from __future__ import print_function
+import json
+import random
+import threading
+import time
+import uuid
+
+from six.moves import BaseHTTPServer
+from six.moves import socketserver
+
+
+ACCOUNT = 'AUTH_bench'
+USERNAME = 'bench'
+PASSWORD = 'secret'
+
+
+def valid_credentials(username, password):
+    '''Check credentials; ``USERNAME-anything`` is accepted, too.'''
+    return password == PASSWORD and username is not None and (
+        username == USERNAME or username.startswith(USERNAME + '-'))
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn,
+                           BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+    def _reply(self, status, headers=None, body=None):
+        fake = self.server.fake
+        if body is not None and not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+            headers = dict(headers or {}, **{
+                'Content-Type': 'application/json'})
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body or b'')))
+        self.end_headers()
+        if body and self.command != 'HEAD':
+            self.wfile.write(body)
+        fake.count(status)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            return json.loads(self.rfile.read(length).decode('utf-8'))
+        except ValueError:
+            return None
+
+    def _handle(self):
+        fake = self.server.fake
+        if fake.latency:
+            time.sleep(fake.latency)
+        if fake.error_rate and random.random() < fake.error_rate:
+            return self._reply(503, body={'error': 'injected failure'})
+        path = self.path.partition('?')[0].rstrip('/')
+        route = fake.ROUTES.get((self.command, path))
+        if route is None and path.startswith('/v1/'):
+            route = '_account'
+        if route is None:
+            return self._reply(404, body={'error': 'not found'})
+        return getattr(self, route)()
+
+    do_GET = do_HEAD = do_POST = _handle
+
+    def _v1_auth(self):
+        fake = self.server.fake
+        if not valid_credentials(self.headers.get('X-Auth-User'),
+                                 self.headers.get('X-Auth-Key')):
+            return self._reply(401)
+        return self._reply(200, {
+            'X-Auth-Token': fake.issue_token(),
+            'X-Storage-Url': fake.storage_url,
+        })
+
+    def _v2_auth(self):
+        fake = self.server.fake
+        req = (self._read_json() or {}).get('auth', {})
+        creds = req.get('passwordCredentials', {})
+        if not valid_credentials(creds.get('username'),
+                                 creds.get('password')):
+            return self._reply(401, body={'error': 'unauthorized'})
+        return self._reply(200, body={'access': {
+            'token': {'id': fake.issue_token(), 'expires': time.strftime(
+                '%Y-%m-%dT%H:%M:%SZ', time.gmtime(fake.token_expiry()))},
+            'serviceCatalog': fake.catalog(2),
+        }})
+
+    def _v3_auth(self):
+        fake = self.server.fake
+        user = (self._read_json() or {}).get('auth', {}).get(
+            'identity', {}).get('password', {}).get('user', {})
+        if not valid_credentials(user.get('name'), user.get('password')):
+            return self._reply(401, body={'error': 'unauthorized'})
+        return self._reply(201, {'X-Subject-Token': fake.issue_token()}, {
+            'token': {
+                'expires_at': time.strftime(
+                    '%Y-%m-%dT%H:%M:%S.000000Z',
+                    time.gmtime(fake.token_expiry())),
+                'catalog': fake.catalog(3),
+            }})
+
+    def _info(self):
+        return self._reply(200, body=self.server.fake.info)
+
+    def _account(self):
+        if not self.server.fake.check_token(self.headers.get('X-Auth-Token')):
+            return self._reply(401)
+        return self._reply(204, {
+            'X-Account-Container-Count': '0',
+            'X-Account-Object-Count': '0',
+            'X-Account-Bytes-Used': '0',
+            'X-Timestamp': '%.5f' % time.time(),
+        })
+
+
+class FakeServer(object):
+    '''A fake auth server and Swift cluster, listening on localhost.
+
+    :param latency: seconds to wait before answering each request
+    :param error_rate: the fraction of requests to fail with a 503
+    :param catalog_size: the number of services in v2/v3 catalogs; all but
+                         one are decoys
+    :param token_ttl: seconds until issued tokens expire
+    :param storage_url: the storage URL to issue, by default this server's
+                        own account
+    '''
+    ROUTES = {
+        ('GET', '/auth/v1.0'): '_v1_auth',
+        ('POST', '/v2.0/tokens'): '_v2_auth',
+        ('POST', '/v3/auth/tokens'): '_v3_auth',
+        ('GET', '/info'): '_info',
+    }
+
+    def __init__(self, latency=0, error_rate=0, catalog_size=10,
+                 token_ttl=3600, storage_url=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.catalog_size = catalog_size
+        self.token_ttl = token_ttl
+        self._storage_url = storage_url
+        # Regions in which the real object-store has endpoints
+        self.regions = ['RegionOne']
+        self.responses = {}
+        self._lock = threading.Lock()
+        self._httpd = None
+        self.info = {
+            'swift': {'version': 'fake', 'max_file_size': 5368709122},
+            'tempurl': {'methods': ['GET', 'HEAD', 'PUT'],
+                        'allowed_digests': ['sha256', 'sha512']},
+        }
+
+    @property
+    def url(self):
+        '''The base URL of the server.'''
+        host, port = self._httpd.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    @property
+    def storage_url(self):
+        '''The storage URL issued with tokens.'''
+        return self._storage_url or '%s/v1/%s' % (self.url, ACCOUNT)
+
+    def start(self):
+        '''Start serving in a background thread.'''
+        self._httpd = _ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._httpd.fake = self
+        thread = threading.Thread(target=self._httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        '''Stop serving.'''
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def count(self, status):
+        '''Count a response by status.'''
+        with self._lock:
+            self.responses[status] = self.responses.get(status, 0) + 1
+
+    @staticmethod
+    def issue_token():
+        return 'tk' + uuid.uuid4().hex
+
+    @staticmethod
+    def check_token(token):
+        # When acting as the Swift cluster, tokens come from another
+        # FakeServer, so accept anything that looks like one of ours
+        return bool(token) and token.startswith('tk')
+
+    def token_expiry(self):
+        return time.time() + self.token_ttl
+
+    def catalog(self, version):
+        '''Build a catalog with one real object-store among decoys.'''
+        services = [('object-store', 'swift', self.storage_url,
+                     self.regions)] + [
+            (('compute', 'image', 'network', 'object-store')[i % 4],
+             'decoy-%d' % i, 'http://decoy-%d.invalid/' % i, ['RegionOne'])
+            for i in range(1, self.catalog_size)]
+        catalog = []
+        for svc_type, name, url, regions in services:
+            if version == 2:
+                endpoints = [{'region': region, 'publicURL': url,
+                              'internalURL': url, 'adminURL': url}
+                             for region in regions]
+            else:
+                endpoints = [{'region': region, 'interface': iface,
+                              'url': url}
+                             for region in regions
+                             for iface in ('public', 'internal', 'admin')]
+            catalog.append({'type': svc_type, 'name': name,
+                            'endpoints': endpoints})
+        return catalog
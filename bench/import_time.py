@@ -0,0 +1,91 @@
+'''
+Benchmark how long the command-line tools take to import, and check that
+the swift-agent fast path doesn't import requests.
+
+Exits non-zero if any module imports a forbidden module, or takes more
+than ``--max-overhead`` seconds longer to import than a bare interpreter
+takes to start. Run it as a regression check with::
+
+    python -m bench.import_time
+'''
+from __future__ import print_function
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Modules each entry point should be importable without
+FORBIDDEN = ('requests', 'swiftagent.auth.v1', 'swiftagent.auth.v2',
+             'swiftagent.auth.v3')
+
+MODULES = ('swiftagent.cli.auth', 'swiftagent.cli.info',
+           'swiftagent.cli.list', 'swiftagent.agent.client')
+
+CHECK_SCRIPT = '''
+import json, sys
+import %s
+print(json.dumps(sorted(m for m in %r if m in sys.modules)))
+'''
+
+
+def best_time(argv, runs, env):
+    '''Get the fastest wall-clock time to run a command.'''
+    best = None
+    for dummy in range(runs):
+        start = time.time()
+        subprocess.check_output(argv, env=env)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split(
+        '\n')[0])
+    parser.add_argument('--runs', type=int, default=10,
+                        help='runs per module; the fastest is reported')
+    parser.add_argument('--max-overhead', type=float, default=0.25,
+                        help='the most time, in seconds, any module may add '
+                             'to interpreter startup')
+    parser.add_argument('--json', action='store_true',
+                        help='print results as JSON')
+    args = parser.parse_args(args[1:])
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [root] + [p for p in [env.get('PYTHONPATH')] if p])
+
+    baseline = best_time([sys.executable, '-c', 'pass'], args.runs, env)
+    results = {'baseline': baseline, 'modules': {}}
+    failed = False
+    for module in MODULES:
+        imported = json.loads(subprocess.check_output(
+            [sys.executable, '-c', CHECK_SCRIPT % (module, FORBIDDEN)],
+            env=env).decode('utf-8'))
+        elapsed = best_time(
+            [sys.executable, '-c', 'import %s' % module], args.runs, env)
+        overhead = elapsed - baseline
+        ok = not imported and overhead <= args.max_overhead
+        failed = failed or not ok
+        results['modules'][module] = {
+            'elapsed': elapsed, 'overhead': overhead,
+            'forbidden_imports': imported, 'ok': ok}
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        print('%-26s %8.1fms' % ('(interpreter)', baseline * 1000))
+        for module in MODULES:
+            result = results['modules'][module]
+            print('%-26s %8.1fms  +%.1fms%s' % (
+                module, result['elapsed'] * 1000, result['overhead'] * 1000,
+                '' if result['ok'] else '  FAIL %s' % (', '.join(
+                    result['forbidden_imports']) or 'too slow')))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
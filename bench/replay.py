@@ -0,0 +1,293 @@
+'''
+Replay recorded swift-agent traffic against a fresh agent and fake servers.
+
+Record real traffic with ``swift-agent --record FILE``, then replay it::
+
+    python -m bench.replay FILE              # with the recorded timing
+    python -m bench.replay FILE --speed 10   # ten times faster
+    python -m bench.replay FILE --speed 0    # as fast as possible
+
+Every recorded auth config is pointed at a fake Keystone (as its own
+user, with every recorded region in its catalog), and every recorded
+cluster URL at its own fake Swift, so the agent's caches behave as they
+did when recording. Latency distributions are reported for each command.
+'''
+from __future__ import print_function
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from six.moves import queue
+
+from bench import agent as bench_agent
+from bench import fakes
+from swiftagent.agent import client
+from swiftagent import config
+
+# Commands that would change the agent (or the protocol in use) rather
+# than exercise it. Requests made after "hello" are recorded like any
+# others, so framed connections are replayed with the line protocol.
+SKIPPED_COMMANDS = ('handoff', 'hello', 'profile')
+
+
+def load_recording(path):
+    '''Load a recording, grouped into connections.
+
+    Connection numbers restart when the agent does, so a decrease starts
+    a new session.
+
+    :returns: a list of connections, each a list of ``(time, data)``
+              pairs, in order of their first request
+    '''
+    connections = {}
+    session = 0
+    last_conn = 0
+    with open(path) as fp:
+        for line in fp:
+            entry = json.loads(line)
+            if entry['conn'] < last_conn:
+                session += 1
+            last_conn = entry['conn']
+            connections.setdefault((session, entry['conn']), []).append(
+                (entry['time'], entry['data']))
+    return sorted(connections.values(), key=lambda c: c[0][0])
+
+
+class Rewriter(object):
+    '''Rewrite recorded requests to use fake servers.
+
+    :param version: the auth version to use for every auth config
+    :param catalog_size: the number of services in fake catalogs
+    :param auth_latency: seconds the fake Keystone takes to respond
+    :param swift_latency: seconds each fake Swift takes to respond
+    '''
+    def __init__(self, version, catalog_size, auth_latency, swift_latency):
+        self.version = version
+        self.swift_latency = swift_latency
+        self.swift = fakes.FakeServer(latency=swift_latency).start()
+        self.keystone = fakes.FakeServer(
+            latency=auth_latency, catalog_size=catalog_size,
+            storage_url=self.swift.storage_url).start()
+        self.clusters = {}
+        self.auths = set()
+
+    def _cluster_url(self, url):
+        try:
+            key = config.scheme_netloc_only(url)
+        except ValueError:
+            return url
+        if key not in self.clusters:
+            self.clusters[key] = fakes.FakeServer(
+                latency=self.swift_latency).start()
+        return self.clusters[key].url + url[len(key):]
+
+    def _add_auth(self, auth_config):
+        # name@region[/interface] selects an endpoint from name's catalog
+        name, dummy, selection = auth_config.partition('@')
+        self.auths.add(name)
+        region = selection.partition('/')[0]
+        if region and region not in self.keystone.regions:
+            self.keystone.regions.append(region)
+
+    def rewrite(self, data):
+        '''Rewrite a request, or return None to skip it.'''
+        cmd, dummy, rest = data.partition(' ')
+        if cmd in SKIPPED_COMMANDS:
+            return None
+        args = rest.split(' ') if rest else []
+        if cmd == 'unlock' and args:
+            self._add_auth(args[0])
+            return 'unlock %s %s' % (args[0], fakes.PASSWORD)
+        if cmd in ('auth', 'reauth', 'peek') and args:
+            self._add_auth(args[0])
+        args = [self._cluster_url(arg) if '://' in arg else arg
+                for arg in args]
+        return ' '.join([cmd] + args)
+
+    def write_config(self, path):
+        '''Write a config with a section for every auth config seen.'''
+        with open(path, 'w') as fp:
+            fp.write('[insecure]\nauth = %s\n\n' % ' '.join(
+                sorted(self.auths)))
+            for i, name in enumerate(sorted(self.auths)):
+                # Separate users, so configs don't share tokens
+                options = dict(
+                    bench_agent.AUTH_OPTIONS[self.version],
+                    use='swiftagent.auth:%s' % self.version,
+                    auth_url=self.keystone.url +
+                    bench_agent.AUTH_PATHS[self.version],
+                    username='%s-%d' % (fakes.USERNAME, i),
+                    password=fakes.PASSWORD)
+                if self.version != 'v1':
+                    # Among the decoys, only the name picks out the real
+                    # object-store once a region is given
+                    options['service_name'] = 'swift'
+                fp.write('[auth:%s]\n' % name)
+                for key, value in sorted(options.items()):
+                    fp.write('%s = %s\n' % (key, value))
+                fp.write('\n')
+
+    def stop(self):
+        '''Stop every fake server.'''
+        for server in [self.keystone, self.swift] + list(
+                self.clusters.values()):
+            server.stop()
+
+
+def replay(sock, connections, speed, workers):
+    '''Replay connections against an agent.
+
+    :param speed: how many times faster than recorded to replay, or 0 to
+                  replay as fast as possible
+    :returns: a dict with ``latencies`` (a dict of command to a list of
+              ``(seconds, ok)`` pairs) and ``lag`` (a list of how late each
+              connection started, in seconds)
+    '''
+    latencies = {}
+    lag = []
+    lock = threading.Lock()
+    work = queue.Queue()
+    for connection in connections:
+        work.put(connection)
+    t0 = connections[0][0][0] if connections else 0
+    start = time.time()
+
+    def due(recorded):
+        return start + (recorded - t0) / speed
+
+    def run():
+        while True:
+            try:
+                connection = work.get_nowait()
+            except queue.Empty:
+                return
+            if speed:
+                delay = due(connection[0][0]) - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                with lock:
+                    lag.append(max(0, -delay))
+            with client.SwiftAgentClient(sock) as agent_client:
+                for recorded, data in connection:
+                    if speed:
+                        delay = due(recorded) - time.time()
+                        if delay > 0:
+                            time.sleep(delay)
+                    before = time.time()
+                    resp = agent_client.send_command(data)
+                    elapsed = time.time() - before
+                    cmd = data.partition(' ')[0]
+                    with lock:
+                        latencies.setdefault(cmd, []).append(
+                            (elapsed, not resp.startswith('ERROR')))
+
+    threads = [threading.Thread(target=run) for dummy in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {'latencies': latencies, 'lag': lag,
+            'elapsed': time.time() - start}
+
+
+def summarize(results):
+    '''Summarize latencies per command.'''
+    summary = {}
+    everything = []
+    for cmd, samples in results['latencies'].items():
+        everything.extend(samples)
+        summary[cmd] = _distribution(samples)
+    summary['(all)'] = _distribution(everything)
+    if results['lag']:
+        summary['(start lag)'] = _distribution(
+            [(value, True) for value in results['lag']])
+    return summary
+
+
+def _distribution(samples):
+    values = sorted(value for value, dummy in samples)
+    return {
+        'count': len(values),
+        'errors': sum(1 for dummy, ok in samples if not ok),
+        'p50': bench_agent.percentile(values, 0.5),
+        'p90': bench_agent.percentile(values, 0.9),
+        'p99': bench_agent.percentile(values, 0.99),
+        'max': values[-1] if values else None,
+    }
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split(
+        '\n')[0])
+    parser.add_argument('recording',
+                        help='a file written by swift-agent --record')
+    parser.add_argument('--speed', type=float, default=1,
+                        help='how many times faster than recorded to '
+                             'replay; 0 replays as fast as possible')
+    parser.add_argument('--workers', type=int, default=16,
+                        help='the most connections to replay at once')
+    parser.add_argument('--auth-version', default='v3',
+                        choices=sorted(bench_agent.AUTH_PATHS),
+                        help='the auth version to use for every auth config')
+    parser.add_argument('--auth-latency', type=float, default=0.02,
+                        help='seconds the fake auth server takes to respond')
+    parser.add_argument('--swift-latency', type=float, default=0.005,
+                        help='seconds each fake Swift takes to respond')
+    parser.add_argument('--catalog-size', type=int, default=50,
+                        help='the number of services in fake catalogs')
+    parser.add_argument('--output', metavar='FILE',
+                        help='save the results as JSON')
+    args = parser.parse_args(args[1:])
+
+    rewriter = Rewriter(args.auth_version, args.catalog_size,
+                        args.auth_latency, args.swift_latency)
+    tmp_dir = tempfile.mkdtemp()
+    proc = None
+    try:
+        connections = []
+        for connection in load_recording(args.recording):
+            connection = [(t, rewriter.rewrite(data))
+                          for t, data in connection]
+            connection = [(t, data) for t, data in connection if data]
+            if connection:
+                connections.append(connection)
+        conf_path = os.path.join(tmp_dir, 'swiftagent.conf')
+        rewriter.write_config(conf_path)
+        proc, sock = bench_agent.start_agent(tmp_dir, conf_path)
+        results = replay(sock, connections, args.speed, args.workers)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+        shutil.rmtree(tmp_dir)
+        rewriter.stop()
+
+    summary = summarize(results)
+
+    def ms(value):
+        return '%9s' % '-' if value is None else '%7.2fms' % (value * 1000)
+
+    print('Replayed %d connections in %.1fs' % (
+        len(connections), results['elapsed']))
+    print('%-14s %7s %6s %9s %9s %9s %9s' % (
+        'command', 'count', 'errors', 'p50', 'p90', 'p99', 'max'))
+    for cmd in sorted(summary):
+        dist = summary[cmd]
+        print('%-14s %7d %6d %s %s %s %s' % (
+            cmd, dist['count'], dist['errors'], ms(dist['p50']),
+            ms(dist['p90']), ms(dist['p99']), ms(dist['max'])))
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump({'timestamp': time.time(), 'options': vars(args),
+                       'connections': len(connections),
+                       'elapsed': results['elapsed'], 'summary': summary},
+                      fp, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
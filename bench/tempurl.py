@@ -0,0 +1,50 @@
+'''
+Benchmark TempURL signing throughput.
+'''
+from __future__ import print_function
+import argparse
+import sys
+import time
+
+from swiftagent.models import tempurl
+
+
+def run(digest, count, naive=False):
+    '''Sign ``count`` paths and return the signatures per second.
+
+    :param digest: the digest to use
+    :param count: the number of paths to sign
+    :param naive: if True, sign each path individually rather than
+                  as a batch
+    '''
+    signer = tempurl.TempUrlSigner('benchmark-key', digest)
+    paths = ['/v1/AUTH_bench/container/object-%08d' % i
+             for i in range(count)]
+    expires = int(time.time()) + 3600
+
+    start = time.time()
+    if naive:
+        for path in paths:
+            signer.sign(path, expires)
+    else:
+        for dummy in signer.sign_many(paths, expires):
+            pass
+    return count / (time.time() - start)
+
+
+def main(args):
+    '''Measure TempURL signatures per second for each digest.'''
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--count', type=int, default=200000,
+                        help='the number of paths to sign per run')
+    args = parser.parse_args(args[1:])
+
+    for digest in tempurl.PREFERRED_DIGESTS:
+        for naive in (True, False):
+            rate = run(digest, args.count, naive)
+            print('%-8s %-6s %12.0f sigs/s' % (
+                digest, 'single' if naive else 'batch', rate))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
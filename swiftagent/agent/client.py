@@ -27,19 +27,39 @@ def raise_on_error(result, source):
     :param source: the source that should be used when raising AuthErrors
     :raises: Unauthorized,
              Forbidden,
-             PasswordRequired, or
+             PasswordRequired,
+             CircuitOpen, or
              SwiftAgentClientError
     '''
     if not result.startswith('ERROR '):
         return
     result = result[6:]
-    if result.startswith('Unauthorized('):
+    _raise_error(result.partition('(')[0], result, source)
+
+
+def raise_on_error_frame(frame, source):
+    '''Check a swift-agent response frame for errors.
+
+    :param frame: the response frame from swift-agent
+    :param source: the source that should be used when raising AuthErrors
+    :raises: any of the possibilities from raise_on_error
+    '''
+    error = frame.get('error')
+    if error is None:
+        return
+    _raise_error(error.get('type'), error.get('repr'), source)
+
+
+def _raise_error(error_type, description, source):
+    if error_type == 'Unauthorized':
         raise base.Unauthorized(source)
-    if result.startswith('Forbidden('):
+    if error_type == 'Forbidden':
         raise base.Forbidden(source)
-    if result.startswith('PasswordRequired('):
+    if error_type == 'PasswordRequired':
         raise base.PasswordRequired(source)
-    raise SwiftAgentClientError(result)
+    if error_type == 'CircuitOpen':
+        raise base.CircuitOpen(source, description)
+    raise SwiftAgentClientError(description)
 
 
 class SwiftAgentClient(comm.LineOrientedUnixClient):
@@ -49,14 +69,46 @@ class SwiftAgentClient(comm.LineOrientedUnixClient):
     getting session details and unlocking the authenticator when that fails,
     for example; the connection will almost certainly time out while waiting
     for user input.
+
+    :param socket_address: the address to which the client should connect
+    :param timeout: the most seconds to wait for the server, or None to
+                    wait indefinitely
+    :param framed: whether to try the framed protocol, falling back to the
+                   line protocol for older servers. Negotiating costs a
+                   round trip, so this is best for connections making
+                   several requests, or getting large responses.
     '''
-    def _parse_auth_response(self, result):
+    def __init__(self, socket_address, timeout=None, framed=False):
+        super(SwiftAgentClient, self).__init__(socket_address, timeout)
+        self.framed = framed
+
+    def request(self, cmd, data='', parse=None):
+        '''Send a command, using the framed protocol if possible.
+
+        :param cmd: the command to send
+        :param data: the command's argument
+        :param parse: a function to convert a line protocol response into
+                      the structured result a framed response would have
+        :returns: the command's result
+        :raises: any of the possibilities from raise_on_error
+        '''
+        if self.framed:
+            self.framed = False  # Only negotiate once
+            self.negotiate()
+        if self.codec is not None:
+            frame = self.call(cmd, data)
+            raise_on_error_frame(frame, self)
+            return frame['result']
+        result = self.send_command('%s %s' % (cmd, data))
         raise_on_error(result, self)
+        return parse(result) if parse else result
+
+    def _parse_auth_response(self, result):
         if not result.startswith('auth '):
             raise base.AuthError(self, 'Unexpected response: %s' % result)
         url, token, expiry = result[5:].split(' ', 2)
         expiry = None if expiry == 'None' else float(expiry)
-        return url, token, expiry
+        return {'storage_url': url, 'token': token, 'expires': expiry}
 
     def auth(self, auth_name):
         '''Fetch the details of an authenticated session from swift-agent.
@@ -65,8 +117,8 @@ class SwiftAgentClient(comm.LineOrientedUnixClient):
         :returns: a tuple of (storage_url, auth_token)
         :raises: any of the possibilities from raise_on_error
         '''
-        return self._parse_auth_response(
-            self.send_command('auth %s' % auth_name))
+        result = self.request('auth', auth_name, self._parse_auth_response)
+        return result['storage_url'], result['token'], result['expires']
 
     def reauth(self, auth_name):
         '''Fetch the details of a freshly auth'ed session from swift-agent.
@@ -75,8 +127,8 @@ class SwiftAgentClient(comm.LineOrientedUnixClient):
         :returns: a tuple of (storage_url, auth_token)
         :raises: any of the possibilities from raise_on_error
         '''
-        return self._parse_auth_response(
-            self.send_command('reauth %s' % auth_name))
+        result = self.request('reauth', auth_name, self._parse_auth_response)
+        return result['storage_url'], result['token'], result['expires']
 
     def unlock(self, auth_name, password):
         '''Try to unlock an authenticated session.
@@ -86,9 +138,18 @@ class SwiftAgentClient(comm.LineOrientedUnixClient):
         :returns: True if the server acknowledges an unlock, False otherwise
         :raises: any of the possibilities from raise_on_error
         '''
-        result = self.send_command('unlock %s %s' % (auth_name, password))
-        raise_on_error(result, self)
-        return result == 'unlocked'
+        return self.request(
+            'unlock', '%s %s' % (auth_name, password)) == 'unlocked'
+
+    def peek(self, auth_name):
+        '''Check whether swift-agent holds a valid token, without auth'ing.
+
+        :param auth_name: the name of the auth config to check
+        :returns: a dict with ``cached`` and, if a valid token is cached,
+                  ``storage_url`` and ``expires`` keys
+        :raises: any of the possibilities from raise_on_error
+        '''
+        return self.request('peek', auth_name, json.loads)
 
     def purge(self, auth_name):
         '''Purge the details of an authenticated session from swift-agent.
@@ -97,9 +158,7 @@ class SwiftAgentClient(comm.LineOrientedUnixClient):
         :returns: True if the server acknowledges a purge, False otherwise
         :raises: any of the possibilities from raise_on_error
         '''
-        result = self.send_command('purge %s' % auth_name)
-        raise_on_error(result, self)
-        return result == 'purged'
+        return self.request('purge', auth_name) == 'purged'
 
     def info(self, url):
         '''Fetch the capabilities of a Swift server.
@@ -108,9 +167,18 @@ class SwiftAgentClient(comm.LineOrientedUnixClient):
         :returns: a dict containing the result of a /info request
         :raises: any of the possibilities from raise_on_error
         '''
-        result = self.send_command('info %s' % url)
-        raise_on_error(result, self)
-        return json.loads(result)
+        return self.request('info', url, json.loads)
+
+    def infos(self, urls):
+        '''Fetch the capabilities of several Swift servers at once.
+
+        :param urls: the absolute URLs for the servers
+        :returns: a dict mapping each URL to either
+                  ``{"info": ..., "elapsed": ..., "cached": ...}`` or
+                  ``{"error": ...}``
+        :raises: any of the possibilities from raise_on_error
+        '''
+        return self.request('infos', ' '.join(urls), json.loads)
 
     def reinfo(self, url):
         '''Fetch the fresh capabilities of a Swift server.
@@ -119,9 +187,81 @@ class SwiftAgentClient(comm.LineOrientedUnixClient):
         :returns: a dict containing the result of a fresh /info request
         :raises: any of the possibilities from raise_on_error
         '''
-        result = self.send_command('reinfo %s' % url)
+        return self.request('reinfo', url, json.loads)
+
+    def stats(self, fmt='json'):
+        '''Fetch swift-agent's metrics.
+
+        :param fmt: either "json" or "prometheus"
+        :returns: for "json", a dict mapping metric names to their types,
+                  descriptions and values; for "prometheus", a string in
+                  the Prometheus text exposition format
+        :raises: any of the possibilities from raise_on_error
+        '''
+        return self.request('stats', fmt, json.loads)
+
+    def describe(self):
+        '''Find out how swift-agent is serving.
+
+        :returns: a dict with ``mode`` ("single" or "shared") and
+                  ``upstream`` (the socket forwarded to, or "") keys, or
+                  an empty dict if swift-agent doesn't say
+        :raises: any of the possibilities from raise_on_error
+        '''
+        for value in self.stats().get('swiftagent_info', {}).get(
+                'values', []):
+            return value['labels']
+        return {}
+
+    def profile_start(self, mode='sample', interval=None):
+        '''Start profiling swift-agent.
+
+        :param mode: either "cprofile" or "sample"
+        :param interval: for "sample", the number of seconds between samples
+        :raises: any of the possibilities from raise_on_error
+        '''
+        data = 'start %s' % mode
+        if interval is not None:
+            data += ' %s' % interval
+        self.request('profile', data)
+
+    def profile_stop(self, path=None):
+        '''Stop profiling swift-agent and dump the results.
+
+        :param path: the file to create; by default, one is created next
+                     to swift-agent's socket
+        :returns: the path of the dump
+        :raises: any of the possibilities from raise_on_error
+        '''
+        result = self.request(
+            'profile', 'stop %s' % path if path else 'stop')
+        return result[len('profiled '):].rsplit(' ', 1)[0]
+
+    def handoff(self):
+        '''Take over swift-agent's listening socket and cached state.
+
+        swift-agent keeps serving until :meth:`finish_handoff` is called.
+
+        :returns: a (listening socket file descriptor, state) pair
+        :raises: any of the possibilities from raise_on_error
+        '''
+        self.sock.sendall(b'handoff\n')
+        first, fd = comm.recv_fd(self.sock)
+        # The byte sent along with a descriptor isn't part of the response
+        result, self.buf = comm.read_line(
+            self.sock, self.buf + (first if fd is None else b''))
+        raise_on_error(result, self)
+        if fd is None or not result.startswith('handoff '):
+            raise SwiftAgentClientError('Unexpected response: %s' % result)
+        return fd, json.loads(result[len('handoff '):])
+
+    def finish_handoff(self):
+        '''Tell swift-agent to stop, now that its state has been taken over.
+
+        :raises: any of the possibilities from raise_on_error
+        '''
+        result = self.send_command('handoff done')
         raise_on_error(result, self)
-        return json.loads(result)
 
 
 def can_use_swift_agent():
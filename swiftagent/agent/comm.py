@@ -3,13 +3,75 @@ Low-level tools for interacting with Unix Domain Sockets.
 '''
 from __future__ import print_function
 from __future__ import unicode_literals
+import array
+import functools
+import json
 import logging
+import os
 import socket
+import struct
+import threading
+import time
+
+import six
+
+try:
+    import msgpack
+except ImportError:  # optional
+    msgpack = None
 
 
 LOGGER = logging.getLogger(__name__)
 LOGGER.addHandler(logging.NullHandler())
 
+# The first file descriptor passed by systemd socket activation
+SD_LISTEN_FDS_START = 3
+
+# The framed protocol, negotiated with a "hello" command. Each frame is a
+# 4-byte, big-endian length followed by a payload encoded with a codec.
+PROTOCOL_VERSION = 1
+FRAME_HEADER = struct.Struct('!I')
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+RECV_SIZE = 65536
+# Seconds a connection may wait on its peer for any one read or write, and
+# in total, so no client can hold the (single-threaded) server for long
+IDLE_TIMEOUT = 1
+CONNECTION_BUDGET = 10
+# How much of each reply to log
+LOG_PREVIEW = 1024
+
+
+def _json_dumps(obj):
+    return json.dumps(obj).encode('utf-8')
+
+
+def _json_loads(data):
+    return json.loads(data.decode('utf-8'))
+
+
+def _json_result(request_id, result):
+    return b'{"id": ' + _json_dumps(request_id) + b', "result": ' + \
+        result + b'}'
+
+
+# Codecs, as (dumps, loads) pairs
+CODECS = {'json': (_json_dumps, _json_loads)}
+# Functions to wrap an already-encoded result into a response, by codec
+RESULT_WRAPPERS = {'json': _json_result}
+if msgpack is not None:
+    CODECS['msgpack'] = (functools.partial(msgpack.packb, use_bin_type=True),
+                         functools.partial(msgpack.unpackb, raw=False))
+
+    def _msgpack_result(request_id, result):
+        pack = CODECS['msgpack'][0]
+        # A map with two entries
+        return b'\x82' + pack('id') + pack(request_id) + pack('result') + \
+            result
+
+    RESULT_WRAPPERS['msgpack'] = _msgpack_result
+# The codecs available, most preferred first
+CODEC_PREFERENCE = [c for c in ('msgpack', 'json') if c in CODECS]
+
 
 def read_line(sock, buf):
     '''Read a single line from a socket.
@@ -27,6 +89,266 @@ def read_line(sock, buf):
     return line.decode('utf-8'), buf
 
 
+class BudgetedConnection(object):
+    '''A connection that may only spend so long waiting on its peer.
+
+    Time spent handling requests doesn't count, only time spent in
+    ``recv`` and ``sendall``.
+
+    :param conn: the connection socket
+    :param idle_timeout: the most seconds to wait for any one call
+    :param budget: the most seconds to wait for all calls together
+    :raises socket.timeout: from calls once the budget is used up
+    '''
+    def __init__(self, conn, idle_timeout=IDLE_TIMEOUT,
+                 budget=CONNECTION_BUDGET):
+        self.conn = conn
+        self.idle_timeout = idle_timeout
+        self.budget = budget
+
+    def _call(self, func, *args):
+        if self.budget <= 0:
+            raise socket.timeout('Connection used up its time')
+        self.conn.settimeout(min(self.idle_timeout, self.budget))
+        start = time.time()
+        try:
+            return func(*args)
+        finally:
+            self.budget -= time.time() - start
+
+    def recv(self, size):
+        return self._call(self.conn.recv, size)
+
+    def sendall(self, data):
+        return self._call(self.conn.sendall, data)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+def encode_frame(payload):
+    '''Prefix an encoded payload with its length.'''
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def read_frame(sock, buf):
+    '''Read a single frame from a socket.
+
+    :param sock: the socket from which to read
+    :param buf:  any already-buffered bytes from the socket
+    :returns: a tuple of (payload, remaining buffer); the payload is None if
+              the connection closed
+    :raises ValueError: if the frame is larger than MAX_FRAME_SIZE
+    '''
+    chunks = [buf]
+    size = len(buf)
+    while size < FRAME_HEADER.size:
+        chunks.append(sock.recv(RECV_SIZE))
+        if not chunks[-1]:
+            return None, b''
+        size += len(chunks[-1])
+    buf = b''.join(chunks)
+    length = FRAME_HEADER.unpack_from(buf)[0]
+    if length > MAX_FRAME_SIZE:
+        raise ValueError('Frame of %d bytes is too large' % length)
+    end = FRAME_HEADER.size + length
+    chunks = [buf]
+    while size < end:
+        chunks.append(sock.recv(max(RECV_SIZE, end - size)))
+        if not chunks[-1]:
+            return None, b''
+        size += len(chunks[-1])
+    buf = b''.join(chunks)
+    return buf[FRAME_HEADER.size:end], buf[end:]
+
+
+class UnknownCommand(ValueError):
+    '''The server has no handler for a command.'''
+
+
+class Response(object):
+    '''A reply to a command.
+
+    Connections using the line protocol are sent the text; those using the
+    framed protocol are sent the payload, as structured data.
+
+    Encodings are kept, so a Response that is cached and sent again costs
+    no serialization.
+
+    :param payload: the result of the command
+    :param text: the single-line text reply; by default, the payload if
+                 it's a string, or else its JSON
+    :param error: the exception, if the command failed
+    '''
+    def __init__(self, payload=None, text=None, error=None):
+        self.payload = payload
+        self._text = text
+        self.error = error
+        self._line = None
+        self._results = {}
+
+    @classmethod
+    def wrap(cls, result):
+        '''Get a Response for a handler's result, which may be a string.'''
+        if isinstance(result, cls):
+            return result
+        return cls(result)
+
+    @property
+    def text(self):
+        '''The reply for the line protocol.'''
+        if self._text is None:
+            if self.error is not None:
+                self._text = 'ERROR %r' % self.error
+            elif isinstance(self.payload, six.string_types):
+                self._text = self.payload
+            else:
+                self._text = json.dumps(self.payload)
+        return self._text
+
+    @property
+    def line(self):
+        '''The encoded reply for the line protocol.'''
+        if self._line is None:
+            self._line = self.text.encode('utf-8') + b'\n'
+        return self._line
+
+    def encode_frame(self, codec, request_id):
+        '''Encode the reply for the framed protocol.
+
+        :param codec: the name of the codec to use
+        :param request_id: the ID of the request being answered
+        :returns: the frame, including its length
+        '''
+        if self.error is not None:
+            return encode_frame(CODECS[codec][0](self.frame(request_id)))
+        result = self._results.get(codec)
+        if result is None:
+            result = self._results[codec] = CODECS[codec][0](self.payload)
+        return encode_frame(RESULT_WRAPPERS[codec](request_id, result))
+
+    def frame(self, request_id):
+        '''The reply for the framed protocol, before encoding.
+
+        :param request_id: the ID of the request being answered
+        '''
+        if self.error is None:
+            return {'id': request_id, 'result': self.payload}
+        return {'id': request_id, 'error': {
+            'type': type(self.error).__name__,
+            'message': str(self.error),
+            'repr': repr(self.error),
+        }}
+
+
+def send_fd(conn, fd):
+    '''Pass a file descriptor over a Unix Domain Socket.
+
+    A single marker byte is sent along with the descriptor.
+
+    :param conn: the connected socket to send on
+    :param fd: the file descriptor to send
+    :raises NotImplementedError: if this Python can't pass descriptors
+    '''
+    if not hasattr(conn, 'sendmsg'):
+        raise NotImplementedError('Passing file descriptors needs Python 3')
+    conn.sendmsg([b'F'], [(socket.SOL_SOCKET, socket.SCM_RIGHTS,
+                           array.array('i', [fd]))])
+
+
+def recv_fd(sock):
+    '''Receive a file descriptor sent with :func:`send_fd`.
+
+    If the peer sent an ordinary response instead, its first byte is
+    returned with no descriptor.
+
+    :param sock: the connected socket to receive on
+    :returns: a (first byte, file descriptor or None) pair
+    '''
+    if not hasattr(sock, 'recvmsg'):
+        raise NotImplementedError('Passing file descriptors needs Python 3')
+    fds = array.array('i')
+    data, ancdata, dummy, dummy = sock.recvmsg(
+        1, socket.CMSG_SPACE(fds.itemsize))
+    for level, kind, cmsg_data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(cmsg_data[:len(cmsg_data) -
+                                    len(cmsg_data) % fds.itemsize])
+    return data, (fds[0] if fds else None)
+
+
+def peer_uid(conn):
+    '''Get the user ID of the process at the other end of a connection.
+
+    :param conn: a connected Unix Domain Socket
+    :returns: the peer's UID, or None if the platform can't tell us
+    '''
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                            struct.calcsize('3i'))
+    dummy, uid, dummy = struct.unpack('3i', creds)
+    return uid
+
+
+def inherited_socket():
+    '''Get a listening socket passed in by systemd socket activation.
+
+    See sd_listen_fds(3). The environment variables are cleared so they
+    aren't passed on to child processes.
+
+    :returns: the socket, or None if none was passed in
+    :raises ValueError: if more than one socket was passed in
+    '''
+    if os.environ.get('LISTEN_PID') != str(os.getpid()):
+        return None
+    count = int(os.environ.get('LISTEN_FDS') or 0)
+    for var in ('LISTEN_PID', 'LISTEN_FDS', 'LISTEN_FDNAMES'):
+        os.environ.pop(var, None)
+    if count == 0:
+        return None
+    if count > 1:
+        raise ValueError('Expected one socket, but got %d' % count)
+    sock = socket.fromfd(SD_LISTEN_FDS_START, socket.AF_UNIX,
+                         socket.SOCK_STREAM)
+    # fromfd() duplicates the descriptor
+    os.close(SD_LISTEN_FDS_START)
+    return sock
+
+
+class Recorder(object):
+    '''Append timestamped requests to a file, as JSON lines.
+
+    Each line is an object with ``time``, ``conn`` (a number identifying
+    the connection) and ``data`` (the request) keys. The file is only
+    readable by its owner.
+
+    :param path: the file to append to
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fp = os.fdopen(os.open(
+            path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600), 'a')
+
+    def record(self, conn_id, data):
+        '''Record a single request.
+
+        :param conn_id: a number identifying the connection
+        :param data: the (redacted) request
+        '''
+        line = json.dumps({'time': time.time(), 'conn': conn_id,
+                           'data': data}, sort_keys=True)
+        with self._lock:
+            self._fp.write(line + '\n')
+            self._fp.flush()
+
+    def close(self):
+        '''Close the file.'''
+        with self._lock:
+            self._fp.close()
+
+
 class LineOrientedUnixServer(object):
     '''A line-oriented UDS server.
 
@@ -35,23 +357,42 @@ class LineOrientedUnixServer(object):
 
     :param socket_address: the address to which the socket should bind
     :param backlog: the maximum number of queued connections
+    :param recorder: a Recorder to log (redacted) requests to
+    :param sock: an already-listening socket to use instead of binding
+                 a new one, such as one taken over from another server
     '''
     # pylint: disable=too-few-public-methods
-    def __init__(self, socket_address, backlog=1):
-        self.sock = socket.socket(socket.AF_UNIX)
-        self.sock.bind(socket_address)
-        self.sock.listen(backlog)
+    def __init__(self, socket_address, backlog=1, recorder=None, sock=None):
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX)
+            sock.bind(socket_address)
+            sock.listen(backlog)
+        self.sock = sock
+        self.recorder = recorder
+        self.running = True
+        self.current_connection = None
+        self.current_codec = None
+        self._connections = 0
+
+    def stop(self):
+        '''Stop accepting connections once the current one is done.'''
+        self.running = False
 
     def run(self):
-        '''Process incoming connections indefinitely.'''
+        '''Process incoming connections until stopped.'''
         try:
-            while True:
+            while self.running:
                 conn, client_addr = self.sock.accept()
                 try:
                     self._handle_connection(conn)
                 except socket.timeout:
                     LOGGER.info('Timeout while communicating with %r',
                                 client_addr)
+                except socket.error as exc:
+                    # Most likely the client went away before its reply;
+                    # that's no reason to stop serving everyone else
+                    LOGGER.info('Error while communicating with %r: %r',
+                                client_addr, exc)
                 finally:
                     conn.close()
         finally:
@@ -62,33 +403,112 @@ class LineOrientedUnixServer(object):
 
         :param conn: the connection socket
         '''
-        conn.settimeout(1)
+        conn = BudgetedConnection(conn)
+        self.current_connection = conn
+        self.current_codec = None
+        self._connections += 1
+        conn_id = self._connections
         buf = b''
         while True:
             data, buf = read_line(conn, buf)
-            LOGGER.debug('rx: %r', data)
+            LOGGER.debug('rx: %r', self.redact(data))
             if not data:
                 break
-            resp = self._handle_data(data)
-            LOGGER.debug('tx: %r', resp)
-            conn.sendall(resp.encode('utf-8'))
-            conn.sendall(b'\n')
+            resp = self._respond(conn_id, data)
+            conn.sendall(resp.line)
+            if self.current_codec is not None:
+                # Negotiated with "hello"; the rest is framed
+                self._handle_frames(conn, conn_id, buf)
+                break
+
+    def _handle_frames(self, conn, conn_id, buf):
+        '''Handle the rest of a connection using the framed protocol.
+
+        Each request is a dict with an ``id``, a ``cmd`` and (optionally)
+        its ``data``; the response has the same ``id`` and either a
+        ``result`` or an ``error``.
+        '''
+        loads = CODECS[self.current_codec][1]
+        while True:
+            try:
+                payload, buf = read_frame(conn, buf)
+            except ValueError as exc:
+                LOGGER.warning('Closing connection: %s', exc)
+                break
+            if payload is None:
+                break
+            try:
+                request = loads(payload)
+                data = request['cmd']
+                if request.get('data'):
+                    data += ' ' + request['data']
+            except Exception as exc:  # pylint: disable=broad-except
+                resp, request = Response(error=exc), {}
+            else:
+                LOGGER.debug('rx: %r', self.redact(data))
+                resp = self._respond(conn_id, data)
+            conn.sendall(resp.encode_frame(self.current_codec,
+                                           request.get('id')))
+
+    def _respond(self, conn_id, data):
+        if self.recorder is not None:
+            self.recorder.record(conn_id, self.redact(data))
+        resp = self._handle_data(data)
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            # Replies may be large; the start is enough to debug with
+            LOGGER.debug('tx: %r', self.redact(resp.text)[:LOG_PREVIEW])
+        return resp
+
+    def redact(self, data):
+        '''Remove anything sensitive from a line before it's logged.
+
+        Subclasses should override this if requests or responses may
+        include secrets.
+
+        :param data: the request or response
+        :returns: the line, safe to log
+        '''
+        return data
 
     def _handle_data(self, data):
         '''Handle data read from the connection.
 
         This will parse out the first <word> of the line and call a subclass's
-        handle_<word>handler.
+        handle_<word>handler, which may return a string or a Response.
+
+        :returns: a Response
         '''
         cmd, dummy, data = data.partition(' ')
         handler = getattr(self, 'handle_%s' % cmd, None)
         if not handler:
-            return 'ERROR unknown command %s' % cmd
+            return Response(error=UnknownCommand(cmd),
+                            text='ERROR unknown command %s' % cmd)
         try:
-            return handler(data)
+            return Response.wrap(handler(data))
         except Exception as exc:  # pylint: disable=broad-except
             LOGGER.exception(exc)
-            return 'ERROR %r' % exc
+            return Response(error=exc)
+
+    def handle_hello(self, data):
+        '''Socket command: switch this connection to the framed protocol.
+
+        :param data: a string of the form "[versions] [codecs]", each a
+                     comma-separated list, with codecs most preferred first
+        :returns: a string of the form "hello [version] [codec]"; every
+                  later request and response on the connection is a frame
+        '''
+        if self.current_codec is not None:
+            raise ValueError('Already using the framed protocol')
+        versions, dummy, codecs = data.partition(' ')
+        if str(PROTOCOL_VERSION) not in versions.split(','):
+            raise ValueError('Unsupported protocol versions %r; expected %d'
+                             % (versions, PROTOCOL_VERSION))
+        for codec in codecs.split(','):
+            if codec in CODECS:
+                self.current_codec = codec
+                return 'hello %d %s' % (PROTOCOL_VERSION, codec)
+        raise ValueError('Unsupported codecs %r; expected one of %s' % (
+            codecs, ', '.join(CODEC_PREFERENCE)))
 
 
 class LineOrientedUnixClient(object):
@@ -98,11 +518,16 @@ class LineOrientedUnixClient(object):
     to which servers should always respond with single-line responses.
 
     :param socket_address: the address to which the client should connect
+    :param timeout: the most seconds to wait for the server, or None to
+                    wait indefinitely
     '''
-    def __init__(self, socket_address):
+    def __init__(self, socket_address, timeout=None):
         self.sock = socket.socket(socket.AF_UNIX)
+        self.sock.settimeout(timeout)
         self.sock.connect(socket_address)
         self.buf = b''
+        self.codec = None
+        self._last_id = 0
 
     def send_command(self, cmd):
         '''Send a single command to the server.
@@ -110,14 +535,67 @@ class LineOrientedUnixClient(object):
         :param cmd: the command to send
         :returns: the response from the server
         '''
-        self.sock.sendall(cmd.encode('utf-8'))
-        self.sock.sendall(b'\n')
+        if self.codec is not None:
+            raise ValueError('Use call() once the framed protocol is in use')
+        self.sock.sendall(cmd.encode('utf-8') + b'\n')
         data, self.buf = read_line(self.sock, self.buf)
         return data
 
+    def negotiate(self, codecs=None):
+        '''Switch to the framed protocol, if the server supports it.
+
+        :param codecs: the codecs to offer, most preferred first; by
+                       default, every one available
+        :returns: the codec agreed on, or None if the server only speaks
+                  the line protocol
+        '''
+        result = self.send_command('hello %d %s' % (
+            PROTOCOL_VERSION, ','.join(codecs or CODEC_PREFERENCE)))
+        if result.startswith('hello '):
+            self.codec = result.split(' ')[2]
+        return self.codec
+
+    def call(self, cmd, data=''):
+        '''Send a single command using the framed protocol.
+
+        :param cmd: the command to send
+        :param data: the command's argument
+        :returns: the response frame, a dict with a ``result`` or an
+                  ``error``
+        '''
+        return self.call_many([(cmd, data)])[0]
+
+    def call_many(self, requests):
+        '''Send several commands at once, then wait for every response.
+
+        :param requests: a list of (command, argument) pairs
+        :returns: the response frames, in the same order
+        '''
+        dumps, loads = CODECS[self.codec]
+        ids = []
+        frames = []
+        for cmd, data in requests:
+            self._last_id += 1
+            ids.append(self._last_id)
+            frames.append(encode_frame(dumps(
+                {'id': self._last_id, 'cmd': cmd, 'data': data})))
+        self.sock.sendall(b''.join(frames))
+        responses = {}
+        while len(responses) < len(ids):
+            payload, self.buf = read_frame(self.sock, self.buf)
+            if payload is None:
+                raise socket.error('Connection closed by server')
+            response = loads(payload)
+            if response.get('id') not in ids:
+                # The server couldn't even tell which request this was
+                raise ValueError('Unexpected response: %r' % (response, ))
+            responses[response['id']] = response
+        return [responses[request_id] for request_id in ids]
+
     def close(self):
         '''Attempt to close the connection to the server gracefully.'''
-        self.sock.sendall(b'\n')
+        if self.codec is None:
+            self.sock.sendall(b'\n')
         self.sock.close()
 
     def __enter__(self):
@@ -1,40 +1,446 @@
 from __future__ import unicode_literals
 import contextlib
+import hashlib
 import json
+import logging
+import os
+import socket
+import stat
+import time
 
+from swiftagent.agent import client
 from swiftagent.agent import comm
-from swiftagent import auth
 from swiftagent.auth import base
+from swiftagent.auth import catalog
+from swiftagent.auth import health
+from swiftagent.auth.agent import AgentAuthenticator
+from swiftagent.auth.token import NoAuthAuthenticator
 from swiftagent import config
+from swiftagent import metrics
 from swiftagent import models
+from swiftagent import parallel
+from swiftagent import profiling
+from swiftagent import tracing
+from swiftagent import watch
+
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(logging.NullHandler())
+
+STATE_VERSION = 1
+UPSTREAM_TIMEOUT = 30
 
 
 class SwiftAgentServer(comm.LineOrientedUnixServer):
-    def __init__(self, socket_address):
-        super(SwiftAgentServer, self).__init__(socket_address)
-        self.cache = {
+    '''The swift-agent server.
+
+    :param socket_address: the address to which the socket should bind
+    :param recorder: a Recorder to log (redacted) requests to
+    :param sock: an already-listening socket to use instead of binding
+    :param upstream: the socket of another swift-agent to forward to, like
+                     ssh-agent forwarding. Auth configs not defined locally
+                     (and /info not cached locally) are fetched from it,
+                     then cached here until they expire.
+    '''
+    REDACTED = '<redacted>'
+    MODE = 'single'
+
+    def __init__(self, socket_address, recorder=None, sock=None,
+                 upstream=None):
+        if upstream and os.path.realpath(upstream) == \
+                os.path.realpath(socket_address):
+            raise ValueError('An agent can\'t forward to itself')
+        super(SwiftAgentServer, self).__init__(socket_address,
+                                               recorder=recorder, sock=sock)
+        self.socket_address = socket_address
+        self.upstream = upstream
+        self.profiler = None
+        self.cache = self.new_cache()
+        self.conf = None
+        self.watcher = None
+        self.started = time.time()
+        self.metrics = metrics.Registry()
+        self.metrics.gauge(
+            'swiftagent_info', 'How the agent is serving').set(
+                1, mode=self.MODE, upstream=self.upstream or '')
+        self.metrics.counter(
+            'swiftagent_requests_total', 'Socket commands handled')
+        self.metrics.counter(
+            'swiftagent_errors_total', 'Socket commands that failed')
+        self.metrics.histogram(
+            'swiftagent_request_seconds', 'Time spent handling commands')
+        self.metrics.gauge(
+            'swiftagent_active_connections', 'Open client connections')
+        self.metrics.counter(
+            'swiftagent_cache_hits_total', 'Cache lookups that hit')
+        self.metrics.counter(
+            'swiftagent_cache_misses_total', 'Cache lookups that missed')
+        self.metrics.counter(
+            'swiftagent_reauth_total', 'Requests to auth backends')
+        self.metrics.counter(
+            'swiftagent_reauth_errors_total', 'Failed requests to auth '
+            'backends')
+        self.metrics.histogram(
+            'swiftagent_reauth_seconds', 'Time spent authenticating')
+        self.metrics.gauge(
+            'swiftagent_uptime_seconds', 'Time since the agent started')
+
+    @staticmethod
+    def new_cache():
+        '''Get an empty set of caches.'''
+        return {
             'passwords': {},
             'authenticators': {},
+            'identities': {},
+            'breakers': {},
             'info': {},
+            # (command, key) -> (cached value, Response for it)
+            'responses': {},
         }
-        self.conf = None
+
+    def _handle_connection(self, conn):
+        connections = self.metrics.get('swiftagent_active_connections')
+        connections.inc()
+        try:
+            super(SwiftAgentServer, self)._handle_connection(conn)
+        finally:
+            connections.dec()
+
+    def redact(self, data):
+        if data.startswith('unlock '):
+            auth_config = data[7:].partition(' ')[0]
+            return 'unlock %s %s' % (auth_config, self.REDACTED)
+        if data.startswith('handoff '):
+            return 'handoff %s' % self.REDACTED
+        return data
+
+    @classmethod
+    def take_over(cls, socket_address, recorder=None, **kwargs):
+        '''Replace a running server, keeping its socket and caches.
+
+        The old server passes over its listening socket, so clients never
+        see it disappear; connections made during the handoff wait in the
+        socket's backlog until the new server starts accepting. If the old
+        server is of another mode, its caches couldn't be restored, so it's
+        left running.
+
+        :param socket_address: the socket the running server listens on
+        :param recorder: a Recorder to log (redacted) requests to
+        :param kwargs: any other arguments for the new server
+        :returns: a new server, ready to run
+        :raises ValueError: if the running server is of another mode
+        '''
+        with client.SwiftAgentClient(socket_address) as agent_client:
+            fd, state = agent_client.handoff()
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM,
+                                 fileno=fd)
+            try:
+                if state.get('mode') != cls.MODE:
+                    raise ValueError('Can\'t take over from a %s server '
+                                     'with a %s one' % (state.get('mode'),
+                                                        cls.MODE))
+                server = cls(socket_address, recorder, sock=sock, **kwargs)
+                server.restore_state(state)
+                agent_client.finish_handoff()
+            except Exception:
+                sock.close()
+                raise
+        return server
+
+    def _check_state(self, state):
+        if state.get('version') != STATE_VERSION:
+            LOGGER.warning('Ignoring state with unknown version %r',
+                           state.get('version'))
+            return False
+        if state.get('mode') != self.MODE:
+            LOGGER.warning('Ignoring state from a %s server',
+                           state.get('mode'))
+            return False
+        return True
+
+    def dump_state(self):
+        '''Get everything cached, so another server may carry on from it.
+
+        This includes passwords, so must only be given to the same user.
+
+        :returns: a JSON-serializable dict
+        '''
+        # Drop anything stale before handing it on
+        self.check_config()
+        authenticators = {}
+        derived = []
+        for name, authenticator in self.cache['authenticators'].items():
+            if isinstance(authenticator, catalog.DerivedAuthenticator):
+                derived.append(name)
+            else:
+                authenticators[name] = authenticator.dump_state()
+        return {
+            'version': STATE_VERSION,
+            'mode': self.MODE,
+            'passwords': self.cache['passwords'],
+            'info': self.cache['info'],
+            'authenticators': authenticators,
+            'derived': sorted(derived),
+        }
+
+    def restore_state(self, state):
+        '''Restore the caches from :meth:`dump_state`.
+
+        Auth configs that can no longer be loaded (because the config
+        changed, say) are skipped; they'll authenticate afresh when used.
+
+        :param state: a dict returned by :meth:`dump_state`
+        '''
+        if not self._check_state(state):
+            return
+        self.cache['passwords'].update(state['passwords'])
+        self.cache['info'].update(state['info'])
+        # Primary authenticators first, so derived ones find their tokens
+        for name, auth_state in sorted(state['authenticators'].items()):
+            try:
+                authenticator = self.get_authenticator(name)
+                if not isinstance(authenticator,
+                                  catalog.DerivedAuthenticator):
+                    authenticator.load_state(auth_state)
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception('Could not restore auth %s', name)
+                self.cache['authenticators'].pop(name, None)
+        for name in state['derived']:
+            try:
+                self.get_authenticator(name)
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception('Could not restore auth %s', name)
+
+    def _handle_data(self, data):
+        cmd = data.partition(' ')[0]
+        if not hasattr(self, 'handle_%s' % cmd):
+            cmd = 'unknown'
+        start = time.time()
+        with tracing.span('agent.command', command=cmd):
+            resp = super(SwiftAgentServer, self)._handle_data(data)
+        self.metrics.get('swiftagent_request_seconds').observe(
+            time.time() - start, command=cmd)
+        self.metrics.get('swiftagent_requests_total').inc(command=cmd)
+        if resp.error is not None:
+            self.metrics.get('swiftagent_errors_total').inc(command=cmd)
+        return resp
+
+    def record_cache(self, namespace, hit):
+        '''Count a cache lookup.
+
+        :param namespace: the cache that was checked, such as ``info``
+        :param hit: whether the lookup found something
+        '''
+        self.metrics.get(
+            'swiftagent_cache_hits_total' if hit else
+            'swiftagent_cache_misses_total').inc(namespace=namespace)
+
+    def record_reauth(self, auth_config, elapsed, failed=False):
+        '''Count a request to an auth backend.
+
+        :param auth_config: the auth config used
+        :param elapsed: how long the request took, in seconds
+        :param failed: whether the request failed
+        '''
+        self.metrics.get('swiftagent_reauth_total').inc(auth=auth_config)
+        self.metrics.get('swiftagent_reauth_seconds').observe(
+            elapsed, auth=auth_config)
+        if failed:
+            self.metrics.get('swiftagent_reauth_errors_total').inc(
+                auth=auth_config)
+
+    def load_config(self):
+        '''Load a fresh SwiftConfig.'''
+        return config.SwiftConfig()
+
+    def check_config(self):
+        '''Load the SwiftConfig, or reload it if the files have changed.'''
+        if self.conf is None or self.watcher is None:
+            self.reload()
+        elif self.watcher.changed() and self.conf.needs_reload():
+            with tracing.span('config.reload'):
+                self.reload()
+
+    def reload(self):
+        '''Reload the SwiftConfig.
+
+        Only auth configs whose sections changed are dropped, so unrelated
+        edits don't force everything to re-authenticate.
+
+        :returns: the names of the auth configs that changed
+        '''
+        old_conf, self.conf = self.conf, self.load_config()
+        if self.watcher is None:
+            self.watcher = watch.ConfigWatcher(config.CONFIGS)
+        if old_conf is None:
+            return set()
+        changed = old_conf.snapshot.changed_sections(self.conf.snapshot)
+        if 'insecure' in changed:
+            # Every authenticator checks certificates based on this
+            changed = set(s for s in old_conf.snapshot.sections) | \
+                set(s for s in self.conf.snapshot.sections)
+        changed_auths = set(s[5:] for s in changed if s.startswith('auth:'))
+        for auth_config in changed_auths:
+            self.invalidate_auth(auth_config)
+        return changed_auths
+
+    def invalidate_auth(self, auth_config):
+        '''Forget an auth config's authenticator after its section changed.
+
+        Endpoints derived from it (``name@region``) are dropped, too. Unlike
+        :meth:`drop_authenticator`, other auth configs sharing its token are
+        kept: their own options haven't changed, so the token is still
+        good for them.
+        '''
+        for key in list(self.cache['authenticators']):
+            if key == auth_config or key.startswith(auth_config + '@'):
+                del self.cache['authenticators'][key]
+                self.cache['breakers'].pop(key, None)
+        in_use = set(id(getattr(a, 'identity', None))
+                     for a in self.cache['authenticators'].values())
+        for key, identity in list(self.cache['identities'].items()):
+            if id(identity) not in in_use:
+                del self.cache['identities'][key]
 
     def get_authenticator(self, auth_config):
         '''Get an authenticator from an auth config.
 
+        Auth configs that differ only in their endpoint selection share a
+        single token. Additionally, an auth config of the form
+        ``name@region`` or ``name@region/interface`` (where no such section
+        exists) selects a different endpoint using ``name``'s token.
+
         :param auth_config: the auth config to use
         '''
-        if not self.conf or self.conf.needs_reload():
-            self.conf = config.SwiftConfig()
-            self.cache['authenticators'] = {}
+        with tracing.span('agent.get_authenticator', auth=auth_config) as span:
+            self.check_config()
+            authenticator = self.cache['authenticators'].get(auth_config)
+            self.record_cache('authenticators', bool(authenticator))
+            span.set(cached=bool(authenticator))
+            if not authenticator:
+                authenticator = self.cache['authenticators'][auth_config] = \
+                    self._make_authenticator(auth_config)
+            return authenticator
+
+    def is_local(self, auth_config):
+        '''Check whether an auth config is defined in the local config.
 
-        authenticator = self.cache['authenticators'].get(auth_config)
-        if not authenticator:
-            password = self.cache['passwords'].get(auth_config)
-            authenticator = self.cache['authenticators'][auth_config] = \
-                self.conf.get_auth(auth_config, password)
+        ``name@region`` is local if ``name`` is.
+        '''
+        if self.conf.has_auth(auth_config):
+            return True
+        parent_config, derived, dummy = auth_config.rpartition('@')
+        return bool(derived) and self.is_local(parent_config)
+
+    def upstream_client(self):
+        '''Connect to the upstream swift-agent.'''
+        return client.SwiftAgentClient(self.upstream,
+                                       timeout=UPSTREAM_TIMEOUT)
+
+    def _make_authenticator(self, auth_config):
+        if self.upstream and not self.is_local(auth_config):
+            return AgentAuthenticator({
+                'auth_name': auth_config,
+                'socket_address': self.upstream,
+                'timeout': UPSTREAM_TIMEOUT,
+            })
+        parent_config, derived, selection = auth_config.rpartition('@')
+        if derived and not self.conf.has_auth(auth_config):
+            parent = self.get_authenticator(parent_config)
+            if not hasattr(parent, 'identity'):
+                raise ValueError('Auth %s does not support endpoint '
+                                 'selection' % parent_config)
+            region, dummy, interface = selection.partition('/')
+            selection = dict(parent.selection)
+            if region:
+                selection['region'] = region
+            if interface:
+                selection['interface'] = interface
+            return catalog.DerivedAuthenticator(parent.identity, selection)
+
+        cls = self.conf.get_auth_class(auth_config)
+        options = self.conf.get_auth_options(auth_config)
+        password = self.cache['passwords'].get(auth_config)
+        identity_key = cls.identity_key(options)
+        if identity_key is not None:
+            # Only share tokens between auth configs using the same
+            # password, so a token is never handed out for the wrong one
+            resolved = password if password is not None else \
+                self.conf.get_insecure_password(auth_config)
+            identity_key += (None if resolved is None else hashlib.sha256(
+                resolved.encode('utf-8')).hexdigest(), )
+        identity = self.cache['identities'].get(identity_key)
+        if identity_key is not None:
+            self.record_cache('identities', identity is not None)
+        if identity is not None:
+            return catalog.DerivedAuthenticator(
+                identity, cls.config_selection(options))
+
+        authenticator = self.conf.get_auth(auth_config, password)
+        if identity_key is not None:
+            self.cache['identities'][identity_key] = authenticator
         return authenticator
 
+    def get_credentials(self, auth_config, force_reauth=False):
+        '''Get the (possibly cached) credentials for an auth config.
+
+        If the backend has to be contacted, it's done through a circuit
+        breaker for the auth config, so recent failures fail fast.
+
+        :param auth_config: the auth config to use
+        :param force_reauth: if True, fetch fresh credentials
+        :returns: a (storage_url, token, expiration time) triple
+        :raises CircuitOpen: if the auth config failed recently
+        '''
+        authenticator = self.get_authenticator(auth_config)
+        cached = not (force_reauth or authenticator.token_has_expired)
+        self.record_cache('credentials', cached)
+        if cached:
+            return authenticator.get_credentials()
+        with self.circuit_breaker(auth_config):
+            start = time.time()
+            try:
+                creds = authenticator.get_credentials(force_reauth)
+            except base.PasswordRequired:
+                raise
+            except Exception:
+                self.record_reauth(auth_config, time.time() - start, True)
+                raise
+            self.record_reauth(auth_config, time.time() - start)
+            return creds
+
+    @contextlib.contextmanager
+    def circuit_breaker(self, auth_config):
+        '''Context manager to call an auth backend through a circuit breaker.
+
+        Failures are remembered (with exponential backoff) and reported
+        as CircuitOpen errors until the backoff expires; then a single
+        probe is let through to see whether the backend has recovered.
+
+        :param auth_config: the auth config being used
+        '''
+        breaker = self.cache['breakers'].get(auth_config)
+        if breaker is None:
+            breaker = self.cache['breakers'][auth_config] = \
+                health.CircuitBreaker()
+        if not breaker.allow():
+            raise base.CircuitOpen(self, 'retry in %.1fs; last error: %r' % (
+                breaker.retry_after, breaker.last_error))
+        try:
+            yield
+        except (base.PasswordRequired, base.CircuitOpen):
+            # Another breaker (for the auth URL, say) backing off is
+            # already counted there. Bad credentials do count, so they
+            # aren't retried against the backend by every client; unlock
+            # gives new ones a fresh chance.
+            breaker.record_abandoned()
+            raise
+        except Exception as exc:
+            breaker.record_failure(exc)
+            raise
+        else:
+            breaker.record_success()
+
     def get_info(self, url):
         '''Get the capabilities of a Swift cluster.
 
@@ -43,16 +449,60 @@ class SwiftAgentServer(comm.LineOrientedUnixServer):
                   of the /info request
         '''
         info = self.cache['info'].get(url)
+        self.record_cache('info', bool(info))
         if not info:
-            cluster = models.Cluster(auth.noauth({'storage_url': url}))
-            info = self.cache['info'][url] = cluster.info()
+            info = self.cache['info'][url] = self._fetch_info(url)
         return info
 
+    def _fetch_info(self, url):
+        if self.upstream:
+            try:
+                with self.upstream_client() as agent_client:
+                    return agent_client.info(url)
+            except (client.SwiftAgentClientError, socket.error) as exc:
+                LOGGER.warning('Upstream agent failed to get info for %s '
+                               '(%r); fetching it directly', url, exc)
+        cluster = models.Cluster(NoAuthAuthenticator({'storage_url': url}))
+        return cluster.info()
+
+    def cached_response(self, cmd, key, value, build):
+        '''Get the Response for a cached value, reusing its encodings.
+
+        The Response is rebuilt whenever the value changes.
+
+        :param cmd: the command being answered
+        :param key: the key of the value in its cache
+        :param value: the value to respond with
+        :param build: a function that builds the Response for the value
+        '''
+        cached = self.cache['responses'].get((cmd, key))
+        if cached is None or not (cached[0] is value or cached[0] == value):
+            cached = self.cache['responses'][cmd, key] = (value, build())
+        return cached[1]
+
     def purge(self, auth_config_or_url):
         '''Clear the caches for a given auth config or URL.'''
         self.cache['passwords'].pop(auth_config_or_url, None)
-        self.cache['authenticators'].pop(auth_config_or_url, None)
+        self.drop_authenticator(auth_config_or_url)
         self.cache['info'].pop(auth_config_or_url, None)
+        self.cache['responses'].pop(('info', auth_config_or_url), None)
+
+    def drop_authenticator(self, auth_config):
+        '''Forget the authenticator for an auth config.
+
+        If its token is shared, every auth config using it is dropped, too.
+        '''
+        authenticator = self.cache['authenticators'].pop(auth_config, None)
+        self.cache['responses'].pop(('auth', auth_config), None)
+        identity = getattr(authenticator, 'identity', None)
+        if identity is None:
+            return
+        for key, value in list(self.cache['identities'].items()):
+            if value is identity:
+                del self.cache['identities'][key]
+        for key, value in list(self.cache['authenticators'].items()):
+            if getattr(value, 'identity', None) is identity:
+                del self.cache['authenticators'][key]
 
     @contextlib.contextmanager
     def purge_on_error(self, auth_config, exc_types=(Exception,)):
@@ -71,23 +521,33 @@ class SwiftAgentServer(comm.LineOrientedUnixServer):
     def handle_reload(self, dummy):
         '''Socket command: reload the server's SwiftConfig.
 
-        This may be used to learn about new auth endpoints.
+        Changes are normally noticed automatically; this forces a check.
 
         :param dummy: (ignored)
+        :returns: a string of the form "reloaded [auth_config] ..." listing
+                  the auth configs that changed
         '''
-        self.reload()
-        return 'reloaded'
+        return ' '.join(['reloaded'] + sorted(self.reload()))
 
     def handle_unlock(self, data):
         '''Socket command: unlock a particular auth config.
 
+        Auth configs served by an upstream agent are unlocked there.
+
         :param data: a string of the form "[auth_config] [password]"
         '''
         auth_config, dummy, password = data.partition(' ')
-        self.cache['passwords'][auth_config] = password
-        self.cache['authenticators'].pop(auth_config, None)
+        self.check_config()
+        if self.upstream and not self.is_local(auth_config):
+            with self.upstream_client() as agent_client:
+                agent_client.unlock(auth_config, password)
+        else:
+            self.cache['passwords'][auth_config] = password
+        self.drop_authenticator(auth_config)
+        # New credentials deserve a fresh chance
+        self.cache['breakers'].pop(auth_config, None)
         with self.purge_on_error(auth_config):
-            self.get_authenticator(auth_config).get_credentials()
+            self.get_credentials(auth_config)
         return 'unlocked'
 
     def handle_purge(self, data):
@@ -98,25 +558,53 @@ class SwiftAgentServer(comm.LineOrientedUnixServer):
         self.purge(data)
         return 'purged'
 
+    def handle_peek(self, data):
+        '''Socket command: describe the cached credentials for an auth config.
+
+        This never authenticates, and never reveals the token itself.
+
+        :param data: a string of the form "[auth_config]"
+        :returns: a single-line JSON object with ``cached`` and, if there
+                  is a valid token, ``storage_url`` and ``expires`` keys
+        '''
+        authenticator = self.cache['authenticators'].get(data)
+        if authenticator is None or authenticator.token_has_expired:
+            return comm.Response({'cached': False})
+        url, dummy, expiry = authenticator.get_credentials()
+        return comm.Response({'cached': True, 'storage_url': url,
+                              'expires': expiry})
+
+    @staticmethod
+    def auth_response(url, token, expiry):
+        '''Build the response to an auth or reauth command.'''
+        return comm.Response(
+            {'storage_url': url, 'token': token, 'expires': expiry},
+            'auth %s %s %s' % (url, token, expiry))
+
     def handle_auth(self, data):
         '''Socket command: get the credentials for an auth config.
 
         :param data: a string of the form "[auth_config]"
-        :returns: a string of the form "auth [url] [token]"
+        :returns: the storage URL, token and expiry; as text, a string of
+                  the form "auth [url] [token] [expiry]"
         '''
         with self.purge_on_error(data, base.Unauthorized):
-            authenticator = self.get_authenticator(data)
-            url, token, expiry = authenticator.get_credentials()
-        return 'auth %s %s %s' % (url, token, expiry)
+            credentials = self.get_credentials(data)
+        return self.cached_response(
+            'auth', data, credentials,
+            lambda: self.auth_response(*credentials))
 
     def handle_reauth(self, data):
         '''Socket command: refresh the credentials for an auth config.
 
         :param data: a string of the form "[auth_config]"
-        :returns: a string of the form "auth [url] [token]"
+        :returns: the storage URL, token and expiry; as text, a string of
+                  the form "auth [url] [token] [expiry]"
         '''
-        url, token, expiry = self.get_authenticator(data).reauth()
-        return 'auth %s %s %s' % (url, token, expiry)
+        credentials = self.get_credentials(data, force_reauth=True)
+        return self.cached_response(
+            'auth', data, credentials,
+            lambda: self.auth_response(*credentials))
 
     def handle_info(self, data):
         '''Socket command: get the capabilities of a Swift cluster.
@@ -125,7 +613,119 @@ class SwiftAgentServer(comm.LineOrientedUnixServer):
         :returns: a single-line JSON representation of the /info response
         '''
         url = config.scheme_netloc_only(data)
-        return json.dumps(self.get_info(url))
+        info = self.get_info(url)
+        return self.cached_response('info', url, info,
+                                    lambda: comm.Response(info))
+
+    def handle_infos(self, data):
+        '''Socket command: get the capabilities of several Swift clusters.
+
+        Any clusters not already cached are fetched concurrently.
+
+        :param data: a string of the form "[cluster_url] [cluster_url] ..."
+        :returns: a single-line JSON object mapping each cluster URL to
+                  either ``{"info": ..., "elapsed": ..., "cached": ...}``
+                  or ``{"error": ...}``
+        '''
+        urls = data.split()
+
+        def fetch(url):
+            start = time.time()
+            cached = config.scheme_netloc_only(url) in self.cache['info']
+            info = self.get_info(config.scheme_netloc_only(url))
+            return {'info': info, 'cached': cached,
+                    'elapsed': time.time() - start}
+
+        return comm.Response({
+            url: {'error': repr(exc)} if exc else result
+            for url, result, exc in parallel.run_parallel(fetch, urls)})
+
+    def handle_stats(self, data):
+        '''Socket command: report the agent's metrics.
+
+        :param data: either "json" (the default) or "prometheus"
+        :returns: a single-line JSON object describing every metric or, for
+                  "prometheus", a JSON string holding the Prometheus text
+                  exposition
+        '''
+        self.metrics.get('swiftagent_uptime_seconds').set(
+            time.time() - self.started)
+        if data == 'prometheus':
+            text = self.metrics.prometheus()
+            return comm.Response(text, json.dumps(text))
+        if data not in ('', 'json'):
+            raise ValueError('Unknown stats format %r' % data)
+        return comm.Response(self.metrics.snapshot())
+
+    def handle_profile(self, data):
+        '''Socket command: start or stop profiling the server.
+
+        Only one profile may run at a time. Unless a path is given, results
+        are written next to the socket, in its private directory.
+
+        :param data: a string of the form "start [cprofile|sample]
+                     [interval]" or "stop [path]"
+        :returns: "profiling [mode]" on start, or "profiled [path]
+                  [seconds]" on stop
+        '''
+        action, dummy, rest = data.partition(' ')
+        if action == 'start':
+            if self.profiler is not None:
+                raise ValueError('Already profiling with %s' %
+                                 self.profiler.mode)
+            mode, dummy, interval = rest.partition(' ')
+            profiler = profiling.Profiler(
+                mode or 'sample',
+                float(interval or profiling.DEFAULT_INTERVAL))
+            profiler.start()
+            self.profiler = profiler
+            return 'profiling %s' % profiler.mode
+        if action == 'stop':
+            if self.profiler is None:
+                raise ValueError('Not profiling')
+            path = rest or os.path.join(
+                os.path.dirname(os.path.abspath(self.socket_address)),
+                'profile-%d%s' % (time.time(), self.profiler.extension))
+            # Only forget the profile once it's written, so a failed
+            # write may be retried with another path
+            elapsed = self.profiler.stop(path)
+            self.profiler = None
+            return 'profiled %s %.3f' % (path, elapsed)
+        raise ValueError('Expected "start" or "stop", not %r' % action)
+
+    def handle_handoff(self, data):
+        '''Socket command: hand the socket and caches to a new server.
+
+        First the listening socket is passed over the connection, along
+        with the cached state. Once the new server has restored it, it
+        sends "handoff done" and this server stops accepting connections
+        (when the connection closes). Until then, this server carries on
+        as normal, so a failed takeover loses nothing.
+
+        Only a process running as the same user may take over.
+
+        :param data: either "" to start the handoff or "done" to finish it
+        :returns: a string of the form "handoff [state]", where the state
+                  is a single-line JSON object from :meth:`dump_state`, or
+                  "stopping" once done
+        '''
+        conn = self.current_connection
+        uid = comm.peer_uid(conn)
+        if uid is not None and uid != os.getuid():
+            raise ValueError('Refusing to hand off to user %d' % uid)
+        if self.current_codec is not None:
+            raise ValueError('Handing off needs the line protocol')
+        if data == 'done':
+            self.stop()
+            LOGGER.info('Handed off to a new server')
+            return 'stopping'
+        if data:
+            raise ValueError('Expected "" or "done", not %r' % data)
+        if self.profiler is not None:
+            raise ValueError('Stop profiling before handing off')
+        state = json.dumps(self.dump_state())
+        comm.send_fd(conn, self.sock.fileno())
+        return 'handoff %s' % state
 
     def handle_reinfo(self, data):
         '''Socket command: get the fresh capabilities of a Swift cluster.
@@ -135,4 +735,124 @@ class SwiftAgentServer(comm.LineOrientedUnixServer):
         '''
         url = config.scheme_netloc_only(data)
         self.purge(url)
-        return json.dumps(self.get_info(url))
+        info = self.get_info(url)
+        return self.cached_response('info', url, info,
+                                    lambda: comm.Response(info))
+
+
+class SharedSwiftAgentServer(SwiftAgentServer):
+    '''A swift-agent server shared by every user on a host.
+
+    Each connection is identified by its peer's UID (from ``SO_PEERCRED``),
+    and every user gets their own caches, so one user's passwords and
+    tokens are never used for another. Users authenticate once per host,
+    rather than once per shell.
+
+    Passwords in the config are ignored, since every user could use them;
+    users must unlock auth configs with their own passwords. Only the
+    agent's own user (or root) may use administrative commands.
+
+    :param socket_address: the address to which the socket should bind
+    :param recorder: a Recorder to log (redacted) requests to
+    :param sock: an already-listening socket to use instead of binding
+    :param max_auths: the most auth configs to cache for each user
+    :param max_infos: the most clusters' /info to cache for each user
+    '''
+    MODE = 'shared'
+    ADMIN_COMMANDS = ('handoff', 'profile', 'reload', 'stats')
+
+    def __init__(self, socket_address, recorder=None, sock=None,
+                 max_auths=32, max_infos=64):
+        if not hasattr(socket, 'SO_PEERCRED'):
+            raise RuntimeError('A shared agent needs SO_PEERCRED')
+        super(SharedSwiftAgentServer, self).__init__(
+            socket_address, recorder, sock)
+        if sock is None:
+            # Any user may connect; each is told apart by their UID
+            os.chmod(socket_address, 0o666)
+            directory = os.path.dirname(os.path.abspath(socket_address))
+            if not os.stat(directory).st_mode & stat.S_IXOTH:
+                LOGGER.warning('Other users can\'t reach %s; put the socket '
+                               'in a directory they can search',
+                               socket_address)
+        self.max_auths = max_auths
+        self.max_infos = max_infos
+        self.caches = {}
+        self.peer_uid = None
+        self.metrics.gauge(
+            'swiftagent_users', 'Users with cached state')
+
+    def _handle_connection(self, conn):
+        self.peer_uid = comm.peer_uid(conn)
+        self.cache = self.caches.setdefault(self.peer_uid, self.new_cache())
+        self.metrics.get('swiftagent_users').set(len(self.caches))
+        try:
+            super(SharedSwiftAgentServer, self)._handle_connection(conn)
+        finally:
+            self.peer_uid = None
+
+    def _handle_data(self, data):
+        cmd = data.partition(' ')[0]
+        if cmd in self.ADMIN_COMMANDS and \
+                self.peer_uid not in (0, os.getuid()):
+            return comm.Response(error=ValueError(
+                '%s is only available to the agent\'s owner' % cmd))
+        return super(SharedSwiftAgentServer, self)._handle_data(data)
+
+    def load_config(self):
+        conf = super(SharedSwiftAgentServer, self).load_config()
+        conf.insecure_auth = []
+        return conf
+
+    def get_authenticator(self, auth_config):
+        if auth_config not in self.cache['authenticators'] and \
+                len(self.cache['authenticators']) >= self.max_auths:
+            raise ValueError('Too many auth configs cached for user %s; '
+                             'purge some first' % self.peer_uid)
+        return super(SharedSwiftAgentServer, self).get_authenticator(
+            auth_config)
+
+    def get_info(self, url):
+        if url not in self.cache['info'] and \
+                len(self.cache['info']) >= self.max_infos:
+            raise ValueError('Too many clusters cached for user %s; '
+                             'purge some first' % self.peer_uid)
+        return super(SharedSwiftAgentServer, self).get_info(url)
+
+    def invalidate_auth(self, auth_config):
+        current = self.cache
+        try:
+            for cache in self.caches.values():
+                self.cache = cache
+                super(SharedSwiftAgentServer, self).invalidate_auth(
+                    auth_config)
+        finally:
+            self.cache = current
+
+    def dump_state(self):
+        current = self.cache
+        users = {}
+        try:
+            for uid, cache in self.caches.items():
+                self.cache = cache
+                users[str(uid)] = super(
+                    SharedSwiftAgentServer, self).dump_state()
+        finally:
+            self.cache = current
+        return {'version': STATE_VERSION, 'mode': self.MODE,
+                'users': users}
+
+    def restore_state(self, state):
+        if not self._check_state(state):
+            return
+        current = self.cache
+        try:
+            for uid, user_state in state['users'].items():
+                self.peer_uid = int(uid)
+                self.cache = self.caches.setdefault(
+                    self.peer_uid, self.new_cache())
+                super(SharedSwiftAgentServer, self).restore_state(
+                    user_state)
+        finally:
+            self.cache = current
+            self.peer_uid = None
@@ -1,6 +1,42 @@
-#flake8: noqa
-from swiftagent.auth.token import NoAuthAuthenticator as noauth
-from swiftagent.auth.token import TokenAuthenticator as token
-from swiftagent.auth.v1 import V1Authenticator as v1
-from swiftagent.auth.v2 import V2Authenticator as v2
-from swiftagent.auth.v3 import V3Authenticator as v3
+'''
+Authenticators, and the short names by which configs may refer to them.
+
+Authenticator modules are only imported when first used, so that tools
+which never authenticate directly don't pay for importing them.
+'''
+import importlib
+import sys
+
+ALIASES = {
+    'noauth': 'swiftagent.auth.token:NoAuthAuthenticator',
+    'token': 'swiftagent.auth.token:TokenAuthenticator',
+    'v1': 'swiftagent.auth.v1:V1Authenticator',
+    'v2': 'swiftagent.auth.v2:V2Authenticator',
+    'v3': 'swiftagent.auth.v3:V3Authenticator',
+}
+
+
+def resolve(use_line):
+    '''Import and return the authenticator class for a ``use`` line.
+
+    :param use_line: a string of the form ``module:class``, such as
+                     ``swiftagent.auth:v3``
+    :raises ValueError: if ``use_line`` is malformed
+    '''
+    module, delim, cls = use_line.partition(':')
+    if not (module and delim and cls):
+        raise ValueError("'use' must be of the form module:class")
+    if module == __name__ and cls in ALIASES:
+        module, dummy, target = ALIASES[cls].partition(':')
+        resolved = getattr(importlib.import_module(module), target)
+        # Importing the submodule may have shadowed the alias
+        setattr(sys.modules[__name__], cls, resolved)
+        return resolved
+    return getattr(importlib.import_module(module), cls)
+
+
+def __getattr__(name):
+    # Python 3.7+ only; on older Pythons, use resolve()
+    if name in ALIASES:
+        return resolve('%s:%s' % (__name__, name))
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
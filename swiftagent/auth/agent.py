@@ -7,29 +7,54 @@ from swiftagent.auth import base
 from swiftagent import opt
 
 
+DEFAULT_TIMEOUT = 30
+
+
 class AgentAuthenticator(base.BaseAuthenticator):
-    '''Authenticator that can interact with a swift-agent server.'''
+    '''Authenticator that can interact with a swift-agent server.
+
+    By default, this uses the server from the environment, prompting to
+    unlock auth configs if needed. With a ``socket_address``, it uses that
+    server instead and never prompts; this is how one swift-agent forwards
+    to another, and may be used in configs as::
+
+        [auth:prod]
+        use = swiftagent.auth.agent:AgentAuthenticator
+        auth_name = prod
+        socket_address = /run/swift-agent/socket
+    '''
     # agent client will handle password
-    password_required = False
+    requires_password = False
 
-    def __init__(self, config_dict):
-        super(AgentAuthenticator, self).__init__(config_dict)
-        if not client.can_use_swift_agent():
+    def __init__(self, options, check_insecure=None):
+        super(AgentAuthenticator, self).__init__(options, check_insecure)
+        if 'socket_address' not in self.conf and \
+                not client.can_use_swift_agent():
             raise TypeError('AgentAuthenticator requires a running '
                             'swift-agent process')
-        try:
-            self.storage_url, self.token, self.expiry = \
-                client.get_auth(self.conf['auth_name'])
-        except (client.SwiftAgentClientError, base.PasswordRequired):
-            pass   # worth a shot
         self.ever_prompted = False
 
     @classmethod
     def get_opts(cls):
-        return opt.StrOpt('auth_name')
+        return opt.AllOf(
+            opt.StrOpt('auth_name'),
+            opt.Maybe(opt.StrOpt('socket_address')),
+            opt.Maybe(opt.FloatOpt('timeout')),
+        )
 
     def reauth(self):
-        prompted, (storage_url, token, expiry) = client.get_auth_with_unlock(
-            self.conf['auth_name'], reauth=True)
-        self.ever_prompted = self.ever_prompted or prompted
-        return storage_url, token, expiry
+        # An unexpired token means a fresh one was asked for; otherwise,
+        # the server may have refreshed its token already
+        force = not self.token_has_expired
+        auth_name = self.conf['auth_name']
+        if 'socket_address' not in self.conf:
+            prompted, (storage_url, token, expiry) = \
+                client.get_auth_with_unlock(auth_name, reauth=force)
+            self.ever_prompted = self.ever_prompted or prompted
+            return storage_url, token, expiry
+        with client.SwiftAgentClient(
+                self.conf['socket_address'],
+                timeout=self.conf.get('timeout', DEFAULT_TIMEOUT)) as agent:
+            if force:
+                return agent.reauth(auth_name)
+            return agent.auth(auth_name)
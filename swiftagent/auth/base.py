@@ -2,9 +2,15 @@
 Module providing the basics to build an authenticator.
 '''
 import json
+import threading
 import time
 
-import requests
+from six.moves import queue
+
+from swiftagent.auth import health
+from swiftagent import http
+from swiftagent import opt
+from swiftagent import tracing
 
 
 class AuthError(Exception):
@@ -40,6 +46,10 @@ class PasswordRequired(AuthError):
     '''A password is required, but was not supplied'''
 
 
+class CircuitOpen(AuthError):
+    '''The auth backend failed recently; not trying again just yet'''
+
+
 def error_from_response(response, authenticator):
     '''Given a requests response, instantiate an appropriate AuthError.'''
     if response.status_code == 401:
@@ -49,6 +59,10 @@ def error_from_response(response, authenticator):
     return AuthError(authenticator, response.status_code)
 
 
+DEFAULT_TIMEOUT = 10
+DEFAULT_HEDGE_DELAY = 2
+
+
 class BaseAuthenticator(object):
     '''The basic framework of an authenticator.'''
     requires_password = True
@@ -60,6 +74,25 @@ class BaseAuthenticator(object):
         self.expiration_time = None
         self.check_insecure = check_insecure
 
+    @classmethod
+    def get_request_opts(cls):
+        '''Get the options controlling requests to the auth endpoint.'''
+        return (
+            opt.Maybe(opt.FloatOpt('timeout')),
+            opt.Maybe(opt.FloatOpt('hedge_delay')),
+        )
+
+    @classmethod
+    def identity_key(cls, options):
+        '''Get a key identifying the credentials in some options.
+
+        Auth configs with the same identity key may share a single token.
+
+        :param options: the raw options for an auth config
+        :returns: a hashable key, or None if tokens may not be shared
+        '''
+        return None
+
     def should_verify(self, url):
         return not (self.check_insecure and self.check_insecure(url))
 
@@ -71,22 +104,102 @@ class BaseAuthenticator(object):
             return False  # Assume token never expires
         return self.expiration_time < time.time()
 
+    def auth_request(self, method, headers=None, data=None):
+        '''Make a request to the auth endpoint.
+
+        If several ``auth_url`` values are configured, they are tried
+        healthiest and fastest first. If a request has not completed after
+        ``hedge_delay`` seconds (or fails outright), the next endpoint is
+        tried as well; the first non-5xx response wins.
+
+        :param method: the HTTP method to use
+        :param headers: the request headers
+        :param data: the request body
+        :returns: a requests response
+        :raises requests.RequestException: if every endpoint failed
+                                           without responding
+        '''
+        candidates = health.HEALTH.order(
+            self.conf.get('auth_urls') or [self.conf['auth_url']])
+        timeout = self.conf.get('timeout', DEFAULT_TIMEOUT)
+        hedge_delay = self.conf.get('hedge_delay', DEFAULT_HEDGE_DELAY)
+        results = queue.Queue()
+        parent_span = tracing.current()
+
+        def attempt(url):
+            start = time.time()
+            try:
+                with tracing.span('auth.attempt', parent_span, url=url):
+                    resp = http.request(
+                        method, url, headers=headers, data=data,
+                        timeout=timeout, verify=self.should_verify(url))
+            except http.errors() as exc:
+                health.HEALTH.record_failure(url, exc)
+                results.put((None, exc))
+                return
+            if resp.status_code // 100 == 5:
+                health.HEALTH.record_failure(url, resp.status_code)
+            else:
+                health.HEALTH.record_success(url, time.time() - start)
+            results.put((resp, None))
+
+        def next_url():
+            # Skip endpoints whose circuit breakers are open
+            while candidates:
+                url = candidates.pop(0)
+                if health.HEALTH.allow(url):
+                    return url
+            return None
+
+        url = next_url()
+        if url is None:
+            raise CircuitOpen(self, 'All auth endpoints are failing')
+        if not candidates:
+            attempt(url)
+            url = None
+        pending = 1
+        failure = None
+        while url or pending:
+            if url:
+                thread = threading.Thread(target=attempt, args=(url, ))
+                thread.daemon = True
+                thread.start()
+                url = None
+            try:
+                resp, exc = results.get(
+                    timeout=hedge_delay if candidates else None)
+            except queue.Empty:
+                url = next_url()
+                pending += 1 if url else 0
+                continue
+            pending -= 1
+            if exc is None and resp.status_code // 100 != 5:
+                return resp
+            failure = resp, exc
+            # Don't wait out the hedge delay to replace a failed attempt
+            url = next_url()
+            pending += 1 if url else 0
+
+        resp, exc = failure
+        if exc is not None:
+            raise exc
+        return resp
+
     def make_json_request(self, data):
         data = json.dumps(data)
-        resp = requests.post(
-            self.conf['auth_url'],
+        resp = self.auth_request(
+            'POST',
             headers={
                 'Content-Type': 'application/json',
                 'Accept': 'application/json',
             },
-            data=data,
-            timeout=10,
-            verify=self.should_verify(self.conf['auth_url']))
+            data=data)
         if resp.status_code // 100 != 2:
             raise error_from_response(resp, self)
 
         try:
-            resp_data = resp.json()
+            with tracing.span('auth.parse', bytes=len(resp.content)):
+                resp_data = resp.json()
         except ValueError as exc:
             raise AuthError(self, 'Error parsing response: %r' % exc)
         return resp.headers, resp_data
@@ -107,7 +220,9 @@ class BaseAuthenticator(object):
         :returns: a (storage_url, token) pair
         '''
         if self.token_has_expired or force_reauth:
-            self.storage_url, self.token, self.expiration_time = self.reauth()
+            with tracing.span('auth.reauth', auth=type(self).__name__):
+                self.storage_url, self.token, self.expiration_time = \
+                    self.reauth()
         return self.storage_url, self.token, self.expiration_time
 
     def reauth(self):
@@ -116,3 +231,23 @@ class BaseAuthenticator(object):
         :returns: a fresh (storage_url, token, expiration time) triple
         '''
         raise NotImplementedError()
+
+    def dump_state(self):
+        '''Get the cached credentials, so another agent may reuse them.
+
+        :returns: a JSON-serializable dict
+        '''
+        return {
+            'storage_url': self.storage_url,
+            'token': self.token,
+            'expiration_time': self.expiration_time,
+        }
+
+    def load_state(self, state):
+        '''Restore credentials saved with :meth:`dump_state`.
+
+        :param state: a dict returned by :meth:`dump_state`
+        '''
+        self.storage_url = state['storage_url']
+        self.token = state['token']
+        self.expiration_time = state['expiration_time']
@@ -0,0 +1,319 @@
+'''
+Indexed Keystone service catalogs, and authenticators that use them.
+'''
+import itertools
+import logging
+
+from swiftagent.auth import base
+from swiftagent.auth import latency
+from swiftagent import opt
+from swiftagent import tracing
+
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(logging.NullHandler())
+
+V2_INTERFACES = (
+    ('public', 'publicURL'),
+    ('internal', 'internalURL'),
+    ('admin', 'adminURL'),
+)
+
+
+def _v2_endpoints(service):
+    return [(e.get('region'), interface, e[key])
+            for e in service['endpoints']
+            for interface, key in V2_INTERFACES if key in e]
+
+
+def _v3_endpoints(service):
+    return [(e.get('region') or e.get('region_id'), e.get('interface'),
+             e['url'])
+            for e in service['endpoints']]
+
+
+class ServiceCatalog(object):
+    '''A service catalog, indexed by (type, name, region, interface).
+
+    Services are grouped by type up front; endpoints for a type are only
+    parsed and indexed the first time that type is looked up. Every
+    combination of name/region/interface (with ``None`` as a wildcard) is
+    indexed, so any lookup is a single dict access.
+
+    :param raw: the catalog as returned by Keystone
+    :param parse_endpoints: a function to convert a service from the catalog
+                            into a list of ``(region, interface, url)``
+                            tuples
+    '''
+    def __init__(self, raw, parse_endpoints):
+        self.raw = raw
+        self._parse_endpoints = parse_endpoints
+        self._by_type = {}
+        for service in raw:
+            self._by_type.setdefault(service.get('type'), []).append(service)
+        self._indexes = {}
+
+    @classmethod
+    def from_v2(cls, catalog):
+        '''Build a catalog from a v2 ``serviceCatalog``.'''
+        return cls(catalog, _v2_endpoints)
+
+    @classmethod
+    def from_v3(cls, catalog):
+        '''Build a catalog from a v3 ``catalog``.'''
+        return cls(catalog, _v3_endpoints)
+
+    def to_dict(self):
+        '''Get a JSON-serializable form of the catalog.'''
+        version = 'v3' if self._parse_endpoints is _v3_endpoints else 'v2'
+        return {'version': version, 'raw': self.raw}
+
+    @classmethod
+    def from_dict(cls, data):
+        '''Rebuild a catalog saved with :meth:`to_dict`.'''
+        if data['version'] == 'v3':
+            return cls.from_v3(data['raw'])
+        return cls.from_v2(data['raw'])
+
+    @staticmethod
+    def _keys(value):
+        return (None, ) if value is None else (value, None)
+
+    def _index(self, svc_type):
+        index = self._indexes.get(svc_type)
+        if index is not None:
+            return index
+        index = {}
+        services = {}
+        with tracing.span('catalog.index', type=svc_type):
+            for service in self._by_type.get(svc_type, []):
+                name = service.get('name')
+                for svc_key in self._keys(name):
+                    services.setdefault(svc_key, []).append(name)
+                for region, interface, url in self._parse_endpoints(service):
+                    for key in itertools.product(
+                            self._keys(name), self._keys(region),
+                            self._keys(interface)):
+                        index.setdefault(key, []).append(url)
+        index = self._indexes[svc_type] = (index, services)
+        return index
+
+    def services(self, svc_type, name=None):
+        '''Get the names of the services of a type, in catalog order.'''
+        return list(self._index(svc_type)[1].get(name, []))
+
+    def find(self, svc_type, name=None, region=None, interface=None):
+        '''Get the URLs of all matching endpoints, in catalog order.
+
+        Any of ``name``, ``region`` and ``interface`` may be None to match
+        any value.
+        '''
+        return list(self._index(svc_type)[0].get(
+            (name, region, interface), []))
+
+    def select(self, source, svc_type, name=None, region=None,
+               interface=None):
+        '''Select a single endpoint URL.
+
+        With no filters, the first endpoint of the type is returned. With
+        any filter, the service must be unambiguous.
+
+        :param source: the source to use when raising AuthErrors
+        :raises AuthError: if no single endpoint can be selected
+        '''
+        if any(f is not None for f in (name, region, interface)):
+            services = self.services(svc_type, name)
+            if len(services) > 1:
+                raise base.AuthError(
+                    source, 'Multiple services found: %r' % services)
+        urls = self.find(svc_type, name, region, interface)
+        if not urls:
+            raise base.AuthError(source, 'No endpoint found for %r' % (
+                (svc_type, name, region, interface), ))
+        return urls[0]
+
+
+class CatalogAuthenticator(base.BaseAuthenticator):
+    '''Base for authenticators whose responses include a service catalog.
+
+    The catalog is kept alongside the token, so the endpoint selection may
+    be changed without re-authenticating.
+
+    If ``endpoint_selection = latency`` and no region is configured, every
+    candidate endpoint is probed and the one with the lowest RTT is used.
+    RTTs are remembered for ``probe_ttl`` seconds.
+    '''
+    SELECTION_OPTS = ('service_name', 'region', 'interface',
+                      'endpoint_selection', 'probe_ttl')
+    SERVICE_TYPE = 'object-store'
+    default_interface = None
+
+    def __init__(self, options, check_insecure=None):
+        super(CatalogAuthenticator, self).__init__(options, check_insecure)
+        self.catalog = None
+
+    def dump_state(self):
+        state = super(CatalogAuthenticator, self).dump_state()
+        state['selection'] = self.selection
+        if self.catalog is not None:
+            state['catalog'] = self.catalog.to_dict()
+        return state
+
+    def load_state(self, state):
+        super(CatalogAuthenticator, self).load_state(state)
+        for key in self.SELECTION_OPTS:
+            self.conf.pop(key, None)
+        self.conf.update(state.get('selection', {}))
+        if state.get('catalog') is not None:
+            self.catalog = ServiceCatalog.from_dict(state['catalog'])
+
+    @classmethod
+    def get_selection_opts(cls):
+        '''Get the options controlling endpoint selection.'''
+        return (
+            opt.Maybe(opt.StrOpt('service_name')),
+            opt.Maybe(opt.StrOpt('region')),
+            opt.Maybe(opt.StrOpt('interface')),
+            opt.Maybe(opt.StrOpt('endpoint_selection')),
+            opt.Maybe(opt.IntOpt('probe_ttl')),
+        )
+
+    @classmethod
+    def _validate_locked(cls, options):
+        # Validate with a placeholder password so we can compare
+        # configs that haven't been unlocked yet
+        return cls.get_opts().validate(dict(options, password=''))
+
+    @classmethod
+    def identity_key(cls, options):
+        conf = cls._validate_locked(options)
+        ignored = cls.SELECTION_OPTS + ('password', 'timeout', 'hedge_delay')
+        return (cls.__module__, cls.__name__) + tuple(sorted(
+            (k, tuple(v) if isinstance(v, list) else v)
+            for k, v in conf.items() if k not in ignored))
+
+    @classmethod
+    def get_selection(cls, options):
+        '''Get the endpoint selection from some options.'''
+        return {k: options[k] for k in cls.SELECTION_OPTS if options.get(k)}
+
+    @classmethod
+    def config_selection(cls, options):
+        '''Get the endpoint selection from unvalidated config options.'''
+        return cls.get_selection(cls._validate_locked(options))
+
+    @property
+    def identity(self):
+        '''The authenticator that holds the token and catalog.'''
+        return self
+
+    @property
+    def selection(self):
+        '''The configured endpoint selection.'''
+        return self.get_selection(self.conf)
+
+    def endpoint_url(self, selection=None):
+        '''Select a storage URL from the cached catalog.
+
+        :param selection: a dict with any of ``service_name``, ``region``
+                          or ``interface`` to use instead of the configured
+                          selection
+        :raises AuthError: if there is no catalog, or no matching endpoint
+        '''
+        if self.catalog is None:
+            raise base.AuthError(self, 'No catalog; authenticate first')
+        if selection is None:
+            selection = self.conf
+        interface = selection.get('interface')
+        if selection.get('endpoint_selection') == 'latency' and \
+                not selection.get('region'):
+            return self._fastest_endpoint(
+                selection.get('service_name'),
+                interface or self.default_interface or 'public',
+                selection.get('probe_ttl'))
+        if not any(selection.get(k) for k in (
+                'service_name', 'region', 'interface')):
+            LOGGER.info('No service/region/interface specified; '
+                        'returning first endpoint.')
+        elif interface is None:
+            interface = self.default_interface
+        return self.catalog.select(
+            self, self.SERVICE_TYPE, selection.get('service_name'),
+            selection.get('region'), interface)
+
+    def _fastest_endpoint(self, service_name, interface, ttl):
+        urls = self.catalog.find(self.SERVICE_TYPE, service_name, None,
+                                 interface)
+        if not urls:
+            raise base.AuthError(self, 'No endpoint found for %r' % (
+                (self.SERVICE_TYPE, service_name, None, interface), ))
+        if len(set(urls)) == 1:
+            return urls[0]
+        return latency.TRACKER.fastest(urls, ttl, self.should_verify)
+
+    def select_endpoint(self, **selection):
+        '''Change the configured endpoint selection.
+
+        If there is a cached catalog, the storage URL is updated from it
+        without re-authenticating.
+
+        :param selection: new values for any of ``service_name``, ``region``
+                          or ``interface``; None clears a value
+        :returns: the newly-selected storage URL, or None if there is
+                  no cached catalog yet
+        '''
+        for key in self.SELECTION_OPTS:
+            if key in selection:
+                if selection[key] is None:
+                    self.conf.pop(key, None)
+                else:
+                    self.conf[key] = selection[key]
+        if self.catalog is None:
+            return None
+        self.storage_url = self.endpoint_url()
+        return self.storage_url
+
+
+class DerivedAuthenticator(object):
+    '''An authenticator that borrows another's token and catalog.
+
+    Only the endpoint selection differs, so any number of derived
+    authenticators cost a single auth request between them.
+
+    :param identity: the CatalogAuthenticator holding the token
+    :param selection: a dict with any of ``service_name``, ``region`` or
+                      ``interface``; unset values are left unfiltered
+    '''
+    def __init__(self, identity, selection):
+        self.identity = identity
+        self.selection = selection
+
+    @property
+    def conf(self):
+        return self.identity.conf
+
+    @property
+    def token_has_expired(self):
+        return self.identity.token_has_expired
+
+    def should_verify(self, url):
+        return self.identity.should_verify(url)
+
+    def endpoint_url(self, selection=None):
+        return self.identity.endpoint_url(
+            self.selection if selection is None else selection)
+
+    def get_credentials(self, force_reauth=False):
+        '''Get a (potentially cached) set of credentials.
+
+        :returns: a (storage_url, token, expiration time) triple
+        '''
+        dummy, token, expiry = self.identity.get_credentials(force_reauth)
+        return self.endpoint_url(), token, expiry
+
+    def reauth(self):
+        '''Get a fresh set of credentials, refreshing the shared token.
+
+        :returns: a fresh (storage_url, token, expiration time) triple
+        '''
+        return self.get_credentials(force_reauth=True)
@@ -0,0 +1,156 @@
+'''
+Tracking the health and latency of auth endpoints.
+'''
+import threading
+import time
+
+
+class CircuitBreaker(object):
+    '''Fail fast after failures, recovering automatically.
+
+    After a failure, the breaker *opens* for a backoff period that doubles
+    with each consecutive failure. Once that expires, the breaker is
+    *half-open*: a single caller is allowed through as a probe, and its
+    outcome either closes the breaker or re-opens it for longer.
+
+    :param base_backoff: the number of seconds to stay open after the
+                         first failure
+    :param max_backoff: the longest to stay open
+    '''
+    def __init__(self, base_backoff=1, max_backoff=60):
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self.last_error = None
+        self._opened_at = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def backoff(self):
+        '''The length of the current open period, in seconds.'''
+        if not self.failures:
+            return 0
+        return min(self.max_backoff,
+                   self.base_backoff * 2 ** (self.failures - 1))
+
+    @property
+    def retry_after(self):
+        '''The number of seconds until a probe will be allowed.'''
+        return max(0, self._opened_at + self.backoff - time.time())
+
+    @property
+    def is_open(self):
+        '''Whether callers would currently be turned away.'''
+        return bool(self.failures) and (self._probing or self.retry_after > 0)
+
+    def allow(self):
+        '''Check whether a call may go through.
+
+        If the breaker is half-open, this claims the probe; the caller
+        *must* then call one of the ``record_*`` methods.
+        '''
+        with self._lock:
+            if not self.failures:
+                return True
+            if self._probing or self.retry_after > 0:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        '''Record a successful call, closing the breaker.'''
+        with self._lock:
+            self.failures = 0
+            self.last_error = None
+            self._probing = False
+
+    def record_failure(self, error=None):
+        '''Record a failed call, (re-)opening the breaker.'''
+        with self._lock:
+            self.failures += 1
+            self.last_error = error
+            self._opened_at = time.time()
+            self._probing = False
+
+    def record_abandoned(self):
+        '''Record a call that says nothing about the backend's health.'''
+        with self._lock:
+            self._probing = False
+
+
+class EndpointHealth(object):
+    '''Remember how each auth endpoint has been performing.
+
+    Latency is an exponentially-weighted moving average of successful
+    requests. Each endpoint also has a CircuitBreaker, so one that has
+    failed is avoided for a while.
+
+    :param alpha: the weight given to each new latency measurement
+    :param base_backoff: the number of seconds to avoid an endpoint after
+                         its first failure
+    :param max_backoff: the longest to avoid a failing endpoint
+    '''
+    def __init__(self, alpha=0.3, base_backoff=5, max_backoff=300):
+        self.alpha = alpha
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._latencies = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, url):
+        '''Get the CircuitBreaker for an endpoint.'''
+        with self._lock:
+            breaker = self._breakers.get(url)
+            if breaker is None:
+                breaker = self._breakers[url] = CircuitBreaker(
+                    self.base_backoff, self.max_backoff)
+            return breaker
+
+    def record_success(self, url, latency):
+        '''Record a successful request and its latency.'''
+        with self._lock:
+            old = self._latencies.get(url)
+            self._latencies[url] = latency if old is None else \
+                old + self.alpha * (latency - old)
+        self.breaker(url).record_success()
+
+    def record_failure(self, url, error=None):
+        '''Record a failed request.'''
+        self.breaker(url).record_failure(error)
+
+    def allow(self, url):
+        '''Check whether to send a request to an endpoint.
+
+        See :meth:`CircuitBreaker.allow`.
+        '''
+        return self.breaker(url).allow()
+
+    def order(self, urls):
+        '''Sort endpoints: healthy before unhealthy, then fastest first.
+
+        Endpoints with no latency measurement yet go after those with one;
+        otherwise, configured order breaks ties.
+        '''
+        def key(url):
+            latency = self._latencies.get(url)
+            return (self.breaker(url).is_open,
+                    float('inf') if latency is None else latency,
+                    urls.index(url))
+        return sorted(urls, key=key)
+
+    def snapshot(self):
+        '''Get the latency and breaker state of every endpoint.'''
+        with self._lock:
+            breakers = dict(self._breakers)
+            latencies = dict(self._latencies)
+        return {url: {'latency': latencies.get(url),
+                      'failures': breaker.failures,
+                      'retry_after': breaker.retry_after}
+                for url, breaker in breakers.items()}
+
+
+# Shared by all authenticators, so an agent remembers how endpoints
+# performed across auth configs and re-auths
+HEALTH = EndpointHealth()
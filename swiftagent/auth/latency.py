@@ -0,0 +1,103 @@
+'''
+Tracking the latency to storage endpoints, so the nearest can be chosen.
+'''
+import logging
+import threading
+import time
+
+from swiftagent import config
+from swiftagent import http
+from swiftagent import parallel
+
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(logging.NullHandler())
+
+UNREACHABLE = float('inf')
+
+
+class LatencyTracker(object):
+    '''Probe endpoints and remember their round-trip times.
+
+    Measurements are keyed by scheme and netloc, as that's what is probed.
+
+    :param ttl: the default number of seconds a measurement stays valid
+    :param probe_timeout: the number of seconds to wait for a probe
+    '''
+    def __init__(self, ttl=600, probe_timeout=5):
+        self.ttl = ttl
+        self.probe_timeout = probe_timeout
+        self._rtts = {}
+        self._lock = threading.Lock()
+
+    def get(self, url, ttl=None):
+        '''Get the last measured RTT for a URL, if it's still valid.
+
+        :returns: the RTT in seconds, UNREACHABLE, or None
+        '''
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            entry = self._rtts.get(config.scheme_netloc_only(url))
+        if entry is None or entry[1] + ttl < time.time():
+            return None
+        return entry[0]
+
+    def record(self, url, rtt):
+        '''Record an RTT measurement for a URL.'''
+        with self._lock:
+            self._rtts[config.scheme_netloc_only(url)] = (rtt, time.time())
+
+    def probe(self, url, verify=True):
+        '''Measure the RTT to a URL with a request for its /info.
+
+        Any HTTP response counts; only failing to get one is unreachable.
+
+        :returns: the RTT in seconds, or UNREACHABLE
+        '''
+        info_url = config.scheme_netloc_only(url) + '/info'
+        start = time.time()
+        try:
+            http.get(info_url, timeout=self.probe_timeout, verify=verify)
+        except http.errors() as exc:
+            LOGGER.info('Probe of %s failed: %r', info_url, exc)
+            rtt = UNREACHABLE
+        else:
+            rtt = time.time() - start
+        self.record(url, rtt)
+        return rtt
+
+    def fastest(self, urls, ttl=None, should_verify=None):
+        '''Choose the URL with the lowest RTT.
+
+        Any URLs without a valid measurement are probed concurrently.
+        Ties (including every URL being unreachable) go to the earliest.
+
+        :param urls: the candidate URLs, in order of preference
+        :param ttl: the number of seconds a measurement stays valid
+        :param should_verify: a function taking a URL and returning whether
+                              to verify its SSL certificate
+        :returns: one of ``urls``
+        '''
+        rtts = {url: self.get(url, ttl) for url in urls}
+        stale = {config.scheme_netloc_only(url): url
+                 for url, rtt in rtts.items() if rtt is None}
+        if stale:
+            LOGGER.info('Probing %d endpoint(s)', len(stale))
+            probed = parallel.run_parallel(
+                lambda url: self.probe(url, should_verify(url)
+                                       if should_verify else True),
+                stale.values(), self.probe_timeout + 1)
+            for url, rtt, exc in probed:
+                if exc is not None:
+                    self.record(url, UNREACHABLE)
+            rtts = {url: self.get(url, ttl) for url in urls}
+        best = min(urls, key=lambda url: (
+            UNREACHABLE if rtts[url] is None else rtts[url],
+            urls.index(url)))
+        LOGGER.info('Selected %s (RTT %r)', best, rtts[best])
+        return best
+
+
+# Shared by all authenticators, so an agent remembers measurements
+# across auth configs and re-auths
+TRACKER = LatencyTracker()
@@ -1,8 +1,6 @@
 '''
 Authenticator module for Ye Olde v1 auth.
 '''
-import requests
-
 from swiftagent.auth import base
 from swiftagent import opt
 
@@ -12,22 +10,20 @@ class V1Authenticator(base.BaseAuthenticator):
     @classmethod
     def get_opts(cls):
         return opt.AllOf(
-            opt.UrlOpt('auth_url'),
+            opt.UrlListOpt('auth_url'),
             opt.StrOpt('username'),
             opt.StrOpt('password'),
+            *cls.get_request_opts()
         )
 
     def reauth(self):
-        resp = requests.get(
-            self.conf['auth_url'],
+        resp = self.auth_request(
+            'GET',
             headers={
                 'X-Auth-User': self.conf['username'],
                 'X-Auth-Key': self.conf['password'],
-                'Content-Length': 0,
-            },
-            timeout=10,
-            verify=not (self.check_insecure and
-                        self.check_insecure(self.conf['auth_url'])))
+                'Content-Length': '0',
+            })
         if resp.status_code // 100 != 2:
             raise base.error_from_response(resp, self)
         headers = resp.headers
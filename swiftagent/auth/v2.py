@@ -5,6 +5,7 @@ import logging
 import time
 
 from swiftagent.auth import base
+from swiftagent.auth import catalog
 from swiftagent import opt
 
 
@@ -12,20 +13,21 @@ LOGGER = logging.getLogger(__name__)
 LOGGER.addHandler(logging.NullHandler())
 
 
-class V2Authenticator(base.BaseAuthenticator):
+class V2Authenticator(catalog.CatalogAuthenticator):
     '''Authenticator for auth v2 endpoints.'''
+    default_interface = 'public'
+
     @classmethod
     def get_opts(cls):
         return opt.AllOf(
-            opt.UrlOpt('auth_url'),
+            opt.UrlListOpt('auth_url'),
             opt.StrOpt('username'),
             opt.StrOpt('password'),
             opt.OneOf(
                 opt.StrOpt('tenant_id'),
                 opt.StrOpt('tenant_name'),
             ),
-            opt.Maybe(opt.StrOpt('service_name')),
-            opt.Maybe(opt.StrOpt('region')),
+            *(cls.get_selection_opts() + cls.get_request_opts())
         )
 
     def reauth(self):
@@ -50,30 +52,8 @@ class V2Authenticator(base.BaseAuthenticator):
                 expiry = time.mktime(time.strptime(
                     expiry.replace('Z', 'UTC'), '%Y-%m-%dT%H:%M:%S%Z'))
 
-            services = [s for s in resp['access']['serviceCatalog']
-                        if s.get('type') == 'object-store']
-            LOGGER.info('Found services: %r', [s['name'] for s in services])
-
-            if 'service_name' not in self.conf and 'region' not in self.conf:
-                LOGGER.info('No service/region specified; '
-                            'returning first endpoint.')
-                return services[0]['endpoints'][0]['publicURL'], token, expiry
-
-            if 'service_name' in self.conf:
-                services = [s for s in services
-                            if s['name'] == self.conf['service_name']]
-
-            if len(services) > 1:
-                raise base.AuthError(
-                    self, 'Multiple services found: %r' % services)
-
-            endpoints = [e for e in services[0]['endpoints']]
-            LOGGER.info('Found regions: %r', [e['region'] for e in endpoints])
-
-            if 'region' in self.conf:
-                endpoints = [e for e in endpoints
-                             if e['region'] == self.conf['region']]
-
-            return endpoints[0]['publicURL'], token, expiry
+            self.catalog = catalog.ServiceCatalog.from_v2(
+                resp['access']['serviceCatalog'])
+            return self.endpoint_url(), token, expiry
         except (KeyError, TypeError) as exc:
             raise base.AuthError(self, 'Error in response: %r' % exc)
@@ -5,6 +5,7 @@ import logging
 import time
 
 from swiftagent.auth import base
+from swiftagent.auth import catalog
 from swiftagent import opt
 
 
@@ -12,12 +13,12 @@ LOGGER = logging.getLogger(__name__)
 LOGGER.addHandler(logging.NullHandler())
 
 
-class V3Authenticator(base.BaseAuthenticator):
+class V3Authenticator(catalog.CatalogAuthenticator):
     '''Authenticator for auth v3 endpoints.'''
     @classmethod
     def get_opts(cls):
         return opt.AllOf(
-            opt.UrlOpt('auth_url'),
+            opt.UrlListOpt('auth_url'),
             opt.OneOf(
                 opt.StrOpt('user_id'),
                 opt.AllOf(
@@ -29,9 +30,7 @@ class V3Authenticator(base.BaseAuthenticator):
                 ),
             ),
             opt.StrOpt('password'),
-            opt.Maybe(opt.StrOpt('service_name')),
-            opt.Maybe(opt.StrOpt('region')),
-            opt.Maybe(opt.StrOpt('interface')),
+            *(cls.get_selection_opts() + cls.get_request_opts())
         )
         # TODO: figure out scope options
 
@@ -74,36 +73,8 @@ class V3Authenticator(base.BaseAuthenticator):
                 LOGGER.info('Token expires at %s', expiry)
                 expiry = time.mktime(time.strptime(
                     expiry.replace('Z', 'UTC'), '%Y-%m-%dT%H:%M:%S.%f%Z'))
-            services = [s for s in resp['token']['catalog']
-                        if s.get('type') == 'object-store']
-            LOGGER.info('Found services: %r', [s['name'] for s in services])
-
-            if not any(filter in self.conf for filter in (
-                    'service_name', 'region', 'interface')):
-                LOGGER.info('No service/region/interface specified; '
-                            'returning first endpoint.')
-                return services[0]['endpoints'][0]['url'], token, expiry
-
-            if 'service_name' in self.conf:
-                services = [s for s in services
-                            if s['name'] == self.conf['service_name']]
-
-            if len(services) > 1:
-                raise base.AuthError(
-                    self, 'Multiple services found: %r' % services)
-
-            endpoints = [e for e in services[0]['endpoints']]
-            LOGGER.info('Found regions/interfaces: %r', [
-                (e['region'], e['interface']) for e in endpoints])
-
-            if 'region' in self.conf:
-                endpoints = [e for e in endpoints
-                             if e['region'] == self.conf['region']]
-
-            if 'interface' in self.conf:
-                endpoints = [e for e in endpoints
-                             if e['interface'] == self.conf['interface']]
-
-            return endpoints[0]['url'], token, expiry
+            self.catalog = catalog.ServiceCatalog.from_v3(
+                resp['token']['catalog'])
+            return self.endpoint_url(), token, expiry
         except (KeyError, TypeError) as exc:
             raise base.AuthError(self, 'Error in response: %r' % exc)
@@ -1,17 +1,23 @@
 from __future__ import print_function
 from __future__ import unicode_literals
 import argparse
+import json
 import logging
 import os
 import signal
+import socket
 import stat
 import subprocess
 import sys
 import tempfile
+import time
 
 from swiftagent.agent import client
+from swiftagent.agent import comm
 from swiftagent.agent import server
 from swiftagent import io
+from swiftagent import profiling
+from swiftagent import tracing
 
 
 def tolerate(os_err_tuple, func, *args):
@@ -52,6 +58,55 @@ def cleanup():
                  os.rmdir, os.path.dirname(socket_addr))
 
 
+def spawn_daemon(socket_addr, args, agent_out, takeover=False):
+    '''Start a swift-agent server in the background.
+
+    :param socket_addr: the socket the server should listen on
+    :param args: the parsed command-line arguments to pass along
+    :param agent_out: where the server's output should go
+    :param takeover: whether to take over from a server already listening
+                     on ``socket_addr``
+    :returns: the new server's process
+    '''
+    daemon_args = [sys.argv[0], '--daemon', socket_addr]
+    if takeover:
+        daemon_args.append('--takeover')
+    if args.upstream:
+        daemon_args += ['--upstream', os.path.abspath(args.upstream)]
+    if args.shared:
+        daemon_args += ['--shared', '--max-auths', str(args.max_auths),
+                        '--max-infos', str(args.max_infos)]
+    if args.trace:
+        daemon_args += ['--trace', os.path.abspath(args.trace)]
+    if args.record:
+        daemon_args += ['--record', os.path.abspath(args.record)]
+    return subprocess.Popen(daemon_args,
+                            preexec_fn=os.setpgrp,
+                            stdout=agent_out, stderr=agent_out,
+                            stdin=open('/dev/null', 'r'))
+
+
+def wait_for_exit(pid, proc, timeout=10):
+    '''Wait for an old server to exit after handing off to a new one.
+
+    :param pid: the old server's process ID
+    :param proc: the new server's process
+    :param timeout: the most seconds to wait
+    :returns: True if the old server exited while the new one is running
+    '''
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            return False
+        try:
+            os.kill(pid, 0)
+        except OSError:
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@profiling.profileable
 def main(args):
     '''Start or stop a swift-agent server.
 
@@ -65,17 +120,132 @@ def main(args):
     group.add_argument(
         '--stop', action='store_true',
         help='stop the server and clean up the socket')
+    group.add_argument(
+        '--restart', action='store_true',
+        help='replace the running server with a new one (after an '
+             'upgrade, say) without dropping connections or caches')
     group.add_argument(
         '--debug', action='store_true',
         help='log debugging information to ${HOME}/.swift-agent.log')
+    group.add_argument(
+        '--stats', nargs='?', const='json', choices=('json', 'prometheus'),
+        help='print the running server\'s metrics, as JSON (the default) '
+             'or in the Prometheus text format')
+    group.add_argument(
+        '--profile-start', choices=profiling.MODES, metavar='MODE',
+        help='start profiling the running server, with "cprofile" or a '
+             'low-overhead stack "sample"r')
+    group.add_argument(
+        '--profile-stop', nargs='?', const='', metavar='FILE',
+        help='stop profiling the running server and write the results to '
+             'FILE (by default, a file next to its socket)')
+    parser.add_argument(
+        '--takeover', action='store_true',
+        help='with --daemon, take over the socket and caches of the '
+             'server already listening on SOCKET_ADDR')
+    parser.add_argument(
+        '--shared', action='store_true',
+        help='serve every user on this host from one server, with '
+             'separate caches for each user; needs --daemon with a '
+             'socket other users can reach, as swift-agent.socket uses')
+    parser.add_argument(
+        '--upstream', metavar='SOCKET',
+        help='forward to the swift-agent listening on SOCKET for auth '
+             'configs not defined locally, caching what it returns')
+    parser.add_argument(
+        '--max-auths', type=int, default=32, metavar='N',
+        help='with --shared, the most auth configs to cache per user')
+    parser.add_argument(
+        '--max-infos', type=int, default=64, metavar='N',
+        help='with --shared, the most clusters\' /info to cache per user')
+    parser.add_argument(
+        '--trace', metavar='FILE',
+        help='append timing spans for each request to FILE, as JSON lines')
+    parser.add_argument(
+        '--record', metavar='FILE',
+        help='append each request (with passwords redacted) to FILE, for '
+             'replaying with bench.replay')
+    parser.add_argument(
+        '--profile', metavar='FILE',
+        help='profile this command with cProfile, writing the stats to FILE')
     args = parser.parse_args(args[1:])
+    if args.shared and args.upstream:
+        # The upstream agent would see every user as this agent's user
+        parser.error('a shared server can\'t forward to an upstream one')
+    if args.shared and not (args.socket_addr or args.restart):
+        # Background servers listen in a private temporary directory
+        parser.error('a shared server needs --daemon SOCKET_ADDR')
+    if args.shared and not hasattr(socket, 'SO_PEERCRED'):
+        parser.error('a shared server isn\'t supported on this platform')
+
+    if args.stats or args.profile_start or args.profile_stop is not None:
+        sock = os.environ.get(client.SOCKET_ENV_VAR)
+        if not sock:
+            parser.error('no swift-agent server is running')
+        with client.SwiftAgentClient(sock) as agent_client:
+            if args.profile_start:
+                agent_client.profile_start(args.profile_start)
+                return
+            if args.profile_stop is not None:
+                print(agent_client.profile_stop(
+                    os.path.abspath(args.profile_stop)
+                    if args.profile_stop else None))
+                return
+            stats = agent_client.stats(args.stats)
+        if args.stats == 'json':
+            stats = json.dumps(stats, indent=2, sort_keys=True)
+        print(stats.rstrip('\n'))
+        return
 
     if args.socket_addr:
         logging.basicConfig(level=logging.DEBUG)
-        server.SwiftAgentServer(args.socket_addr).run()
+        if args.trace:
+            tracing.set_sink(tracing.JsonLinesExporter(args.trace))
+        recorder = comm.Recorder(args.record) if args.record else None
+        cls, kwargs = server.SwiftAgentServer, {}
+        if args.upstream:
+            kwargs = {'upstream': args.upstream}
+        if args.shared:
+            cls = server.SharedSwiftAgentServer
+            kwargs = {'max_auths': args.max_auths,
+                      'max_infos': args.max_infos}
+        if args.takeover:
+            agent = cls.take_over(args.socket_addr, recorder, **kwargs)
+        else:
+            # Under systemd socket activation, the socket already exists
+            agent = cls(args.socket_addr, recorder,
+                        sock=comm.inherited_socket(), **kwargs)
+        agent.run()
+        return
+
+    if args.restart:
+        socket_addr = os.environ.get(client.SOCKET_ENV_VAR)
+        if not socket_addr:
+            parser.error('no swift-agent server is running')
+        # Keep serving the way the running server does, so its caches
+        # carry over
+        with client.SwiftAgentClient(socket_addr) as agent_client:
+            running = agent_client.describe()
+        if 'mode' in running:
+            args.shared = running['mode'] == server.SharedSwiftAgentServer.MODE
+        if 'upstream' in running:
+            args.upstream = running['upstream'] or None
+        if args.shared and args.upstream:
+            parser.error('a shared server can\'t forward to an upstream one')
+        with open('/dev/null', 'w') as agent_out:
+            proc = spawn_daemon(socket_addr, args, agent_out, takeover=True)
+        old_pid = os.environ.get(client.PROCESS_ID_ENV_VAR)
+        if old_pid and not wait_for_exit(int(old_pid), proc):
+            parser.exit(1, 'swift-agent: restart failed; the old server '
+                           'is still running\n')
+        io.export({client.SOCKET_ENV_VAR: socket_addr,
+                   client.PROCESS_ID_ENV_VAR: proc.pid})
         return
 
-    cleanup()
+    # When forwarding to the current server, leave it running
+    if not (args.upstream and os.path.abspath(args.upstream) ==
+            os.path.abspath(os.environ.get(client.SOCKET_ENV_VAR, ''))):
+        cleanup()
     if args.stop:
         io.export({client.SOCKET_ENV_VAR: None,
                    client.PROCESS_ID_ENV_VAR: None})
@@ -89,9 +259,6 @@ def main(args):
         agent_out = open('/dev/null', 'w')
 
     socket_addr = os.path.join(tempfile.mkdtemp(), 'socket')
-    pid = subprocess.Popen([sys.argv[0], '--daemon', socket_addr],
-                           preexec_fn=os.setpgrp,
-                           stdout=agent_out, stderr=agent_out,
-                           stdin=open('/dev/null', 'r')).pid
+    pid = spawn_daemon(socket_addr, args, agent_out).pid
     io.export({client.SOCKET_ENV_VAR: socket_addr,
                client.PROCESS_ID_ENV_VAR: pid})
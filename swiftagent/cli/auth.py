@@ -1,31 +1,127 @@
 from __future__ import print_function
 
 import argparse
+import fnmatch
 import getpass
+import json
 import logging
 import os
+import sys
 
 from swiftagent.agent import client
 from swiftagent.auth import agent
 from swiftagent.auth import base
+from swiftagent.auth.token import TokenAuthenticator
 from swiftagent import config
 from swiftagent import io
 from swiftagent import models
+from swiftagent import parallel
+from swiftagent import profiling
 
 
+EXPORT_VARS = ('OS_STORAGE_URL', 'OS_AUTH_TOKEN', 'OS_AUTH_TOKEN_EXPIRES')
+
+
+def expand_auths(conf, patterns):
+    '''Expand glob patterns against the available auth configs.
+
+    Patterns that aren't globs are passed through as-is, so derived auth
+    names like ``name@region`` still work.
+
+    :param conf: the SwiftConfig to use
+    :param patterns: a list of auth names or glob patterns
+    :returns: a list of auth names, without duplicates
+    '''
+    auths = []
+    for pattern in patterns:
+        if any(c in pattern for c in '*?['):
+            matches = sorted(fnmatch.filter(conf.available_auths, pattern))
+            if not matches:
+                logging.warning('No auth endpoints match %s', pattern)
+        else:
+            matches = [pattern]
+        auths.extend(a for a in matches if a not in auths)
+    return auths
+
+
+def authenticate(conf, auth, verify, password=None):
+    '''Get credentials for an auth config without prompting.
+
+    :param conf: the SwiftConfig to use
+    :param auth: the auth config to use
+    :param verify: whether to verify a token received from a swift-agent
+    :param password: the password to use, if we have one
+    :returns: a (storage_url, token, expiry) triple
+    :raises PasswordRequired: if a password is needed
+    '''
+    if not client.can_use_swift_agent():
+        return conf.get_auth(auth, password, prompt=False).get_credentials()
+
+    sock = os.environ[client.SOCKET_ENV_VAR]
+    with client.SwiftAgentClient(sock) as agent_client:
+        if password is not None:
+            agent_client.unlock(auth, password)
+        creds = agent_client.auth(auth)
+    if verify:
+        authenticator = TokenAuthenticator({
+            'storage_url': creds[0], 'auth_token': creds[1]})
+        try:
+            models.Cluster(authenticator).default_account.info()
+        except base.Unauthorized:
+            with client.SwiftAgentClient(sock) as agent_client:
+                creds = agent_client.reauth(auth)
+    return creds
+
+
+def authenticate_many(conf, auths, verify):
+    '''Get credentials for several auth configs concurrently.
+
+    Any that need a password are then prompted for one at a time (if
+    there is an interactive shell).
+
+    :param conf: the SwiftConfig to use
+    :param auths: the auth configs to use
+    :param verify: a function taking an auth name and returning whether
+                   to verify a token received from a swift-agent
+    :returns: a dict of auth name to either a (storage_url, token, expiry)
+              triple or an exception
+    '''
+    results = {}
+    for auth, creds, exc in parallel.run_parallel(
+            lambda auth: authenticate(conf, auth, verify(auth)), auths):
+        results[auth] = exc or creds
+
+    for auth in auths:
+        if not isinstance(results[auth], base.PasswordRequired) or \
+                not sys.stdin.isatty():
+            continue
+        password = getpass.getpass('Password for %s: ' % auth)
+        try:
+            results[auth] = authenticate(conf, auth, verify(auth), password)
+        except Exception as exc:  # pylint: disable=broad-except
+            results[auth] = exc
+    return results
+
+
+@profiling.profileable
 def main(args):
     '''Get a storage URL and auth token for a Swift cluster.
 
     If a swift-agent server seems to be running, that will be used
-    to authenticate.
+    to authenticate. If several auth endpoints (or glob patterns) are
+    given, they are authenticated concurrently and the exported variables
+    are suffixed with each auth name.
     '''
     parser = argparse.ArgumentParser(description=main.__doc__)
     parser.add_argument(
         '--debug', action='store_true',
         help='include debugging information')
     parser.add_argument(
-        'auth', default=None, nargs='?',
-        help='the auth endpoint to use')
+        'auth', nargs='*',
+        help='the auth endpoint(s) to use; may be glob patterns')
+    parser.add_argument(
+        '--json', action='store_true',
+        help='print credentials as JSON rather than export lines')
     parser.add_argument(
         '--verify', action='store_true', default=None,
         help='verify the token is still valid if received from '
@@ -33,6 +129,9 @@ def main(args):
     parser.add_argument(
         '--no-verify', action='store_false', dest='verify',
         help='skip token verification')
+    parser.add_argument(
+        '--profile', metavar='FILE',
+        help='profile this command with cProfile, writing the stats to FILE')
     args = parser.parse_args(args[1:])
 
     if args.debug:
@@ -42,23 +141,47 @@ def main(args):
 
     conf = config.SwiftConfig()
 
-    auth = args.auth or conf.default_auth
-    if not auth:
+    if args.auth:
+        auths = expand_auths(conf, args.auth)
+    else:
+        auths = [conf.default_auth] if conf.default_auth else []
+    if not auths:
         logging.error('No auth endpoint specified, and no default defined')
         return
 
+    def verify(auth):
+        if args.verify is None:
+            return conf.get_default_verify(auth.partition('@')[0])
+        return args.verify
+
+    if len(auths) > 1 or args.json:
+        results = authenticate_many(conf, auths, verify)
+        if args.json:
+            print(json.dumps({
+                auth: {'error': repr(result)}
+                if isinstance(result, Exception) else
+                dict(zip(('storage_url', 'token', 'expires'), result))
+                for auth, result in results.items()}, indent=2,
+                sort_keys=True))
+            return
+        to_export = {}
+        for auth, result in results.items():
+            if isinstance(result, Exception):
+                logging.error('Failed to authenticate %s: %r', auth, result)
+                result = (None, None, None)
+            to_export.update((io.env_name(var, auth), value)
+                             for var, value in zip(EXPORT_VARS, result))
+        io.export(to_export)
+        return
+
+    auth = auths[0]
     if client.can_use_swift_agent():
         authenticator = agent.AgentAuthenticator({'auth_name': auth})
     else:
         authenticator = conf.get_auth(auth)
     storage_url, token, expiry = authenticator.get_credentials()
 
-    if args.verify is None:
-        verify = conf.get_default_verify(auth)
-    else:
-        verify = args.verify
-
-    if verify and client.can_use_swift_agent():
+    if verify(auth) and client.can_use_swift_agent():
         try:
             models.Cluster(authenticator).default_account.info()
         except base.Unauthorized:
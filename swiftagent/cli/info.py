@@ -4,33 +4,136 @@ import argparse
 import json
 import logging
 import os
+import time
 
 from swiftagent.agent import client
-from swiftagent import auth
+from swiftagent.auth.token import NoAuthAuthenticator
+from swiftagent.cli import auth as cli_auth
 from swiftagent import config
 from swiftagent import models
+from swiftagent import parallel
+from swiftagent import profiling
 
 
+# Keys that are expected to differ between clusters
+IGNORED_KEYS = ('timestamp', )
+
+
+def flatten(info, prefix=''):
+    '''Flatten nested dicts into a single dict with dotted keys.
+
+    :param info: the dict to flatten
+    :param prefix: the prefix for all keys
+    '''
+    flat = {}
+    for key, value in info.items():
+        if isinstance(value, dict) and value:
+            flat.update(flatten(value, '%s%s.' % (prefix, key)))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+
+def diff(infos):
+    '''Find the keys whose values differ between clusters.
+
+    :param infos: a dict mapping cluster names to /info results
+    :returns: a dict mapping each differing dotted key to a dict of
+              cluster names to values (missing values are omitted)
+    '''
+    flat = {name: flatten(info) for name, info in infos.items()}
+    keys = set(k for f in flat.values() for k in f
+               if k.split('.')[-1] not in IGNORED_KEYS)
+    result = {}
+    for key in keys:
+        values = {name: f[key] for name, f in flat.items() if key in f}
+        if len(values) != len(flat) or len(set(
+                json.dumps(v, sort_keys=True) for v in values.values())) > 1:
+            result[key] = values
+    return result
+
+
+def print_table(infos, latencies):
+    '''Print /info results side-by-side, marking rows that differ with "*".
+
+    :param infos: a dict mapping cluster names to /info results
+    :param latencies: a dict mapping cluster names to fetch latencies
+    '''
+    names = sorted(infos)
+    flat = {name: flatten(infos[name]) for name in names}
+    differing = diff(infos)
+    rows = [('', 'latency') + tuple(
+        '%.1fms' % (latencies[name] * 1000) for name in names)]
+    for key in sorted(set(k for f in flat.values() for k in f)):
+        rows.append(('*' if key in differing else '', key) + tuple(
+            json.dumps(flat[name][key]) if key in flat[name] else '-'
+            for name in names))
+    header = ('', '') + tuple(names)
+    widths = [max(len(row[i]) for row in rows + [header])
+              for i in range(len(header))]
+    for row in [header] + rows:
+        print('  '.join(cell.ljust(width)
+                        for cell, width in zip(row, widths)).rstrip())
+
+
+def fetch_infos(urls, refresh=False):
+    '''Fetch the capabilities of several clusters concurrently.
+
+    :param urls: a dict mapping cluster names to URLs
+    :param refresh: if using a swift-agent server, force fresh responses
+    :returns: a dict mapping cluster names to dicts with either ``info``
+              and ``elapsed`` keys, or an ``error`` key
+    '''
+    if client.can_use_swift_agent():
+        sock = os.environ[client.SOCKET_ENV_VAR]
+        # Responses may be large, so use the framed protocol if possible
+        with client.SwiftAgentClient(sock, framed=True) as agent_client:
+            if refresh:
+                for url in urls.values():
+                    agent_client.purge(config.scheme_netloc_only(url))
+            by_url = agent_client.infos(list(urls.values()))
+        return {name: by_url[url] for name, url in urls.items()}
+
+    def fetch(name):
+        start = time.time()
+        authenticator = NoAuthAuthenticator({'storage_url': urls[name]})
+        info = models.Cluster(authenticator).info()
+        return {'info': info, 'elapsed': time.time() - start}
+
+    return {name: {'error': repr(exc)} if exc else result
+            for name, result, exc in parallel.run_parallel(fetch, urls)}
+
+
+@profiling.profileable
 def main(args):
-    '''Get information about the capabilities of a Swift cluster.
+    '''Get information about the capabilities of Swift clusters.
 
     If a swift-agent server seems to be running, that will be used
-    to cache responses.
+    to cache responses. If several clusters are given, they are fetched
+    concurrently and compared.
     '''
     parser = argparse.ArgumentParser(description=main.__doc__)
     parser.add_argument(
         '--debug', action='store_true',
         help='include debugging information')
-    group = parser.add_mutually_exclusive_group()
-    group.add_argument(
-        'url', default=None, nargs='?',
+    parser.add_argument(
+        'url', nargs='*',
         help='the url of the Swift cluster whose capabilities you want to get')
-    group.add_argument(
-        '--auth', help='the auth endpoint to use')
+    parser.add_argument(
+        '--auth', action='append', default=[],
+        help='the auth endpoint to use; may be repeated or a glob pattern')
     parser.add_argument(
         '--refresh', action='store_true',
         help='if using a swift-agent server, force a fresh response '
              'from the cluster')
+    parser.add_argument(
+        '--format', choices=('json', 'table', 'diff'), default=None,
+        help='how to display the results: the full JSON for each cluster, '
+             'a side-by-side table, or JSON of just the differing keys '
+             '(default: json for one cluster, table for several)')
+    parser.add_argument(
+        '--profile', metavar='FILE',
+        help='profile this command with cProfile, writing the stats to FILE')
     args = parser.parse_args(args[1:])
 
     if args.debug:
@@ -38,28 +141,43 @@ def main(args):
     else:
         logging.basicConfig(level=logging.WARNING)
 
-    if args.url:
-        url = args.url
-    else:
+    urls = {url: url for url in args.url}
+    if args.auth or not urls:
         conf = config.SwiftConfig()
-        authenticator = args.auth or conf.default_auth
-        if not authenticator:
+        auths = cli_auth.expand_auths(conf, args.auth) if args.auth else \
+            [conf.default_auth] if conf.default_auth else []
+        if not auths and not urls:
             logging.error('No auth endpoint specified, and no default defined')
             return
+        results = cli_auth.authenticate_many(conf, auths, lambda a: False)
+        for name, result in results.items():
+            if isinstance(result, Exception):
+                logging.error('Failed to authenticate %s: %r', name, result)
+            else:
+                urls[name] = result[0]
 
-        if client.can_use_swift_agent():
-            dummy, (url, dummy) = client.get_auth_with_unlock(authenticator)
-        else:
-            url, dummy = conf.get_auth(authenticator).get_credentials()
+    results = fetch_infos(urls, args.refresh)
+    infos = {}
+    latencies = {}
+    for name, result in sorted(results.items()):
+        if 'error' in result:
+            logging.error('Failed to get info for %s: %s',
+                          name, result['error'])
+            continue
+        infos[name] = result['info']
+        latencies[name] = result['elapsed']
+        logging.info('Fetched info for %s in %.1fms%s', name,
+                     result['elapsed'] * 1000,
+                     ' (cached)' if result.get('cached') else '')
 
-    if client.can_use_swift_agent():
-        sock = os.environ[client.SOCKET_ENV_VAR]
-        with client.SwiftAgentClient(sock) as agent_client:
-            if args.refresh:
-                info = agent_client.reinfo(url)
-            else:
-                info = agent_client.info(url)
+    fmt = args.format or ('json' if len(urls) == 1 else 'table')
+    if fmt == 'table':
+        print_table(infos, latencies)
+    elif fmt == 'diff':
+        print(json.dumps({'latency': latencies, 'differences': diff(infos)},
+                         indent=2, sort_keys=True))
+    elif len(urls) == 1:
+        print(json.dumps(next(iter(infos.values()), {}),
+                         indent=2, sort_keys=True))
     else:
-        info = models.Cluster(auth.noauth({'storage_url': url})).info()
-    # TODO: consider ways to format this better/more meaningfully
-    print(json.dumps(info, indent=2, sort_keys=True))
+        print(json.dumps(infos, indent=2, sort_keys=True))
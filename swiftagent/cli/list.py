@@ -1,16 +1,159 @@
 from __future__ import print_function
 
 import argparse
+import json
 import logging
+import os
+import socket
+import ssl
+import time
 
+from six.moves import http_client
+from six.moves import urllib
+
+from swiftagent.agent import client
 from swiftagent import config
+from swiftagent import parallel
+from swiftagent import profiling
+
+
+def probe_url(url, timeout, verify=True):
+    '''Time connecting to a URL and making a HEAD request to it.
+
+    :param url: the absolute URL to probe
+    :param timeout: the socket timeout, in seconds
+    :param verify: whether to verify the server's SSL certificate
+    :returns: a dict with ``connect``, ``tls`` (for https) and ``http``
+              times in seconds, and the HTTP ``status``
+    '''
+    parts = urllib.parse.urlparse(url)
+    is_https = parts.scheme == 'https'
+    port = parts.port or (443 if is_https else 80)
+    result = {}
+
+    start = time.time()
+    sock = socket.create_connection((parts.hostname, port), timeout)
+    result['connect'] = time.time() - start
+    try:
+        if is_https:
+            context = ssl.create_default_context()
+            if not verify:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            start = time.time()
+            sock = context.wrap_socket(sock, server_hostname=parts.hostname)
+            result['tls'] = time.time() - start
+
+        conn = http_client.HTTPConnection(parts.hostname, port,
+                                          timeout=timeout)
+        conn.sock = sock
+        start = time.time()
+        conn.request('HEAD', parts.path or '/')
+        result['status'] = conn.getresponse().status
+        result['http'] = time.time() - start
+    finally:
+        sock.close()
+    return result
+
+
+def probe(conf, deadline):
+    '''Probe every configured auth and storage URL concurrently.
+
+    :param conf: the SwiftConfig to use
+    :param deadline: the number of seconds to wait for all probes
+    :returns: a dict mapping auth names to dicts with ``token`` (the
+              agent's cached token state, if there is an agent) and
+              ``urls`` (a list of probe results) keys
+    '''
+    end = time.time() + deadline
+    report = {}
+    targets = []
+    for auth in conf.available_auths:
+        options = conf.get_auth_options(auth)
+        report[auth] = {'urls': []}
+        for url in options.get('auth_url', '').split():
+            targets.append((auth, 'auth', url))
+        if options.get('storage_url'):
+            targets.append((auth, 'storage', options['storage_url']))
 
+    if client.can_use_swift_agent():
+        sock = os.environ[client.SOCKET_ENV_VAR]
 
+        def peek(auth):
+            with client.SwiftAgentClient(sock) as agent_client:
+                return agent_client.peek(auth)
+
+        for auth, state, exc in parallel.run_parallel(
+                peek, report, deadline):
+            if exc:
+                state = {'error': repr(exc)}
+            elif state.get('expires') is not None:
+                state['ttl'] = state['expires'] - time.time()
+            report[auth]['token'] = state
+            if state.get('storage_url') and not any(
+                    t[0] == auth and t[1] == 'storage' for t in targets):
+                targets.append((auth, 'storage', state['storage_url']))
+
+    def run(target):
+        dummy, dummy, url = target
+        return probe_url(url, max(0.1, end - time.time()),
+                         not conf.check_insecure(url))
+
+    for (auth, kind, url), result, exc in parallel.run_parallel(
+            run, targets, max(0, end - time.time())):
+        if exc:
+            result = {'error': repr(exc)}
+        result.update({'kind': kind, 'url': url})
+        report[auth]['urls'].append(result)
+    return report
+
+
+def print_report(report):
+    '''Print a probe report as a table.'''
+    def ms(value):
+        return '-' if value is None else '%.1fms' % (value * 1000)
+
+    for auth in sorted(report):
+        token = report[auth].get('token')
+        if token is None:
+            token_desc = ''
+        elif 'error' in token:
+            token_desc = 'agent error: %s' % token['error']
+        elif not token['cached']:
+            token_desc = 'no cached token'
+        elif token.get('ttl') is None:
+            token_desc = 'cached token'
+        else:
+            token_desc = 'cached token, %ds left' % token['ttl']
+        print('%-20s %s' % (auth, token_desc))
+        for result in report[auth]['urls']:
+            if 'error' in result:
+                timings = 'ERROR %s' % result['error']
+            else:
+                timings = 'tcp %-9s tls %-9s http %-9s %s' % (
+                    ms(result['connect']), ms(result.get('tls')),
+                    ms(result['http']), result['status'])
+            print('  %-8s %-50s %s' % (result['kind'], result['url'],
+                                       timings))
+
+
+@profiling.profileable
 def main(args):
     '''List the available auth endpoints and their auth URLs.'''
     parser = argparse.ArgumentParser(description=main.__doc__)
     parser.add_argument('--debug', action='store_true',
                         help='include debugging information')
+    parser.add_argument('--probe', action='store_true',
+                        help='check every auth and storage URL concurrently '
+                             'and report connection and request latencies')
+    parser.add_argument('--deadline', type=float, default=10,
+                        help='with --probe, the number of seconds to wait '
+                             'for all checks (default: 10)')
+    parser.add_argument('--json', action='store_true',
+                        help='with --probe, print the report as JSON')
+    parser.add_argument(
+        '--profile', metavar='FILE',
+        help='profile this command with cProfile, writing the stats to FILE')
     args = parser.parse_args(args[1:])
 
     if args.debug:
@@ -20,5 +163,13 @@ def main(args):
 
     conf = config.SwiftConfig()
 
+    if args.probe:
+        report = probe(conf, args.deadline)
+        if args.json:
+            print(json.dumps(report, indent=2, sort_keys=True))
+        else:
+            print_report(report)
+        return
+
     for auth, url in conf.available_auths.items():
         print('%-20s %s' % (auth, url or '(no auth)'))
@@ -1,12 +1,16 @@
+import errno
 import getpass
-import importlib
+import hashlib
+import json
 import logging
 import os
 import sys
+import tempfile
 
 from six.moves import configparser
 from six.moves import urllib
 
+from swiftagent import auth
 from swiftagent.auth import base
 
 
@@ -61,6 +65,158 @@ CONFIGS = [
 if 'SWIFT_AGENT_CONF' in os.environ:
     CONFIGS.append(os.environ['SWIFT_AGENT_CONF'])
 
+SNAPSHOT_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+    'swiftagent')
+SNAPSHOT_VERSION = 1
+
+
+def _signature(path):
+    '''Get the (mtime, size) of a config file, or None if unreadable.'''
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if not os.access(path, os.R_OK):
+        return None
+    return [stat.st_mtime, stat.st_size]
+
+
+class ConfigSnapshot(object):
+    '''A parsed, indexed copy of the config files.
+
+    Snapshots are plain data, so they can be cached as JSON and loaded with
+    a single read. Each records the mtime and size of every source file it
+    was built from, so a stale snapshot is detected with a stat per file.
+
+    :param data: a dict, as returned by :meth:`parse`
+    '''
+    def __init__(self, data):
+        self.data = data
+        self.sources = [tuple(source) for source in data['sources']]
+        self.defaults = data['defaults']
+        self.sections = data['sections']
+        self.auths = data['auths']
+        self.default_auth = data['default_auth']
+
+    @classmethod
+    def parse(cls, paths):
+        '''Build a snapshot by parsing some config files.
+
+        :param paths: the config files to read, lowest priority first
+        '''
+        # Stat before reading, so a file that changes while we parse it
+        # leaves us with a snapshot that's already stale
+        sources = [(path, _signature(path)) for path in paths]
+        parser = DefaultingConfigParser()
+        LOGGER.info('Read configs: %r', parser.read(paths))
+        sections = {name: dict(parser.items(name))
+                    for name in parser.sections()}
+        auths = {name[5:]: options.get('auth_url')
+                 for name, options in sections.items()
+                 if name.startswith('auth:')}
+        default_auth = parser.defaults().get('auth')
+        if default_auth is None and len(auths) == 1:
+            default_auth = next(iter(auths))
+        return cls({
+            'version': SNAPSHOT_VERSION,
+            'sources': sources,
+            'defaults': dict(parser.defaults()),
+            'sections': sections,
+            'auths': auths,
+            'default_auth': default_auth,
+        })
+
+    @classmethod
+    def cache_path(cls, paths):
+        '''Get the snapshot cache file for a list of config files.'''
+        key = '\0'.join(os.path.abspath(p) for p in paths)
+        return os.path.join(SNAPSHOT_DIR, 'config-%s.json' % hashlib.sha1(
+            key.encode('utf-8')).hexdigest())
+
+    @classmethod
+    def load(cls, paths):
+        '''Load a cached snapshot, re-parsing the configs if it's stale.
+
+        Snapshots may include passwords, so the cache file is only
+        readable by the current user.
+
+        :param paths: the config files to read, lowest priority first
+        '''
+        cache_path = cls.cache_path(paths)
+        try:
+            with open(cache_path) as fp:
+                snapshot = cls(json.load(fp))
+            if snapshot.data['version'] == SNAPSHOT_VERSION and \
+                    not snapshot.is_stale(paths):
+                return snapshot
+        except (IOError, OSError, ValueError, KeyError, TypeError) as exc:
+            LOGGER.debug('Could not load config snapshot %s: %r',
+                         cache_path, exc)
+
+        snapshot = cls.parse(paths)
+        try:
+            snapshot.save(cache_path)
+        except (IOError, OSError) as exc:
+            LOGGER.debug('Could not save config snapshot %s: %r',
+                         cache_path, exc)
+        return snapshot
+
+    def save(self, cache_path):
+        '''Atomically write the snapshot to a cache file.'''
+        directory = os.path.dirname(cache_path)
+        try:
+            os.makedirs(directory, 0o700)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.config-')
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(self.data, fp)
+            os.rename(tmp_path, cache_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def is_stale(self, paths=None):
+        '''Check whether any source file has changed since the snapshot.
+
+        :param paths: if given, also treat the snapshot as stale if it was
+                      built from a different list of files
+        '''
+        if paths is not None and [s[0] for s in self.sources] != list(paths):
+            return True
+        return any(_signature(path) != signature
+                   for path, signature in self.sources)
+
+    def changed_sections(self, other):
+        '''Get the names of sections that differ from another snapshot.
+
+        Sections that were added or removed are included. Since sections
+        include the ``[DEFAULT]`` options, changing a default changes
+        every section.
+        '''
+        return {name for name in set(self.sections) | set(other.sections)
+                if self.sections.get(name) != other.sections.get(name)}
+
+    def get(self, section, option, default=None):
+        '''Get an option's value, or a default if it's not set.'''
+        return self.sections.get(section, {}).get(option, default)
+
+    def getboolean(self, section, option, default=None):
+        '''Get an option's boolean value, or a default if it's not set.
+
+        :raises ValueError: if the value isn't a recognized boolean
+        '''
+        value = self.get(section, option)
+        if value is None:
+            return default
+        try:
+            return configparser.RawConfigParser.BOOLEAN_STATES[value.lower()]
+        except KeyError:
+            raise ValueError('Not a boolean: %s' % value)
+
 
 class SwiftConfig(object):
     '''Configuration object to manage access to Swift clusters.
@@ -72,41 +228,31 @@ class SwiftConfig(object):
       * ${PWD}/swiftagent.conf
       * ${SWIFT_AGENT_CONF}
 
+    Parsed configs are cached as a :class:`ConfigSnapshot`, which is only
+    rebuilt when one of the files changes.
+
     See also: etc/swiftagent.conf-example
     '''
     def __init__(self):
-        self.conf = DefaultingConfigParser()
-        configs = self.conf.read(CONFIGS)
-        LOGGER.info('Read configs: %r', configs)
-        self._mtimes = {
-            p: os.path.getmtime(p) if p in configs else None
-            for p in CONFIGS}
-
-        if self.conf.has_section('insecure'):
-            self.insecure_servers = self.conf.get('insecure', 'servers', '')
-            self.insecure_auth = self.conf.get('insecure', 'auth', '')
-        else:
-            self.insecure_servers = ''
-            self.insecure_auth = ''
-        self.insecure_servers = {scheme_netloc_only(server)
-                                 for server in self.insecure_servers.split()}
-        self.insecure_auth = self.insecure_auth.split()
+        self.snapshot = ConfigSnapshot.load(CONFIGS)
+        self._conf = None
+
+        self.insecure_servers = {
+            scheme_netloc_only(server) for server in
+            self.snapshot.get('insecure', 'servers', '').split()}
+        self.insecure_auth = \
+            self.snapshot.get('insecure', 'auth', '').split()
+
+    @property
+    def conf(self):
+        '''A DefaultingConfigParser for the configs, parsed on demand.'''
+        if self._conf is None:
+            self._conf = DefaultingConfigParser()
+            self._conf.read([p for p, dummy in self.snapshot.sources])
+        return self._conf
 
     def needs_reload(self):
-        for path, mtime in self._mtimes.items():
-            if mtime is None:
-                if os.access(path, os.R_OK):
-                    # couldn't read it before, but we can read it now
-                    return True
-                # else, we couldn't read it anyway. don't care about mtimes
-                continue
-            try:
-                if os.path.getmtime(path) > mtime:
-                    return True
-            except OSError:
-                # path does not exist, presumably. at any rate,
-                # assume we're up to date
-                pass
+        return self.snapshot.is_stale()
 
     def check_insecure(self, url):
         '''Check whether a URL should be considered "insecure".
@@ -118,26 +264,43 @@ class SwiftConfig(object):
     @property
     def default_auth(self):
         '''Get the default auth config that should be used.'''
-        auth = self.conf.defaults().get('auth')
-        if auth is None and len(self.available_auths) == 1:
-            auth = self.available_auths[0]
-        return auth
+        return self.snapshot.default_auth
 
     def get_default_verify(self, auth_name):
         auth_section = 'auth:%s' % auth_name
-        return self.conf.getboolean(auth_section, 'verify', True)
+        return self.snapshot.getboolean(auth_section, 'verify', True)
 
-    def get_auth(self, auth_name, password=None):
-        '''Get an authenticator for a given auth config.'''
+    def has_auth(self, auth_name):
+        '''Check whether an auth config exists.'''
+        return 'auth:%s' % auth_name in self.snapshot.sections
+
+    def get_auth_class(self, auth_name):
+        '''Get the authenticator class for a given auth config.'''
+        auth_section = 'auth:%s' % auth_name
+        return auth.resolve(
+            self.snapshot.get(auth_section, 'use', 'swiftagent.auth:v3'))
+
+    def get_auth_options(self, auth_name):
+        '''Get the raw options for a given auth config.
+
+        :raises configparser.NoSectionError: if the auth config doesn't exist
+        '''
         auth_section = 'auth:%s' % auth_name
-        use_line = self.conf.get(auth_section, 'use', 'swiftagent.auth:v3')
-        module, delim, cls = use_line.partition(':')
-        if not (module and delim and cls):
-            raise ValueError("'use' must be of the form module:class")
-        module = importlib.import_module(module)
-        cls = getattr(module, cls)
-
-        auth_config = dict(self.conf.items(auth_section))
+        if auth_section not in self.snapshot.sections:
+            raise configparser.NoSectionError(auth_section)
+        return dict(self.snapshot.sections[auth_section])
+
+    def get_auth(self, auth_name, password=None, prompt=True):
+        '''Get an authenticator for a given auth config.
+
+        :param auth_name: the auth config to use
+        :param password: the password to use, if required
+        :param prompt: whether to prompt for a missing password (if there
+                       is an interactive shell)
+        :raises PasswordRequired: if no password is available
+        '''
+        cls = self.get_auth_class(auth_name)
+        auth_config = self.get_auth_options(auth_name)
         LOGGER.debug('Using auth config %r', auth_config)
         if cls.requires_password:
             if 'password' in auth_config:
@@ -146,15 +309,25 @@ class SwiftConfig(object):
                 else:
                     LOGGER.warning('Ignoring password from config for auth %s',
                                    auth_name)
-            if password is None and sys.stdin.isatty():
+            if password is None and prompt and sys.stdin.isatty():
                 password = getpass.getpass()
             if password is None:
                 raise base.PasswordRequired(self)
             auth_config['password'] = password
         return cls(auth_config, self.check_insecure)
 
+    def get_insecure_password(self, auth_name):
+        '''Get the password from an auth config, if it may be used.
+
+        :param auth_name: the auth config to check
+        :returns: the password, or None if there isn't one or the auth
+                  config isn't listed in ``[insecure] auth``
+        '''
+        if auth_name not in self.insecure_auth:
+            return None
+        return self.get_auth_options(auth_name).get('password')
+
     @property
     def available_auths(self):
         '''Get a mapping of auth configs to their auth URLs.'''
-        return {s[5:]: self.conf.get(s, 'auth_url')
-                for s in self.conf.sections() if s.startswith('auth:')}
+        return dict(self.snapshot.auths)
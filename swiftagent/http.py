@@ -0,0 +1,97 @@
+'''
+A thin, lazily-imported wrapper around requests.
+
+Importing requests is a large share of a CLI's startup time, so it's only
+imported once a request is actually made. Commands that just talk to a
+swift-agent server never pay for it.
+
+While tracing is enabled, each request is recorded as an ``http`` span,
+with children for connecting (``http.connect``, which records the TCP
+and TLS times separately), waiting for the response headers
+(``http.first_byte``) and reading the body (``http.body``).
+'''
+from swiftagent import tracing
+
+_HOOKS_INSTALLED = []
+
+
+def _requests():
+    import requests  # pylint: disable=import-outside-toplevel
+    return requests
+
+
+def _install_hooks():
+    '''Wrap urllib3's connection setup in tracing spans.'''
+    if _HOOKS_INSTALLED:
+        return
+    _HOOKS_INSTALLED.append(True)
+    _requests()
+    # pylint: disable=import-outside-toplevel
+    from urllib3 import connection
+
+    def wrap_new_conn(orig):
+        def _new_conn(self):
+            with tracing.span('http.tcp', host=self.host,
+                              port=self.port) as span:
+                conn = orig(self)
+            parent = span.parent
+            if parent is not None and parent.name == 'http.connect':
+                parent.set(tcp=span.duration)
+            return conn
+        return _new_conn
+
+    def wrap_connect(orig):
+        def connect(self):
+            with tracing.span('http.connect', host=self.host,
+                              port=self.port) as span:
+                orig(self)
+            if 'tcp' in span.attrs and \
+                    isinstance(self, connection.HTTPSConnection):
+                span.set(tls=span.duration - span.attrs['tcp'])
+        return connect
+
+    connection.HTTPConnection._new_conn = wrap_new_conn(
+        connection.HTTPConnection._new_conn)
+    for cls in (connection.HTTPConnection, connection.HTTPSConnection):
+        if 'connect' in vars(cls):
+            cls.connect = wrap_connect(cls.connect)
+
+
+def _traced_request(method, url, **kwargs):
+    _install_hooks()
+    stream = kwargs.pop('stream', False)
+    with tracing.span('http', method=method, url=url) as span:
+        with tracing.span('http.first_byte'):
+            resp = _requests().request(method, url, stream=True, **kwargs)
+        span.set(status=resp.status_code)
+        if not stream:
+            with tracing.span('http.body') as body_span:
+                body_span.set(bytes=len(resp.content))
+    return resp
+
+
+def request(method, url, **kwargs):
+    '''Make an HTTP request; see ``requests.request``.'''
+    if tracing.enabled():
+        return _traced_request(method, url, **kwargs)
+    return _requests().request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    '''Make a GET request; see ``requests.get``.'''
+    return request('GET', url, **kwargs)
+
+
+def errors():
+    '''Get the base class for errors raised while making requests.
+
+    This is meant to be used directly in an ``except`` clause, like::
+
+        except http.errors() as exc:
+    '''
+    return _requests().RequestException
+
+
+def header_dict(headers=None):
+    '''Make a case-insensitive dict of headers, as responses have.'''
+    return _requests().structures.CaseInsensitiveDict(headers)
@@ -3,9 +3,15 @@ Tools for reading and writing data.
 '''
 from __future__ import print_function
 from __future__ import unicode_literals
-import collections
+import re
+
 from six.moves import shlex_quote
 
+try:
+    from collections.abc import Mapping
+except ImportError:  # py2
+    from collections import Mapping
+
 
 def export(to_export):
     '''Print some key-value pairs as ``export`` lines.
@@ -14,10 +20,20 @@ def export(to_export):
 
     :param to_export: the dict or list of tuples to export
     '''
-    if isinstance(to_export, collections.Mapping):
+    if isinstance(to_export, Mapping):
         to_export = sorted(to_export.items())
     for key, value in sorted(to_export):
         if value:
             print('export %s=%s' % (key, shlex_quote(str(value))))
         else:
             print('unset %s' % key)
+
+
+def env_name(*parts):
+    '''Build an environment variable name from some parts.
+
+    Characters that aren't valid in a variable name become underscores.
+
+    :param parts: the parts to join, like ``('OS_AUTH_TOKEN', 'prod:admin')``
+    '''
+    return re.sub(r'[^A-Z0-9_]', '_', '_'.join(parts).upper())
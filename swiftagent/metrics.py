@@ -0,0 +1,195 @@
+'''
+Simple in-process metrics: counters, gauges and histograms, with labels.
+
+A Registry can be dumped as a dict (for JSON) or in the Prometheus text
+exposition format.
+'''
+import bisect
+import threading
+
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (k, str(v).replace('\\', '\\\\').replace(
+            '"', '\\"').replace('\n', '\\n'))
+        for k, v in pairs)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(object):
+    '''Base for metrics, which hold a value per set of labels.
+
+    :param name: the metric name
+    :param description: a one-line description, used as the HELP text
+    '''
+    kind = None
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def snapshot(self):
+        '''Get a list of ``{"labels": ..., "value": ...}`` dicts.'''
+        with self._lock:
+            return [{'labels': dict(key), 'value': self._export(value)}
+                    for key, value in sorted(self._values.items())]
+
+    def _export(self, value):
+        return value
+
+    def prometheus(self):
+        '''Get the metric in the Prometheus text exposition format.'''
+        lines = ['# HELP %s %s' % (self.name, self.description),
+                 '# TYPE %s %s' % (self.name, self.kind)]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._prometheus_lines(key, value))
+        return lines
+
+    def _prometheus_lines(self, key, value):
+        return ['%s%s %s' % (self.name, _format_labels(key),
+                             _format_value(value))]
+
+
+class Counter(Metric):
+    '''A value that only goes up.'''
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        '''Increment the counter for some labels.'''
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    '''A value that may go up and down.'''
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        '''Increment the gauge for some labels.'''
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        '''Decrement the gauge for some labels.'''
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        '''Set the gauge for some labels.'''
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+
+class Histogram(Metric):
+    '''A distribution of observed values, such as latencies.
+
+    :param buckets: the (sorted) upper bounds of the buckets
+    '''
+    kind = 'histogram'
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, description)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        '''Record an observation for some labels.'''
+        key = _label_key(labels)
+        with self._lock:
+            counts, total = self._values.get(
+                key, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def _export(self, value):
+        counts, total = value
+        return {'buckets': [[_format_value(bound), running] for
+                            bound, running in self._cumulative(counts)],
+                'count': sum(counts), 'sum': total}
+
+    def _cumulative(self, counts):
+        result = []
+        running = 0
+        for bound, count in zip(self.buckets + (float('inf'), ), counts):
+            running += count
+            result.append((bound, running))
+        return result
+
+    def _prometheus_lines(self, key, value):
+        counts, total = value
+        lines = ['%s_bucket%s %d' % (
+            self.name, _format_labels(key, [('le', _format_value(bound))]),
+            running) for bound, running in self._cumulative(counts)]
+        lines.append('%s_sum%s %s' % (self.name, _format_labels(key),
+                                      _format_value(float(total))))
+        lines.append('%s_count%s %d' % (self.name, _format_labels(key),
+                                        sum(counts)))
+        return lines
+
+
+class Registry(object):
+    '''A collection of named metrics.'''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.metrics = {}
+
+    def _get(self, cls, name, description, **kwargs):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, description,
+                                                  **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError('%s is already a %s' % (name, metric.kind))
+        return metric
+
+    def get(self, name):
+        '''Get an existing metric by name.
+
+        :raises KeyError: if there is no such metric
+        '''
+        return self.metrics[name]
+
+    def counter(self, name, description):
+        '''Get (or create) a Counter.'''
+        return self._get(Counter, name, description)
+
+    def gauge(self, name, description):
+        '''Get (or create) a Gauge.'''
+        return self._get(Gauge, name, description)
+
+    def histogram(self, name, description, buckets=DEFAULT_BUCKETS):
+        '''Get (or create) a Histogram.'''
+        return self._get(Histogram, name, description, buckets=buckets)
+
+    def snapshot(self):
+        '''Get every metric's values, as a JSON-serializable dict.'''
+        return {name: {'type': metric.kind, 'help': metric.description,
+                       'values': metric.snapshot()}
+                for name, metric in sorted(self.metrics.items())}
+
+    def prometheus(self):
+        '''Get every metric in the Prometheus text exposition format.'''
+        lines = []
+        for dummy, metric in sorted(self.metrics.items()):
+            lines.extend(metric.prometheus())
+        return '\n'.join(lines) + '\n'
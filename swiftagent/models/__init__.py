@@ -1,4 +1,8 @@
 #flake8: noqa
 from swiftagent.models.exceptions import SwiftClientError
+from swiftagent.models.exceptions import RateLimited
+from swiftagent.models.concurrency import ConcurrencyGovernor
+from swiftagent.models.cache import MetadataCache
 from swiftagent.models.cluster import Cluster
+from swiftagent.models.diskcache import ContentCache
 from swiftagent.models.account import Account
@@ -1,10 +1,63 @@
+from swiftagent.config import scheme_netloc_only
+from swiftagent.models import tempurl
+
+
 class Account(object):
     def __init__(self, cluster, url, headers=None):
         self.cluster = cluster
         self.url = url
         self.headers = headers or {}
+        self._temp_url_keys = None
 
     def info(self, force_refresh=False):
-        if not self.headers or force_refresh:
-            self.headers, dummy = self.cluster.authed_req('HEAD', self.url)
+        if not self.headers or force_refresh or \
+                self.cluster.metadata_cache is not None:
+            self.headers = self.cluster.head(self.url, force_refresh)
         return self.headers
+
+    def temp_url_keys(self, force_refresh=False):
+        '''Get the account's TempURL keys.
+
+        The keys are read from the account metadata once and cached.
+
+        :param force_refresh: if True, re-read the account metadata
+        :returns: a list of keys, primary key first
+        '''
+        if self._temp_url_keys is None or force_refresh:
+            headers = self.info(force_refresh)
+            self._temp_url_keys = [headers[h] for h in
+                                   tempurl.TEMP_URL_KEY_HEADERS
+                                   if headers.get(h)]
+        return self._temp_url_keys
+
+    def temp_url_signer(self, digest=None):
+        '''Get a TempURL signer for this account.
+
+        :param digest: the digest to use; by default, the best one allowed
+                       by the cluster's /info is chosen
+        :returns: a :class:`~swiftagent.models.tempurl.TempUrlSigner`
+        :raises ValueError: if the account has no TempURL key set
+        '''
+        keys = self.temp_url_keys()
+        if not keys:
+            raise ValueError('No TempURL key set for %s' % self.url)
+        if digest is None:
+            digest = tempurl.choose_digest(self.cluster.info())
+        return tempurl.TempUrlSigner(keys[0], digest)
+
+    def temp_urls(self, names, expires, method='GET', signer=None):
+        '''Generate signed TempURLs for many objects.
+
+        :param names: an iterable of unquoted ``container/object`` names
+        :param expires: the expiry time, in seconds since the epoch
+        :param method: the HTTP method to allow
+        :param signer: the signer to use; by default, one is created with
+                       :meth:`temp_url_signer`
+        :returns: an iterator of absolute TempURLs
+        '''
+        signer = signer or self.temp_url_signer()
+        host = scheme_netloc_only(self.url)
+        prefix = tempurl.account_path(self.url) + '/'
+        paths = (prefix + name for name in names)
+        for path, query in signer.sign_many(paths, expires, method):
+            yield '%s%s?%s' % (host, tempurl.quote_path(path), query)
@@ -0,0 +1,121 @@
+'''
+In-memory caching of account, container and object metadata.
+'''
+import collections
+import threading
+import time
+
+
+class MetadataCache(object):
+    '''A bounded, expiring cache of HEAD responses, keyed by full path.
+
+    Successful responses are kept for ``ttl`` seconds; 404s are kept for
+    ``negative_ttl`` seconds. Once ``max_entries`` paths are cached, the
+    least-recently-used entry is evicted to make room for the next.
+
+    :param ttl: the number of seconds to cache a successful HEAD
+    :param negative_ttl: the number of seconds to cache a 404,
+                         or 0 to disable negative caching
+    :param max_entries: the maximum number of paths to cache
+    '''
+    def __init__(self, ttl=60, negative_ttl=10, max_entries=4096):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(url):
+        '''Normalize a URL into a cache key.'''
+        return url.partition('?')[0].rstrip('/')
+
+    def get(self, url):
+        '''Look up the cached metadata for a path.
+
+        :param url: the URL for the account, container or object
+        :returns: a tuple of (headers, error_response) where exactly one
+                  is not None, or None if nothing (valid) is cached
+        '''
+        key = self.key(url)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] < now:
+                self.misses += 1
+                return None
+            # re-insert to mark as most-recently used
+            self._entries[key] = entry
+            if entry[1] is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, url, headers):
+        '''Cache the metadata from a successful HEAD.
+
+        :param url: the URL for the account, container or object
+        :param headers: the response headers
+        '''
+        self._store(url, self.ttl, headers, None)
+
+    def put_missing(self, url, response):
+        '''Cache a 404 response.
+
+        :param url: the URL for the account, container or object
+        :param response: the 404 response
+        '''
+        if self.negative_ttl > 0:
+            self._store(url, self.negative_ttl, None, response)
+
+    def _store(self, url, ttl, headers, response):
+        key = self.key(url)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + ttl, headers, response)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, url):
+        '''Drop any cached metadata for a path.
+
+        :param url: the URL for the account, container or object
+        '''
+        with self._lock:
+            if self._entries.pop(self.key(url), None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        '''Drop all cached metadata.'''
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def hit_rate(self):
+        '''The fraction of lookups that were served from the cache.'''
+        hits = self.hits + self.negative_hits
+        total = hits + self.misses
+        return float(hits) / total if total else 0.0
+
+    def stats(self):
+        '''Get the cache's counters.
+
+        :returns: a dict of counter names to values
+        '''
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hit_rate,
+            }
@@ -1,11 +1,11 @@
 import logging
 import time
 
-import requests
-
 from swiftagent.auth import base
 from swiftagent.config import scheme_netloc_only
+from swiftagent import http
 from swiftagent.models import account
+from swiftagent.models import concurrency
 from swiftagent.models import exceptions
 
 
@@ -14,8 +14,25 @@ LOGGER.addHandler(logging.NullHandler())
 
 
 class Cluster(object):
-    def __init__(self, authenticator):
+    '''A Swift cluster, as seen through an authenticator.
+
+    :param authenticator: the authenticator to use for requests
+    :param metadata_cache: an optional MetadataCache to use for HEAD requests
+    :param content_cache: an optional ContentCache to use for GET requests
+    :param governor: the ConcurrencyGovernor through which to make requests,
+                     or None to make them ungoverned
+    '''
+    INVALIDATING_METHODS = ('PUT', 'POST', 'DELETE')
+    # A 304 describes itself with these, not the cached body
+    ENTITY_HEADERS = ('Content-Length', 'Content-Type')
+    RATE_LIMITED_STATUSES = (429, 498)
+
+    def __init__(self, authenticator, metadata_cache=None,
+                 content_cache=None, governor=concurrency.SHARED_GOVERNOR):
         self.auth = authenticator
+        self.metadata_cache = metadata_cache
+        self.content_cache = content_cache
+        self.governor = governor
         storage_url, dummy, dummy = self.auth.get_credentials()
         # NB: base_url should still include /v1 if present
         storage_url = storage_url.rstrip('/')
@@ -30,7 +47,7 @@ class Cluster(object):
         url = scheme_netloc_only(self.base_url) + '/info'
 
         LOGGER.info('Getting capabilities for %s', url)
-        resp = requests.get(url)
+        resp = http.get(url)
         if resp.status_code // 100 != 2:
             raise exceptions.SwiftClientError(resp)
 
@@ -48,20 +65,134 @@ class Cluster(object):
             raise ValueError('An account name is required')
         return account.Account(self, '%s/%s' % (self.base_url, name))
 
+    def head(self, url, force_refresh=False):
+        '''Get the metadata for an account, container or object.
+
+        If this cluster has a metadata cache, it will be consulted first
+        and updated with the result.
+
+        :param url: the URL for the account, container or object
+        :param force_refresh: if True, skip the cache lookup
+        :returns: the response headers
+        :raises SwiftClientError: if the request fails
+        '''
+        cache = self.metadata_cache
+        if cache is None:
+            return self.authed_req('HEAD', url)[0]
+
+        cached = None if force_refresh else cache.get(url)
+        if cached is not None:
+            headers, missing_resp = cached
+            if missing_resp is not None:
+                raise exceptions.SwiftClientError(missing_resp)
+            return headers
+
+        try:
+            headers, dummy = self.authed_req('HEAD', url)
+        except exceptions.SwiftClientError as exc:
+            if exc.args and getattr(exc.args[0], 'status_code', 0) == 404:
+                cache.put_missing(url, exc.args[0])
+            raise
+        cache.put(url, headers)
+        return headers
+
+    def invalidate(self, url):
+        '''Drop cached metadata for a path and everything above it.
+
+        Writes to an object change its container's (and account's) stats,
+        so parents are invalidated as well.
+
+        :param url: the URL for the account, container or object
+        '''
+        if self.metadata_cache is None:
+            return
+        path = url.partition('?')[0].rstrip('/')
+        while len(path) > len(self.base_url):
+            self.metadata_cache.invalidate(path)
+            path = path.rsplit('/', 1)[0]
+
+    def get(self, url, headers=None):
+        '''Get an object's headers and body.
+
+        If this cluster has a content cache, any cached copy is revalidated
+        with ``If-None-Match``; on a 304, the body is served from the cache
+        as a read-only, mmap-backed memoryview rather than as bytes.
+
+        :param url: the URL for the object
+        :param headers: any additional request headers
+        :returns: a tuple of (headers, body)
+        :raises SwiftClientError: if the request fails
+        '''
+        cache = self.content_cache
+        headers = dict(headers or {})
+        if cache is None or 'Range' in headers:
+            return self.authed_req('GET', url, headers=headers)
+
+        cached = cache.get(url)
+        if cached is not None:
+            headers['If-None-Match'] = cached.etag
+        try:
+            resp = self._authed_resp('GET', url, headers=headers)
+        except Exception:
+            if cached is not None:
+                cached.close()
+            raise
+        if resp.status_code == 304 and cached is not None:
+            LOGGER.debug('Serving %s from content cache', url)
+            cache.record(hit=True)
+            resp_headers = http.header_dict(cached.headers)
+            for key, value in resp.headers.items():
+                if key.title() not in self.ENTITY_HEADERS:
+                    resp_headers[key] = value
+            return resp_headers, cached.body
+        cache.record(hit=False)
+        if cached is not None:
+            cached.close()
+        if resp.status_code == 404:
+            cache.invalidate(url)
+        if resp.status_code // 100 != 2:
+            raise exceptions.SwiftClientError(resp)
+
+        etag = resp.headers.get('ETag')
+        if etag:
+            cache.put(url, etag, resp.headers, resp.content)
+        return resp.headers, resp.content
+
     def authed_req(self, method, url, params=None, headers=None):
-        headers = headers or {}
+        resp = self._authed_resp(method, url, params, headers)
+        if resp.status_code // 100 != 2:
+            raise exceptions.SwiftClientError(resp)
+        return resp.headers, resp.content
+
+    def governor_key(self, url):
+        '''Get the account/container a URL should be governed under.'''
+        path = url.partition('?')[0][len(self.base_url):].lstrip('/')
+        return '/'.join(path.split('/', 2)[:2])
+
+    def _authed_resp(self, method, url, params=None, headers=None):
+        if self.governor is None:
+            return self._send(method, url, params, headers)
+        return self.governor.run(self.governor_key(url), self._send,
+                                 method, url, params, headers)
+
+    def _send(self, method, url, params=None, headers=None):
+        headers = dict(headers or {})
         dummy, token, dummy = self.auth.get_credentials()
         if token:
             headers['X-Auth-Token'] = token
-        resp = requests.request(
-            method, url,
-            params=params,
-            headers=headers,
-            verify=self.auth.should_verify(url))
+        try:
+            resp = http.request(
+                method, url,
+                params=params,
+                headers=headers,
+                verify=self.auth.should_verify(url))
+        finally:
+            if method in self.INVALIDATING_METHODS:
+                self.invalidate(url)
         if resp.status_code == 401:
             raise base.Unauthorized(self)
         elif resp.status_code == 403:
             raise base.Forbidden(self)
-        elif resp.status_code // 100 != 2:
-            raise exceptions.SwiftClientError(resp)
-        return resp.headers, resp.content
+        elif resp.status_code in self.RATE_LIMITED_STATUSES:
+            raise exceptions.RateLimited(resp)
+        return resp
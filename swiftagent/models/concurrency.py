@@ -0,0 +1,157 @@
+'''
+Adaptive concurrency control for requests to a Swift cluster.
+'''
+import collections
+import logging
+import random
+import threading
+import time
+
+from swiftagent.models import exceptions
+
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(logging.NullHandler())
+
+
+class _Window(object):
+    '''The concurrency window for a single account or container.'''
+    def __init__(self, limit):
+        self.limit = float(limit)
+        self.in_flight = 0
+        self.not_before = 0
+        self.last_decrease = 0
+        self.cond = threading.Condition()
+
+
+class ConcurrencyGovernor(object):
+    '''Limit in-flight requests per account/container, adapting to the cluster.
+
+    Each key gets a window of allowed concurrent requests. Successes grow
+    the window additively (by about one per window's worth of successes);
+    rate-limit responses shrink it multiplicatively and pause every request
+    for that key, either for the server's ``Retry-After`` or for a jittered,
+    exponentially-increasing backoff. A ``Retry-After`` longer than
+    ``max_backoff`` isn't waited for; the RateLimited error is raised.
+
+    Only the most recently used keys' windows are kept.
+
+    :param initial_window: the starting number of concurrent requests per key
+    :param min_window: the smallest the window may shrink
+    :param max_window: the largest the window may grow
+    :param decrease: the factor by which to shrink the window when throttled
+    :param max_retries: how many times to retry a rate-limited request
+    :param base_backoff: the initial backoff, in seconds
+    :param max_backoff: the largest backoff, in seconds
+    :param max_keys: the most keys to keep windows for
+    '''
+    def __init__(self, initial_window=8, min_window=1, max_window=64,
+                 decrease=0.5, max_retries=5, base_backoff=0.5,
+                 max_backoff=30, max_keys=1024):
+        self.initial_window = initial_window
+        self.min_window = min_window
+        self.max_window = max_window
+        self.decrease = decrease
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.max_keys = max_keys
+        self._windows = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _window(self, key):
+        with self._lock:
+            window = self._windows.pop(key, None)
+            if window is None:
+                window = _Window(self.initial_window)
+                while len(self._windows) >= self.max_keys:
+                    # Anything still using an evicted window keeps it
+                    self._windows.popitem(last=False)
+            self._windows[key] = window
+            return window
+
+    def window_size(self, key):
+        '''Get the current window size for a key.'''
+        return int(self._window(key).limit)
+
+    def backoff(self, attempt, retry_after=None):
+        '''Compute how long to wait before the next attempt.
+
+        :param attempt: the number of attempts made so far, starting at 0
+        :param retry_after: the server's requested delay, if any
+        :returns: a delay in seconds
+        '''
+        if retry_after is not None:
+            retry_after = min(self.max_backoff, retry_after)
+            # Spread retries out a little so they don't arrive together
+            return retry_after + random.uniform(0, 0.1 * retry_after + 0.1)
+        cap = min(self.max_backoff, self.base_backoff * 2 ** attempt)
+        return random.uniform(0, cap)
+
+    def run(self, key, func, *args, **kwargs):
+        '''Call a function within the window for a key.
+
+        :param key: the account/container the request is for
+        :param func: the function making the request; it should raise
+                     RateLimited if the server throttled it
+        :returns: the result of ``func``
+        :raises RateLimited: if still throttled after ``max_retries``, or
+                             asked to wait longer than ``max_backoff``
+        '''
+        window = self._window(key)
+        attempt = 0
+        while True:
+            self._acquire(window)
+            try:
+                result = func(*args, **kwargs)
+            except exceptions.RateLimited as exc:
+                self._release(window)
+                if attempt >= self.max_retries or (
+                        exc.retry_after is not None and
+                        exc.retry_after > self.max_backoff):
+                    raise
+                self._on_throttle(key, window, attempt, exc.retry_after)
+                attempt += 1
+            except Exception:
+                self._release(window)
+                raise
+            else:
+                self._release(window, success=True)
+                return result
+
+    def _acquire(self, window):
+        with window.cond:
+            while True:
+                delay = window.not_before - time.time()
+                if delay <= 0 and window.in_flight < int(window.limit):
+                    break
+                window.cond.wait(delay if delay > 0 else None)
+            window.in_flight += 1
+
+    def _release(self, window, success=False):
+        with window.cond:
+            window.in_flight -= 1
+            if success:
+                window.limit = min(self.max_window,
+                                   window.limit + 1.0 / window.limit)
+            window.cond.notify_all()
+
+    def _on_throttle(self, key, window, attempt, retry_after):
+        delay = self.backoff(attempt, retry_after)
+        now = time.time()
+        with window.cond:
+            # Requests that were already in flight when we got throttled
+            # shouldn't each shrink the window again
+            if now - window.last_decrease > delay:
+                window.limit = max(self.min_window,
+                                   window.limit * self.decrease)
+                window.last_decrease = now
+            window.not_before = max(window.not_before, now + delay)
+            LOGGER.info('Rate-limited on %s; window now %d, waiting %.2fs',
+                        key, int(window.limit), delay)
+            window.cond.notify_all()
+
+
+# Shared by all clusters, so parallel work in one process is governed as a
+# whole rather than per-Cluster
+SHARED_GOVERNOR = ConcurrencyGovernor()
@@ -0,0 +1,206 @@
+'''
+On-disk caching of object contents, revalidated by ETag.
+'''
+import errno
+import fcntl
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(logging.NullHandler())
+
+# Each entry is a single file: a 4-byte big-endian length, that many bytes
+# of JSON metadata, then the object body.
+HEADER = struct.Struct('>I')
+LOCK_FILE = '.lock'
+
+
+class CachedObject(object):
+    '''An object body served from the content cache.
+
+    :param etag: the ETag of the cached body
+    :param headers: the response headers stored with the body
+    :param mapped: the mmap of the cache entry
+    :param offset: where the body starts in the entry
+    '''
+    def __init__(self, etag, headers, mapped, offset):
+        self.etag = etag
+        self.headers = headers
+        self._mapped = mapped
+        self._view = memoryview(mapped)
+        self.body = self._view[offset:]
+
+    def close(self):
+        '''Unmap the entry; the body must no longer be in use.'''
+        for view in (self.body, self._view):
+            if hasattr(view, 'release'):
+                view.release()
+        self._mapped.close()
+
+
+class ContentCache(object):
+    '''A size-bounded, on-disk cache of object bodies.
+
+    Entries are keyed by path and carry the ETag they were stored with,
+    so callers can revalidate them with ``If-None-Match``. Entries are
+    written to a temporary file and renamed into place, so several
+    processes may safely share one cache directory; eviction is
+    least-recently-used (by mtime, which is bumped on every hit) and
+    serialized across processes with an advisory lock.
+
+    :param directory: the directory in which to store entries
+    :param max_bytes: the maximum total size of all entries
+    '''
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        try:
+            os.makedirs(directory, 0o700)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+        self._lock = threading.Lock()
+        self._approx_bytes = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, url):
+        key = url.partition('?')[0].rstrip('/').encode('utf-8')
+        return os.path.join(self.directory, hashlib.sha256(key).hexdigest())
+
+    def get(self, url):
+        '''Look up the cached body for a path.
+
+        The lookup isn't counted as a hit or miss; the caller should
+        :meth:`record` that once it knows whether the body is still good.
+
+        :param url: the URL for the object
+        :returns: a CachedObject, or None if nothing is cached
+        '''
+        path = self._path(url)
+        try:
+            with open(path, 'rb') as fp:
+                meta_len, = HEADER.unpack(fp.read(HEADER.size))
+                meta = json.loads(fp.read(meta_len).decode('utf-8'))
+                mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError, struct.error):
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass  # evicted out from under us; the mapping is still good
+        return CachedObject(meta['etag'], meta['headers'], mapped,
+                            HEADER.size + meta_len)
+
+    def record(self, hit):
+        '''Count a lookup.
+
+        :param hit: whether a cached body was served
+        '''
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def put(self, url, etag, headers, body):
+        '''Store an object body.
+
+        :param url: the URL for the object
+        :param etag: the ETag of the body
+        :param headers: the response headers to store with the body
+        :param body: the object body, as bytes
+        '''
+        meta = json.dumps({'url': url, 'etag': etag,
+                           'headers': dict(headers)}).encode('utf-8')
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(HEADER.pack(len(meta)))
+                fp.write(meta)
+                fp.write(body)
+            os.rename(tmp_path, self._path(url))
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+        size = HEADER.size + len(meta) + len(body)
+        with self._lock:
+            if self._approx_bytes is not None:
+                self._approx_bytes += size
+            over_budget = (self._approx_bytes is None or
+                           self._approx_bytes > self.max_bytes)
+        if over_budget:
+            self.evict()
+
+    def invalidate(self, url):
+        '''Drop the cached body for a path.
+
+        :param url: the URL for the object
+        '''
+        try:
+            os.unlink(self._path(url))
+        except OSError as exc:
+            if exc.errno != errno.ENOENT:
+                raise
+
+    def evict(self):
+        '''Remove least-recently-used entries until under ``max_bytes``.
+
+        If another process is already evicting, this is a no-op.
+        '''
+        lock_fd = os.open(os.path.join(self.directory, LOCK_FILE),
+                          os.O_WRONLY | os.O_CREAT, 0o600)
+        try:
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError) as exc:
+                if exc.errno in (errno.EAGAIN, errno.EACCES):
+                    return
+                raise
+
+            entries = []
+            for name in os.listdir(self.directory):
+                if name.startswith('.'):
+                    continue
+                try:
+                    st = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, name))
+            entries.sort()
+
+            total = sum(size for dummy, size, dummy in entries)
+            for dummy, size, name in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                total -= size
+                self.evictions += 1
+            with self._lock:
+                self._approx_bytes = total
+        finally:
+            os.close(lock_fd)
+
+    def stats(self):
+        '''Get the cache's counters.
+
+        :returns: a dict of counter names to values
+        '''
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'approx_bytes': self._approx_bytes,
+        }
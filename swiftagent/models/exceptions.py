@@ -1,2 +1,24 @@
+import email.utils
+import time
+
+
 class SwiftClientError(Exception):
     '''An error was received while communicating with the Swift server.'''
+
+
+class RateLimited(SwiftClientError):
+    '''The Swift server asked us to slow down (a 498 or 429).'''
+    @property
+    def retry_after(self):
+        '''The number of seconds the server asked us to wait, or None.'''
+        value = self.args[0].headers.get('Retry-After') if self.args else None
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        parsed = email.utils.parsedate_tz(value)
+        if parsed is None:
+            return None
+        return max(0.0, email.utils.mktime_tz(parsed) - time.time())
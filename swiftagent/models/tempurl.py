@@ -0,0 +1,102 @@
+'''
+Tools for generating signed TempURLs.
+'''
+import base64
+import hashlib
+import hmac
+
+from six.moves import urllib
+
+
+TEMP_URL_KEY_HEADERS = (
+    'X-Account-Meta-Temp-URL-Key',
+    'X-Account-Meta-Temp-URL-Key-2',
+)
+# Swift's own default if /info doesn't advertise allowed_digests
+DEFAULT_DIGESTS = ('sha1', 'sha256', 'sha512')
+# Most-preferred first
+PREFERRED_DIGESTS = ('sha256', 'sha512', 'sha1')
+
+
+def choose_digest(info):
+    '''Choose the best digest a cluster will accept for TempURLs.
+
+    :param info: the result of a /info request
+    :returns: the name of a hashlib digest
+    :raises ValueError: if the cluster allows no digest we can use
+    '''
+    tempurl_info = info.get('tempurl', {})
+    allowed = tempurl_info.get('allowed_digests', DEFAULT_DIGESTS)
+    for digest in PREFERRED_DIGESTS:
+        if digest in allowed:
+            return digest
+    raise ValueError('No supported TempURL digest in %r' % (allowed, ))
+
+
+class TempUrlSigner(object):
+    '''Signs TempURLs for a single key and digest.
+
+    The keyed HMAC state is computed once and copied for each signature,
+    so signing many paths only pays for hashing the message itself.
+
+    :param key: the account's TempURL key
+    :param digest: the name of the hashlib digest to use
+    '''
+    def __init__(self, key, digest='sha256'):
+        if not isinstance(key, bytes):
+            key = key.encode('utf-8')
+        self.digest = digest
+        self._keyed = hmac.new(key, digestmod=getattr(hashlib, digest))
+        if digest == 'sha512':
+            self._format = self._format_prefixed
+        else:
+            self._format = self._format_hex
+
+    @staticmethod
+    def _format_hex(mac):
+        return mac.hexdigest()
+
+    def _format_prefixed(self, mac):
+        sig = base64.urlsafe_b64encode(mac.digest()).rstrip(b'=')
+        return '%s:%s' % (self.digest, sig.decode('ascii'))
+
+    def sign(self, path, expires, method='GET'):
+        '''Sign a single path.
+
+        :param path: the full, unquoted path, like ``/v1/AUTH_test/c/o``
+        :param expires: the expiry time, in seconds since the epoch
+        :param method: the HTTP method to allow
+        :returns: the signature
+        '''
+        mac = self._keyed.copy()
+        mac.update(('%s\n%d\n%s' % (method, expires, path)).encode('utf-8'))
+        return self._format(mac)
+
+    def sign_many(self, paths, expires, method='GET'):
+        '''Sign many paths with the same method and expiry time.
+
+        :param paths: an iterable of full, unquoted paths
+        :param expires: the expiry time, in seconds since the epoch
+        :param method: the HTTP method to allow
+        :returns: an iterator of (path, query string) pairs
+        '''
+        prefix = ('%s\n%d\n' % (method, expires)).encode('utf-8')
+        suffix = '&temp_url_expires=%d' % expires
+        keyed_copy = self._keyed.copy
+        fmt = self._format
+        for path in paths:
+            mac = keyed_copy()
+            mac.update(prefix + path.encode('utf-8'))
+            yield path, 'temp_url_sig=%s%s' % (fmt(mac), suffix)
+
+
+def account_path(account_url):
+    '''Get the path portion of an account URL, like ``/v1/AUTH_test``.'''
+    return urllib.parse.urlparse(account_url).path.rstrip('/')
+
+
+def quote_path(path):
+    '''Quote a path for use in a URL.'''
+    if not isinstance(path, bytes):
+        path = path.encode('utf-8')
+    return urllib.parse.quote(path)
@@ -50,6 +50,17 @@ class IntOpt(StrOpt):
         return output_dict
 
 
+class FloatOpt(StrOpt):
+    '''An option that must be a number.'''
+    def validate(self, input_dict):
+        output_dict = super(FloatOpt, self).validate(input_dict)
+        try:
+            output_dict[self.name] = float(output_dict[self.name])
+        except ValueError:
+            raise ValueError('Option %s must be a valid number' % self.name)
+        return output_dict
+
+
 class UrlOpt(StrOpt):
     '''An option that must be an absolute URL.'''
     def validate(self, input_dict):
@@ -60,6 +71,27 @@ class UrlOpt(StrOpt):
         return output_dict
 
 
+class UrlListOpt(StrOpt):
+    '''An option that must be one or more whitespace-separated absolute URLs.
+
+    The first URL is returned under the option's name, and the complete list
+    under the option's name with an "s" appended.
+    '''
+    def validate(self, input_dict):
+        output_dict = super(UrlListOpt, self).validate(input_dict)
+        urls = output_dict[self.name].split()
+        if not urls:
+            raise ValueError('Option %s is required' % self.name)
+        for url in urls:
+            url_parts = urllib.parse.urlparse(url)
+            if not (url_parts.scheme and url_parts.netloc):
+                raise ValueError('Option %s must be a list of valid URLs' %
+                                 self.name)
+        output_dict[self.name] = urls[0]
+        output_dict[self.name + 's'] = urls
+        return output_dict
+
+
 # ========================
 # More complicated options
 # ========================
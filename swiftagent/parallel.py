@@ -0,0 +1,45 @@
+'''
+Tools for running blocking calls concurrently.
+'''
+import threading
+import time
+
+
+class Timeout(Exception):
+    '''The call did not complete before the deadline.'''
+
+
+def run_parallel(func, items, timeout=None):
+    '''Call a function once for each item, each in its own thread.
+
+    :param func: the function to call; it is passed a single item
+    :param items: the items to process
+    :param timeout: the number of seconds to wait for all calls to finish,
+                    or None to wait indefinitely
+    :returns: a list of ``(item, result, exception)`` tuples in the same
+              order as ``items``; exactly one of ``result`` and
+              ``exception`` is meaningful. Calls still running at the
+              deadline get a Timeout exception.
+    '''
+    items = list(items)
+    results = [(item, None, Timeout()) for item in items]
+
+    def worker(i, item):
+        try:
+            results[i] = (item, func(item), None)
+        except Exception as exc:  # pylint: disable=broad-except
+            results[i] = (item, None, exc)
+
+    threads = [threading.Thread(target=worker, args=(i, item))
+               for i, item in enumerate(items)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    deadline = None if timeout is None else time.time() + timeout
+    for thread in threads:
+        if deadline is None:
+            thread.join()
+        else:
+            thread.join(max(0, deadline - time.time()))
+    return list(results)
@@ -0,0 +1,167 @@
+'''
+Profile a running process, with cProfile or a low-overhead stack sampler.
+
+cProfile is exact but only sees the thread that started it, and slows
+everything down. The sampler periodically records every thread's stack
+from a background thread, so it's cheap enough for production; its
+results are written as "folded" stacks, as used by flame graph tools.
+
+Profiles may reveal what a process is doing (and with which arguments),
+so dumps are only readable by their owner.
+'''
+import cProfile
+import functools
+import marshal
+import os
+import sys
+import threading
+import time
+
+
+MODES = ('cprofile', 'sample')
+DEFAULT_INTERVAL = 0.005
+
+
+def open_private(path):
+    '''Open a new file for writing that only its owner can read.
+
+    :raises OSError: if the file already exists
+    '''
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(
+        os, 'O_NOFOLLOW', 0)
+    return os.fdopen(os.open(path, flags, 0o600), 'wb')
+
+
+class StackSampler(object):
+    '''Count how often each stack is seen, by sampling every thread.
+
+    :param interval: the number of seconds between samples
+    '''
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        self.counts = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        '''Start sampling in a background thread.'''
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        '''Stop sampling.'''
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        me = threading.current_thread().ident
+        while not self._stop.wait(self.interval):
+            # pylint: disable=protected-access
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append('%s:%s:%d' % (
+                        os.path.basename(code.co_filename), code.co_name,
+                        frame.f_lineno))
+                    frame = frame.f_back
+                key = ';'.join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+            self.samples += 1
+
+    def dump(self, fp):
+        '''Write the folded stacks, most common first.'''
+        for stack, count in sorted(self.counts.items(),
+                                   key=lambda item: -item[1]):
+            fp.write(('%s %d\n' % (stack, count)).encode('utf-8'))
+
+
+class Profiler(object):
+    '''Start and stop profiling on demand.
+
+    :param mode: either "cprofile" or "sample"
+    :param interval: for "sample", the number of seconds between samples
+    '''
+    def __init__(self, mode='sample', interval=DEFAULT_INTERVAL):
+        if mode not in MODES:
+            raise ValueError('Unknown profiler %r; expected one of %s' % (
+                mode, ', '.join(MODES)))
+        self.mode = mode
+        self.started = None
+        self.stopped = None
+        if mode == 'cprofile':
+            self._profiler = cProfile.Profile()
+        else:
+            self._profiler = StackSampler(interval)
+
+    @property
+    def extension(self):
+        '''The conventional file extension for this mode's dumps.'''
+        return '.pstats' if self.mode == 'cprofile' else '.folded'
+
+    def start(self):
+        '''Start profiling.'''
+        self.started = time.time()
+        if self.mode == 'cprofile':
+            self._profiler.enable()
+        else:
+            self._profiler.start()
+
+    def stop(self, path):
+        '''Stop profiling and write the results to a new, private file.
+
+        cProfile results may be read with :mod:`pstats`. If writing fails,
+        the results are kept, so this may be called again with another
+        path.
+
+        :param path: the file to create
+        :returns: the number of seconds spent profiling
+        '''
+        if self.stopped is None:
+            if self.mode == 'cprofile':
+                self._profiler.disable()
+                self._profiler.create_stats()
+            else:
+                self._profiler.stop()
+            self.stopped = time.time()
+        with open_private(path) as fp:
+            if self.mode == 'cprofile':
+                marshal.dump(self._profiler.stats, fp)
+            else:
+                self._profiler.dump(fp)
+        return self.stopped - self.started
+
+
+def profileable(main):
+    '''Decorate a CLI ``main(args)`` to support ``--profile FILE``.
+
+    The whole of ``main`` is run under cProfile and the results written to
+    FILE. The option is removed before ``main`` sees its arguments, though
+    ``main`` should still declare it so that it appears in ``--help``.
+    '''
+    @functools.wraps(main)
+    def wrapper(args):
+        args = list(args)
+        path = None
+        for i, arg in enumerate(args):
+            if arg == '--profile' and i + 1 < len(args):
+                path = args[i + 1]
+                del args[i:i + 2]
+                break
+            if arg.startswith('--profile='):
+                path = arg.partition('=')[2]
+                del args[i]
+                break
+        if path is None:
+            return main(args)
+        profiler = Profiler('cprofile')
+        profiler.start()
+        try:
+            return main(args)
+        finally:
+            profiler.stop(path)
+    return wrapper
@@ -0,0 +1,184 @@
+'''
+Lightweight tracing: timed, nested spans sent to a pluggable sink.
+
+Tracing is disabled until a sink is set with :func:`set_sink`. While it is
+disabled, :func:`span` returns a shared no-op span, so instrumented code
+costs a function call and a global lookup.
+
+Usage::
+
+    with tracing.span('auth.reauth', auth=name) as span:
+        ...
+        span.set(status=200)
+'''
+import binascii
+import json
+import logging
+import os
+import threading
+import time
+
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(logging.NullHandler())
+
+_SINK = None
+_LOCAL = threading.local()
+
+
+def _new_id():
+    return binascii.hexlify(os.urandom(8)).decode('ascii')
+
+
+class Span(object):
+    '''A timed operation, possibly within another.
+
+    :param name: what is being timed, such as ``http.connect``
+    :param parent: the enclosing Span, or None to start a new trace
+    :param attrs: extra information about the operation
+    '''
+    def __init__(self, name, parent=None, **attrs):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else _new_id()
+        self.span_id = _new_id()
+        self.attrs = attrs
+        self.start = None
+        self.end = None
+        self.error = None
+
+    @property
+    def duration(self):
+        '''How long the span took, in seconds, or None if it's unfinished.'''
+        if self.end is None:
+            return None
+        return self.end - self.start
+
+    def set(self, **attrs):
+        '''Add information about the operation.'''
+        self.attrs.update(attrs)
+
+    def to_dict(self):
+        '''Get a JSON-serializable description of the span.'''
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent.span_id if self.parent else None,
+            'start': self.start,
+            'duration': self.duration,
+            'attrs': self.attrs,
+            'error': self.error,
+        }
+
+    def __enter__(self):
+        stack = _stack()
+        stack.append(self)
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.end = time.time()
+        if exc_value is not None:
+            self.error = repr(exc_value)
+        stack = _stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        sink = _SINK
+        if sink is not None:
+            try:
+                sink(self)
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception('Error exporting span %s', self.name)
+
+
+class _NoopSpan(object):
+    '''A span that does nothing, used while tracing is disabled.'''
+    name = None
+    parent = None
+    attrs = {}
+    duration = None
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _stack():
+    try:
+        return _LOCAL.stack
+    except AttributeError:
+        _LOCAL.stack = []
+        return _LOCAL.stack
+
+
+def enabled():
+    '''Check whether tracing is enabled.'''
+    return _SINK is not None
+
+
+def current():
+    '''Get this thread's innermost active span, or None.
+
+    Pass the result as ``parent`` when starting spans in other threads.
+    '''
+    if _SINK is None:
+        return None
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+def span(name, parent=None, **attrs):
+    '''Start a span, to be used as a context manager.
+
+    :param name: what is being timed
+    :param parent: the enclosing span; by default, this thread's current
+                   span
+    :param attrs: extra information about the operation
+    '''
+    if _SINK is None:
+        return NOOP_SPAN
+    if parent is None:
+        stack = _stack()
+        parent = stack[-1] if stack else None
+    return Span(name, parent, **attrs)
+
+
+def set_sink(sink):
+    '''Send finished spans to a sink, enabling tracing.
+
+    :param sink: a callable taking a finished Span, or None to disable
+                 tracing
+    '''
+    global _SINK  # pylint: disable=global-statement
+    _SINK = sink
+
+
+class JsonLinesExporter(object):
+    '''A sink that appends each finished span to a file as a JSON line.
+
+    :param path: the file to append to
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fp = open(path, 'a')
+
+    def __call__(self, finished):
+        line = json.dumps(finished.to_dict(), sort_keys=True, default=repr)
+        with self._lock:
+            self._fp.write(line + '\n')
+            self._fp.flush()
+
+    def close(self):
+        '''Close the file.'''
+        with self._lock:
+            self._fp.close()
@@ -0,0 +1,147 @@
+'''
+Watch config files for changes.
+
+On Linux, inotify is used (through ctypes), so checking for changes costs
+a single non-blocking read. Elsewhere, or if inotify isn't available,
+changes are reported at most once per polling interval, and the caller is
+expected to stat the files itself.
+'''
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import struct
+import time
+
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(logging.NullHandler())
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# Editors commonly write a new file and rename it into place, so watch
+# directories rather than the files themselves
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+# Events for the watched directory itself, rather than a file in it
+DIR_EVENTS = IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED
+EVENT = struct.Struct('iIII')
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        return libc if hasattr(libc, 'inotify_init1') else None
+    except (OSError, TypeError):
+        return None
+
+
+class ConfigWatcher(object):
+    '''Report whether any of some files may have changed.
+
+    :param paths: the files to watch; relative paths are resolved now
+    :param poll_interval: if inotify isn't available, the minimum number
+                          of seconds between reporting possible changes
+    '''
+    def __init__(self, paths, poll_interval=1):
+        self.paths = [os.path.abspath(p) for p in paths]
+        self.poll_interval = poll_interval
+        self._last_poll = time.time()
+        self._fd = None
+        self._names = {}
+        self._start_inotify()
+
+    @property
+    def using_inotify(self):
+        '''Whether changes are being detected with inotify.'''
+        return self._fd is not None
+
+    def _start_inotify(self):
+        libc = _load_libc()
+        if libc is None:
+            LOGGER.debug('inotify unavailable; polling for config changes')
+            return
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            LOGGER.debug('inotify_init1 failed: %s',
+                         os.strerror(ctypes.get_errno()))
+            return
+        for path in self.paths:
+            directory, name = os.path.split(path)
+            wd = libc.inotify_add_watch(
+                fd, directory.encode('utf-8'), WATCH_MASK)
+            if wd < 0:
+                # Most likely the directory doesn't exist; we wouldn't
+                # notice it being created, so fall back to polling
+                LOGGER.debug('Could not watch %s (%s); polling for config '
+                             'changes', directory,
+                             os.strerror(ctypes.get_errno()))
+                os.close(fd)
+                self._names = {}
+                return
+            self._names.setdefault(wd, set()).add(name.encode('utf-8'))
+        self._fd = fd
+
+    def close(self):
+        '''Stop watching.'''
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def changed(self):
+        '''Check whether any of the files may have changed.
+
+        With inotify, this is True only if there have been events for the
+        files since the last call. Otherwise, it's True if at least
+        ``poll_interval`` seconds have passed since it last was.
+        '''
+        if self._fd is None:
+            now = time.time()
+            if now - self._last_poll < self.poll_interval:
+                return False
+            self._last_poll = now
+            return True
+
+        changed = False
+        while True:
+            try:
+                buf = os.read(self._fd, 64 * 1024)
+            except OSError as exc:
+                if exc.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return changed
+                raise
+            changed = self._parse_events(buf) or changed
+            if self._fd is None:
+                # Gave up on inotify; polling takes over from here
+                return changed
+
+    def _parse_events(self, buf):
+        changed = False
+        offset = 0
+        while offset < len(buf):
+            wd, mask, dummy, name_len = EVENT.unpack_from(buf, offset)
+            offset += EVENT.size
+            name = buf[offset:offset + name_len].rstrip(b'\0')
+            offset += name_len
+            if mask & (IN_Q_OVERFLOW | DIR_EVENTS):
+                # Either we lost events, or a directory went away and
+                # we can't rely on the watch any more
+                LOGGER.debug('Config directory changed; falling back to '
+                             'polling')
+                self.close()
+                return True
+            if name in self._names.get(wd, ()):
+                changed = True
+        return changed